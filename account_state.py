@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""
+account_state.py - Account State Cache Module
+
+This module keeps an in-memory copy of the account (balance, open positions, open trades) so the trading
+loop and the dashboard can read it without a REST round trip. The cache is loaded once with AccountDetails
+and then kept current by polling AccountChanges with the last seen transaction ID, which returns only what
+changed since then (opened, reduced and closed trades, changed positions, new transactions) plus the
+current unrealized profit and loss.
+
+risk_manager.get_current_balance and risk_manager.get_open_positions read from the cache once it has been
+registered with risk_manager.use_account_state, and risk_manager refreshes it right after its own orders and
+closes so the next read reflects them.
+"""
+
+import copy
+import threading
+import time
+from oandapyV20.endpoints.accounts import AccountDetails, AccountChanges
+from oandapyV20.exceptions import V20Error
+
+
+def is_open(position):
+    """
+    True if a position (in the OANDA Position layout) has units on either side.
+    """
+    return any(float(position.get(side, {}).get("units", 0)) != 0 for side in ("long", "short"))
+
+
+class AccountState:
+    def __init__(self, client, account_id, poll_interval=5):
+        """
+        Parameters:
+          client: An oandapyV20 API client (or any object with the same request method).
+          account_id: The OANDA account ID.
+          poll_interval: Seconds between AccountChanges polls in the background thread.
+        """
+        self.client = client
+        self.account_id = account_id
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()  # one AccountChanges request at a time
+        self.ready = False
+        self.balance = None
+        self.nav = None
+        self.unrealized_pl = None
+        self.last_transaction_id = None
+        self.positions = {}  # {instrument: position}, including flat positions
+        self.trades = {}  # {trade ID: trade summary}
+        self.last_update = None
+        self.running = False
+        self.thread = None
+
+    def bootstrap(self):
+        """
+        Load the full account state with AccountDetails.
+        """
+        response = self.client.request(AccountDetails(accountID=self.account_id))
+        account = response["account"]
+        with self.lock:
+            self.balance = float(account["balance"])
+            self.nav = float(account.get("NAV", account["balance"]))
+            self.unrealized_pl = float(account.get("unrealizedPL", 0))
+            self.positions = {pos["instrument"]: pos for pos in account.get("positions", [])}
+            self.trades = {trade["id"]: trade for trade in account.get("trades", [])}
+            self.last_transaction_id = response.get("lastTransactionID", account.get("lastTransactionID"))
+            self.last_update = time.time()
+            self.ready = True
+
+    def refresh(self):
+        """
+        Apply the account changes since the last seen transaction (or bootstrap if not loaded yet).
+
+        Returns:
+          True if the cache is up to date, False if the update failed (the previous state is kept).
+        """
+        with self.refresh_lock:
+            try:
+                if not self.ready:
+                    self.bootstrap()
+                    return True
+                params = {"sinceTransactionID": self.last_transaction_id}
+                response = self.client.request(AccountChanges(accountID=self.account_id, params=params))
+                self.apply_changes(response)
+                return True
+            except V20Error as e:
+                # E.g. the transaction ID is no longer available; reload everything on the next refresh
+                print(f"Error updating account state: {e}")
+                self.ready = False
+            except Exception as e:
+                print(f"Error updating account state: {e}")
+            return False
+
+    def apply_changes(self, response):
+        """
+        Merge an AccountChanges response into the cache.
+        """
+        changes = response.get("changes", {})
+        state = response.get("state", {})
+        with self.lock:
+            for trade in changes.get("tradesOpened", []) + changes.get("tradesReduced", []):
+                self.trades[trade["id"]] = trade
+            for trade in changes.get("tradesClosed", []):
+                self.trades.pop(trade["id"], None)
+            for position in changes.get("positions", []):
+                self.positions[position["instrument"]] = position
+
+            balances = [t["accountBalance"] for t in changes.get("transactions", []) if "accountBalance" in t]
+            if "NAV" in state:
+                self.nav = float(state["NAV"])
+            if "unrealizedPL" in state:
+                self.unrealized_pl = float(state["unrealizedPL"])
+            if balances:
+                self.balance = float(balances[-1])
+            elif "NAV" in state and "unrealizedPL" in state:
+                self.balance = self.nav - self.unrealized_pl
+
+            for trade_state in state.get("trades", []):
+                trade = self.trades.get(trade_state["id"])
+                if trade is not None:
+                    trade["unrealizedPL"] = trade_state.get("unrealizedPL", trade.get("unrealizedPL"))
+            for position_state in state.get("positions", []):
+                position = self.positions.get(position_state["instrument"])
+                if position is None:
+                    continue
+                position["unrealizedPL"] = position_state.get("netUnrealizedPL", position.get("unrealizedPL"))
+                for side in ("long", "short"):
+                    if f"{side}UnrealizedPL" in position_state and side in position:
+                        position[side]["unrealizedPL"] = position_state[f"{side}UnrealizedPL"]
+
+            self.last_transaction_id = response.get("lastTransactionID", self.last_transaction_id)
+            self.last_update = time.time()
+
+    def get_balance(self):
+        """
+        The cached account balance, or None if the cache has not been loaded.
+        """
+        with self.lock:
+            return self.balance if self.ready else None
+
+    def get_open_positions(self):
+        """
+        The cached open positions in the layout of OpenPositions()['positions'], or None if not loaded.
+        """
+        with self.lock:
+            if not self.ready:
+                return None
+            return [copy.deepcopy(pos) for pos in self.positions.values() if is_open(pos)]
+
+    def get_open_trades(self):
+        """
+        The cached open trades, most recent first like OpenTrades()['trades'], or None if not loaded.
+        """
+        with self.lock:
+            if not self.ready:
+                return None
+            return [copy.deepcopy(trade) for trade in reversed(list(self.trades.values()))]
+
+    def run(self):
+        while self.running:
+            time.sleep(self.poll_interval)
+            if self.running:
+                self.refresh()
+
+    def start(self):
+        """
+        Load the account state and keep it current from a background thread.
+        """
+        self.refresh()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
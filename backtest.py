@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+"""
+backtest.py - Vectorized Backtest Module
+
+This module backtests the live strategy on historical closes with NumPy/pandas instead of replaying the
+trading loop bar by bar. It reuses the live decision code so live and backtest logic cannot drift apart:
+  - Signals come from strategy.signal_masks, the same BUY/SELL/HOLD rules LiveStrategy applies, on
+    indicators computed exactly as LiveStrategy computes them over a 'lookback_count' window
+    (the short EMA is anchored at the start of that window, not at the start of the history).
+  - Order sizing, take-profit and stop-loss levels come from risk_manager.compute_order_params, the
+    calculation behind get_quantities.
+
+Trading model (mirrors the position cycle in main.py):
+  - While flat, the first bar with at least one BUY signal opens long positions in every BUY instrument,
+    sized by RSI weight from the current balance, at that bar's close.
+  - Each position is closed independently at the first later bar where the close reaches the take-profit
+    (filled at the take-profit price), falls to the stop-loss (filled at the close) or the signal is SELL
+    (filled at the close).
+  - Once all positions are closed the portfolio is flat again. SELL entries are not simulated, because in
+    main.py a position opened on a SELL signal is closed by that same signal in the same loop.
+P&L of pairs not quoted in USD is converted to USD at the exit bar: USD_XXX pairs at the exit price, and
+crosses (e.g. EUR_GBP) at the close of their quote currency's USD pair (GBP_USD or USD_GBP), which must be
+among the backtested instruments.
+
+The result contains the same metrics as 'final_train_metrics' / 'final_test_metrics' in tuning_results.json.
+"""
+
+import time
+import numpy as np
+import pandas as pd
+from strategy import signal_masks
+from risk_manager import compute_order_params
+
+# Candle length in seconds, used when no bar times are given
+GRANULARITY_SECONDS = {"S5": 5, "S10": 10, "S15": 15, "S30": 30, "M1": 60, "M5": 300, "M15": 900,
+                       "M30": 1800, "H1": 3600, "H4": 14400, "D": 86400}
+
+
+def compute_indicator_series(closes, indicator, period, lookback_count):
+    """
+    Compute one indicator at every bar of one instrument's close history.
+    At bar t the value equals what LiveStrategy computes from the 'lookback_count' closes ending at t.
+
+    Parameters:
+      closes: 1-D array of closes, oldest first.
+      indicator: "sma", "ema" or "rsi".
+      period: The indicator period.
+      lookback_count: Size of the live lookback window (only used by the EMA).
+
+    Returns:
+      A 1-D array of indicator values.
+    """
+    price_series = pd.Series(closes, dtype=float)
+    if indicator == "sma":
+        return price_series.rolling(window=period).mean().to_numpy()
+
+    if indicator == "ema":
+        # EMA anchored at the first close of the lookback window:
+        # ema_t = full_ema_t - (1 - alpha)^(L - 1) * (full_ema_s - close_s), with s = t - L + 1
+        full_ema = price_series.ewm(span=period, adjust=False).mean().to_numpy()
+        short_ema = full_ema.copy()
+        if len(closes) > lookback_count:
+            com = (period - 1) / 2.0
+            decay = 1.0 - 1.0 / (1.0 + com)
+            anchor = full_ema[1:-lookback_count + 1] - price_series.to_numpy()[1:-lookback_count + 1]
+            short_ema[lookback_count:] -= decay ** (lookback_count - 1) * anchor
+        return short_ema
+
+    if indicator == "rsi":
+        delta = price_series.diff()
+        avg_gain = delta.clip(lower=0).rolling(window=period, min_periods=period).mean().to_numpy()
+        avg_loss = (-delta.clip(upper=0)).rolling(window=period, min_periods=period).mean().to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(avg_loss == 0, 100.0, 100 - (100 / (1 + avg_gain / avg_loss)))
+
+    raise ValueError(f"Unknown indicator: {indicator}")
+
+
+def compute_signal_series(closes, stma_period, ltma_period, rsi_period, lookback_count, cache=None,
+                          cache_key=None):
+    """
+    Compute the strategy signals at every bar of one instrument's close history.
+
+    Parameters:
+      closes: 1-D array of closes, oldest first.
+      cache: Optional IndicatorCache shared between calls on the same data.
+      cache_key: (instrument, data range) identifying 'closes' in the cache; required to use the cache.
+
+    Returns:
+      A tuple (buy, sell, rsi) of 1-D arrays.
+    """
+    def indicator(name, period):
+        if cache is None or cache_key is None:
+            return compute_indicator_series(closes, name, period, lookback_count)
+        key = cache_key + (name if name != "ema" else f"ema{lookback_count}", period)
+        return cache.get_or_compute(key, lambda: compute_indicator_series(closes, name, period, lookback_count))
+
+    short_sma = indicator("sma", stma_period)
+    long_sma = indicator("sma", ltma_period)
+    short_ema = indicator("ema", stma_period)
+    rsi = indicator("rsi", rsi_period)
+    buy, sell = signal_masks(short_sma, long_sma, short_ema, rsi, np.asarray(closes, dtype=float))
+    return buy, sell, rsi
+
+
+def next_true_index(mask):
+    """
+    For every position i, the index of the first True value at or after i (len(mask) if there is none).
+    """
+    n = len(mask)
+    index = np.where(mask, np.arange(n, dtype=np.int64), n)
+    return np.minimum.accumulate(index[::-1])[::-1]
+
+
+def compute_metrics(equity, times, initial_balance, risk_free_rate=0.02, periods_per_year=260):
+    """
+    Compute the performance metrics reported in tuning_results.json from a bar-level equity curve.
+    Returns are measured on the last equity value of each calendar day.
+
+    Parameters:
+      equity: 1-D array of account equity per bar.
+      times: 1-D array of bar times as Unix seconds.
+      initial_balance: Starting balance.
+      risk_free_rate: Annual risk-free rate.
+      periods_per_year: Number of trading days per year.
+
+    Returns:
+      A dictionary with Sharpe Ratio, Annualized Return, Annualized Volatility, Final Accumulated Profit,
+      Maximum Drawdown, Calmar Ratio and Sortino Ratio.
+    """
+    daily_equity = pd.Series(equity, index=pd.to_datetime(times, unit='s')).resample('D').last().dropna()
+    daily_equity = pd.concat([pd.Series([initial_balance]), daily_equity.reset_index(drop=True)])
+    returns = daily_equity.pct_change().dropna().to_numpy()
+
+    annualized_return = returns.mean() * periods_per_year if len(returns) else 0.0
+    annualized_volatility = returns.std(ddof=1) * np.sqrt(periods_per_year) if len(returns) > 1 else 0.0
+    downside = np.minimum(returns, 0)
+    downside_volatility = np.sqrt(np.mean(downside ** 2)) * np.sqrt(periods_per_year) if len(returns) else 0.0
+
+    running_peak = np.maximum.accumulate(equity)
+    max_drawdown = float(np.min(equity / running_peak - 1)) if len(equity) else 0.0
+
+    excess_return = annualized_return - risk_free_rate
+    return {
+        'Sharpe Ratio': float(excess_return / annualized_volatility) if annualized_volatility > 0 else 0.0,
+        'Annualized Return': float(annualized_return),
+        'Annualized Volatility': float(annualized_volatility),
+        'Final Accumulated Profit': float(equity[-1] - initial_balance) if len(equity) else 0.0,
+        'Maximum Drawdown': max_drawdown,
+        'Calmar Ratio': float(annualized_return / abs(max_drawdown)) if max_drawdown != 0 else np.nan,
+        'Sortino Ratio': float(excess_return / downside_volatility) if downside_volatility > 0 else np.nan,
+    }
+
+
+class VectorizedBacktester:
+    def __init__(self, instruments, lookback_count=200, stma_period=30, ltma_period=40, rsi_period=10,
+                 rsi_weight_param=1, take_profit_percentage=0.01, stop_loss_percentage=0.005,
+                 initial_balance=100000, granularity='S5', risk_free_rate=0.02, periods_per_year=260):
+        """
+        Initialize backtest parameters. Strategy parameters have the same meaning as in LiveStrategy and
+        risk_manager.get_quantities; percentages are fractions (0.005 = 0.5%).
+        """
+        self.instruments = list(instruments)
+        self.lookback_count = lookback_count
+        self.stma_period = stma_period
+        self.ltma_period = ltma_period
+        self.rsi_period = rsi_period
+        self.rsi_weight_param = rsi_weight_param
+        self.take_profit_percentage = take_profit_percentage
+        self.stop_loss_percentage = stop_loss_percentage
+        self.initial_balance = initial_balance
+        self.granularity = granularity
+        self.risk_free_rate = risk_free_rate
+        self.periods_per_year = periods_per_year
+
+    def compute_signals(self, close_matrix, cache=None, data_key=None):
+        """
+        Compute BUY/SELL masks and RSI for every instrument and bar.
+
+        Parameters:
+          close_matrix: A (instruments x bars) array of aligned closes.
+          cache: Optional IndicatorCache reused across parameter combinations.
+          data_key: Identifier of the data range of close_matrix (e.g. ("train", 0, 100000)); indicators are
+                    only cached when it is given.
+
+        Returns:
+          A tuple (buy, sell, rsi) of (instruments x bars) arrays.
+        """
+        n_inst, n_bars = close_matrix.shape
+        buy = np.zeros((n_inst, n_bars), dtype=bool)
+        sell = np.zeros((n_inst, n_bars), dtype=bool)
+        rsi = np.empty((n_inst, n_bars))
+        for row in range(n_inst):
+            cache_key = (self.instruments[row], data_key) if data_key is not None else None
+            buy[row], sell[row], rsi[row] = compute_signal_series(
+                close_matrix[row], self.stma_period, self.ltma_period, self.rsi_period, self.lookback_count,
+                cache=cache, cache_key=cache_key)
+        return buy, sell, rsi
+
+    def find_exit(self, closes, next_sell, entry, take_profit, stop_loss):
+        """
+        Find the exit bar and fill price of a long position opened at bar 'entry'.
+        """
+        n_bars = len(closes)
+        limit = next_sell[entry + 1] if entry + 1 < n_bars else n_bars
+        last = min(limit, n_bars - 1)
+        window = closes[entry + 1:last + 1]
+        hits = (window >= take_profit) | (window <= stop_loss)
+        first = hits.argmax() if len(hits) else 0
+        if len(hits) and hits[first]:
+            exit_bar = entry + 1 + int(first)
+            if closes[exit_bar] >= take_profit:
+                return exit_bar, take_profit, "TP"
+            return exit_bar, closes[exit_bar].item(), "SL"
+        if limit < n_bars:
+            return limit, closes[limit].item(), "SELL"
+        return last, closes[last].item(), "END"
+
+    def run(self, close_matrix, times=None, cache=None, data_key=None):
+        """
+        Run the backtest.
+
+        Parameters:
+          close_matrix: A (instruments x bars) array of aligned closes, rows in the order of self.instruments.
+          times: Optional 1-D array of bar times as Unix seconds (defaults to evenly spaced bars of
+                 the configured granularity).
+          cache, data_key: Optional indicator cache and data range identifier (see compute_signals).
+
+        Returns:
+          A dictionary with 'metrics', 'equity' (per bar) and 'trades' (list of trade dictionaries).
+        """
+        closes = np.asarray(close_matrix, dtype=float)
+        n_inst, n_bars = closes.shape
+        if times is None:
+            times = np.arange(n_bars) * GRANULARITY_SECONDS.get(self.granularity, 5)
+        times = np.asarray(times, dtype=float)
+        usd_rates = self.quote_usd_rates(closes)
+
+        buy, sell, rsi = self.compute_signals(closes, cache=cache, data_key=data_key)
+        next_buy = next_true_index(buy.any(axis=0))
+        next_sell = [next_true_index(sell[row]) for row in range(n_inst)]
+
+        balance = self.initial_balance
+        trades = []
+        t = 0
+        while t < n_bars:
+            t = int(next_buy[t])
+            if t >= n_bars:
+                break
+            rows = np.flatnonzero(buy[:, t]).tolist()
+            insts = [self.instruments[row] for row in rows]
+            entry_prices = closes[rows, t].tolist()
+            order_params = compute_order_params(
+                insts, {inst: "BUY" for inst in insts}, dict(zip(insts, rsi[rows, t].tolist())),
+                dict(zip(insts, entry_prices)), balance,
+                rsi_weight_param=self.rsi_weight_param, take_profit_percentage=self.take_profit_percentage,
+                stop_loss_percentage=self.stop_loss_percentage, verbose=False)
+
+            cycle_end = t
+            cycle_pnl = 0.0
+            for inst, row, entry_price in zip(insts, rows, entry_prices):
+                stop_loss, take_profit, units = order_params[inst]
+                if units == 0:
+                    continue
+                exit_bar, exit_price, reason = self.find_exit(closes[row], next_sell[row], t,
+                                                              take_profit, stop_loss)
+                pnl = units * (exit_price - entry_price)
+                if self.instruments[row].startswith("USD_"):
+                    # The quote currency's USD rate is the fill price itself
+                    pnl /= exit_price
+                else:
+                    pnl *= usd_rates[row, exit_bar]
+                trades.append({"instrument": inst, "row": row, "entry_bar": t, "exit_bar": exit_bar,
+                               "units": units, "entry_price": entry_price, "exit_price": exit_price,
+                               "reason": reason, "pnl": pnl})
+                cycle_pnl += pnl
+                cycle_end = max(cycle_end, exit_bar)
+            balance += cycle_pnl
+            t = cycle_end + 1
+
+        equity = self.equity_curve(closes, trades, usd_rates)
+        metrics = compute_metrics(equity, times, self.initial_balance, self.risk_free_rate, self.periods_per_year)
+        return {"metrics": metrics, "equity": equity, "trades": trades}
+
+    def quote_usd_rates(self, closes):
+        """
+        USD value of one unit of each instrument's quote currency at every bar, taken from the instruments
+        being backtested: 1 for XXX_USD, 1 / close for USD_XXX, and for a cross such as EUR_GBP the close of
+        GBP_USD (or 1 / close of USD_GBP).
+
+        Parameters:
+          closes: A (instruments x bars) array of aligned closes, rows in the order of self.instruments.
+
+        Returns:
+          An (instruments x bars) array of conversion rates.
+
+        Raises:
+          ValueError: If a cross is backtested without a USD pair of its quote currency.
+        """
+        rows = {inst: row for row, inst in enumerate(self.instruments)}
+        rates = np.ones(closes.shape)
+        missing = []
+        for row, inst in enumerate(self.instruments):
+            quote = inst.split("_")[-1]
+            if quote == "USD":
+                continue
+            if f"{quote}_USD" in rows:
+                rates[row] = closes[rows[f"{quote}_USD"]]
+            elif f"USD_{quote}" in rows:
+                rates[row] = 1.0 / closes[rows[f"USD_{quote}"]]
+            else:
+                missing.append(f"{inst} (add {quote}_USD or USD_{quote})")
+        if missing:
+            raise ValueError("Cannot convert the P&L of these instruments to USD: " + ", ".join(missing))
+        return rates
+
+    def equity_curve(self, closes, trades, usd_rates):
+        """
+        Mark-to-market equity per bar: realized P&L from closed trades plus unrealized P&L of open ones,
+        converted to USD with usd_rates (see quote_usd_rates).
+        """
+        n_inst, n_bars = closes.shape
+        realized = np.zeros(n_bars + 1)
+        units = np.zeros((n_inst, n_bars + 1))
+        cost = np.zeros((n_inst, n_bars + 1))
+        for trade in trades:
+            realized[trade["exit_bar"]] += trade["pnl"]
+            row, entry, exit_bar = trade["row"], trade["entry_bar"], trade["exit_bar"]
+            units[row, entry] += trade["units"]
+            units[row, exit_bar] -= trade["units"]
+            cost[row, entry] += trade["units"] * trade["entry_price"]
+            cost[row, exit_bar] -= trade["units"] * trade["entry_price"]
+        open_units = np.cumsum(units[:, :-1], axis=1)
+        open_cost = np.cumsum(cost[:, :-1], axis=1)
+        unrealized = (open_units * closes - open_cost) * usd_rates
+        return self.initial_balance + np.cumsum(realized[:-1]) + unrealized.sum(axis=0)
+
+
+def generate_random_walk(instruments, n_bars, seed=0, volatility=0.00005):
+    """
+    Synthetic aligned closes for testing, rounded to 5 significant decimals like OANDA mid prices.
+    """
+    base_prices = {"EUR_USD": 1.08, "GBP_USD": 1.27, "USD_JPY": 150.0, "AUD_USD": 0.66, "USD_CAD": 1.36}
+    rng = np.random.default_rng(seed)
+    closes = np.empty((len(instruments), n_bars))
+    for row, inst in enumerate(instruments):
+        base = base_prices.get(inst, 1.0)
+        decimals = 3 if base > 10 else 5
+        closes[row] = np.round(base * np.exp(np.cumsum(rng.normal(0, volatility, n_bars))), decimals)
+    return closes
+
+
+# Test section
+if __name__ == "__main__":
+    instruments = ['EUR_USD', 'GBP_USD', 'USD_JPY', 'AUD_USD', 'USD_CAD']
+    n_bars = 260 * 24 * 60 * 12  # one year of S5 bars
+    closes = generate_random_walk(instruments, n_bars)
+
+    backtester = VectorizedBacktester(instruments, stma_period=30, ltma_period=40, rsi_period=10)
+    start = time.time()
+    result = backtester.run(closes)
+    print(f"Backtested {n_bars} bars x {len(instruments)} instruments in {time.time() - start:.2f} s, "
+          f"{len(result['trades'])} trades")
+    for key, value in result["metrics"].items():
+        print(f"{key:25s}: {value}")
@@ -0,0 +1,606 @@
+#!/usr/bin/env python
+"""
+broker_sim.py - Local OANDA Broker Simulator Module
+
+This module provides SimulatedBroker, an in-process stand-in for oandapyV20.API that keeps account state
+(balance, trades, positions, transactions) and fills orders against replayed prices. It answers the
+endpoints used by this project:
+  - InstrumentsCandles, PricingInfo
+  - AccountDetails, AccountChanges, AccountInstruments, OpenPositions, OpenTrades
+  - OrderCreate (MARKET orders with takeProfitOnFill / stopLossOnFill), PositionClose, TradeClose
+The account side (everything but candles, instrument metadata and the replay) lives in SimulatedAccount,
+which other price sources build on (see execution.PaperBroker for live prices).
+Responses follow the OANDA v20 JSON layout, and failures raise V20Error like the real client, so the broker
+can replace the client of any module (see attach) to load-test or benchmark the trading loop offline.
+
+Prices are replayed bar by bar from an aligned (instruments x bars) close matrix, e.g. from
+candle_store.load_close_matrix or backtest.generate_random_walk. The replay moves forward on advance(), or
+with the wall clock when bar_interval is set; take profit and stop loss orders are checked on every bar.
+A configurable latency (plus random jitter) is added to every request.
+"""
+
+import random
+import threading
+import time
+from collections import Counter
+import numpy as np
+import oandapyV20.endpoints.accounts as accounts
+import oandapyV20.endpoints.instruments as instruments_endpoints
+import oandapyV20.endpoints.orders as orders
+import oandapyV20.endpoints.positions as positions
+import oandapyV20.endpoints.pricing as pricing
+import oandapyV20.endpoints.trades as trades
+from oandapyV20.exceptions import V20Error
+from price_stream import parse_time, format_time
+
+HOME_CURRENCY = "USD"
+
+
+class SimulatedAccount:
+    """
+    The account side of the simulator: balance, trades, positions and transactions, and the account and
+    order endpoints. Subclasses supply the prices by implementing now() (Unix time of the current prices),
+    has_price(instrument), mid(instrument) and quote(instrument) -> (bid, ask), and can override
+    _sync_clock to update them before each request.
+    """
+
+    def __init__(self, initial_balance=100000, latency=0.0, latency_jitter=0.0, account_id="SIM-001", seed=None):
+        """
+        Parameters:
+          initial_balance: Starting account balance in USD.
+          latency: Seconds added to every request.
+          latency_jitter: Maximum extra random latency in seconds.
+          account_id: Account ID reported in responses (requests for any account ID are accepted).
+          seed: Optional random seed for the latency jitter.
+        """
+        self.decimals = {}  # {instrument: price decimals}, filled by the subclass
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.account_id = account_id
+        self.random = random.Random(seed)
+
+        self.lock = threading.RLock()
+        self.balance = float(initial_balance)
+        self.realized_pl = 0.0
+        self.trades = {}  # {trade ID: trade state}, in opening order
+        self.transactions = []
+        self.last_transaction_id = 0
+        self.request_counts = Counter()
+
+        self.handlers = {
+            pricing.PricingInfo: self._pricing,
+            accounts.AccountDetails: self._account_details,
+            accounts.AccountChanges: self._account_changes,
+            positions.OpenPositions: self._open_positions,
+            trades.OpenTrades: self._open_trades,
+            orders.OrderCreate: self._order_create,
+            positions.PositionClose: self._position_close,
+            trades.TradeClose: self._trade_close,
+        }
+
+    def attach(self, *targets):
+        """
+        Replace the 'client' attribute of modules or objects (e.g. risk_manager, a LiveStrategy) with this broker.
+        """
+        for target in targets:
+            target.client = self
+
+    # ------------------------------------------------------------------ #
+    # Request dispatch
+
+    def request(self, endpoint):
+        """
+        Same contract as oandapyV20.API.request: handle the endpoint, store the response on it and return it.
+        Raises V20Error for invalid requests.
+        """
+        handler = self.handlers.get(type(endpoint))
+        self.request_counts[type(endpoint).__name__] += 1
+        delay = self.latency + (self.random.uniform(0, self.latency_jitter) if self.latency_jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+        if handler is None:
+            raise V20Error(404, f"{type(endpoint).__name__} is not supported by the broker simulator")
+        with self.lock:
+            self._sync_clock()
+            response = handler(endpoint, str(endpoint).split("/"), getattr(endpoint, "params", None) or {},
+                               getattr(endpoint, "data", None) or {})
+        endpoint.response = response
+        endpoint.status_code = endpoint.expected_status
+        return response
+
+    def _sync_clock(self):
+        # Run before every request, with the lock held: bring prices up to date (nothing to do by default)
+        pass
+
+    # ------------------------------------------------------------------ #
+    # Prices and triggers
+
+    def _to_home(self, instrument, amount):
+        # Convert an amount in the quote currency of the instrument to the account currency
+        base, quote = instrument.split("_")
+        if quote == HOME_CURRENCY:
+            return amount
+        if base == HOME_CURRENCY:
+            return amount / self.mid(instrument)
+        for pair, invert in ((f"{quote}_{HOME_CURRENCY}", False), (f"{HOME_CURRENCY}_{quote}", True)):
+            if self.has_price(pair):
+                rate = self.mid(pair)
+                return amount / rate if invert else amount * rate
+        return amount
+
+    def _unrealized_pl(self, trade):
+        bid, ask = self.quote(trade["instrument"])
+        exit_price = bid if trade["units"] > 0 else ask
+        return self._to_home(trade["instrument"], trade["units"] * (exit_price - trade["price"]))
+
+    def _check_triggers(self, instrument=None):
+        for trade in list(self.trades.values()):
+            if instrument is not None and trade["instrument"] != instrument:
+                continue
+            bid, ask = self.quote(trade["instrument"])
+            long = trade["units"] > 0
+            price = bid if long else ask
+            tp, sl = trade["take_profit"], trade["stop_loss"]
+            if tp is not None and (price >= tp if long else price <= tp):
+                self._close_trade(trade, -trade["units"], price, "TAKE_PROFIT_ORDER")
+            elif sl is not None and (price <= sl if long else price >= sl):
+                self._close_trade(trade, -trade["units"], price, "STOP_LOSS_ORDER")
+
+    # ------------------------------------------------------------------ #
+    # Account state
+
+    def _transaction(self, **fields):
+        self.last_transaction_id += 1
+        transaction = dict(fields, id=str(self.last_transaction_id), accountID=self.account_id,
+                           time=format_time(self.now()))
+        self.transactions.append(transaction)
+        return transaction
+
+    def _related_ids(self, first_id):
+        # Transaction IDs are consecutive and start at 1
+        return [t["id"] for t in self.transactions[first_id - 1:]]
+
+    def _close_trade(self, trade, units, price, reason):
+        """
+        Close 'units' (opposite sign to the trade) of a trade at the given price.
+
+        Returns:
+          The ORDER_FILL transaction.
+        """
+        pl = self._to_home(trade["instrument"], -units * (price - trade["price"]))
+        self.balance += pl
+        self.realized_pl += pl
+        trade["units"] += units
+        trade["realized_pl"] += pl
+        detail = {"tradeID": trade["id"], "units": str(units), "price": str(price), "realizedPL": f"{pl:.4f}"}
+        fill = {"type": "ORDER_FILL", "instrument": trade["instrument"], "units": str(units), "price": str(price),
+                "reason": reason, "pl": f"{pl:.4f}", "accountBalance": f"{self.balance:.4f}"}
+        if trade["units"] == 0:
+            del self.trades[trade["id"]]
+            fill["tradesClosed"] = [detail]
+        else:
+            fill["tradeReduced"] = detail
+        return self._transaction(**fill)
+
+    def _trade_state(self, trade):
+        state = {
+            "id": trade["id"],
+            "instrument": trade["instrument"],
+            "price": str(trade["price"]),
+            "openTime": trade["open_time"],
+            "state": "OPEN",
+            "initialUnits": str(trade["initial_units"]),
+            "currentUnits": str(trade["units"]),
+            "realizedPL": f"{trade['realized_pl']:.4f}",
+            "unrealizedPL": f"{self._unrealized_pl(trade):.4f}",
+        }
+        if trade["take_profit"] is not None:
+            state["takeProfitOrder"] = {"type": "TAKE_PROFIT", "tradeID": trade["id"],
+                                        "price": str(trade["take_profit"]), "state": "PENDING"}
+        if trade["stop_loss"] is not None:
+            state["stopLossOrder"] = {"type": "STOP_LOSS", "tradeID": trade["id"],
+                                      "price": str(trade["stop_loss"]), "state": "PENDING"}
+        return state
+
+    def _position_state(self, instrument, open_trades):
+        sides = {}
+        total_pl = 0.0
+        for side, sign in (("long", 1), ("short", -1)):
+            side_trades = [t for t in open_trades if t["units"] * sign > 0]
+            units = sum(t["units"] for t in side_trades)
+            pl = sum(self._unrealized_pl(t) for t in side_trades)
+            total_pl += pl
+            sides[side] = {"units": str(units), "unrealizedPL": f"{pl:.4f}",
+                           "tradeIDs": [t["id"] for t in side_trades]}
+            if units:
+                average = sum(t["units"] * t["price"] for t in side_trades) / units
+                sides[side]["averagePrice"] = str(round(average, self.decimals[instrument] + 1))
+        return dict(sides, instrument=instrument, unrealizedPL=f"{total_pl:.4f}")
+
+    def summary(self):
+        """
+        Account summary in the layout of AccountDetails()['account'] (without the trade/position lists).
+        """
+        unrealized = sum(self._unrealized_pl(t) for t in self.trades.values())
+        return {
+            "id": self.account_id,
+            "currency": HOME_CURRENCY,
+            "balance": f"{self.balance:.4f}",
+            "NAV": f"{self.balance + unrealized:.4f}",
+            "unrealizedPL": f"{unrealized:.4f}",
+            "pl": f"{self.realized_pl:.4f}",
+            "openTradeCount": len(self.trades),
+            "openPositionCount": len({t["instrument"] for t in self.trades.values()}),
+            "lastTransactionID": str(self.last_transaction_id),
+        }
+
+    # ------------------------------------------------------------------ #
+    # Endpoint handlers
+
+    def _pricing(self, endpoint, path, params, data):
+        prices = []
+        for inst in params.get("instruments", "").split(","):
+            if not inst:
+                continue
+            bid, ask = self.quote(inst)
+            prices.append({"type": "PRICE", "instrument": inst, "time": format_time(self.now()),
+                           "tradeable": True, "bids": [{"price": str(bid), "liquidity": 10000000}],
+                           "asks": [{"price": str(ask), "liquidity": 10000000}],
+                           "closeoutBid": str(bid), "closeoutAsk": str(ask)})
+        return {"time": format_time(self.now()), "prices": prices}
+
+    def _account_details(self, endpoint, path, params, data):
+        account = self.summary()
+        account["trades"] = [self._trade_state(t) for t in self.trades.values()]
+        by_instrument = {}
+        for trade in self.trades.values():
+            by_instrument.setdefault(trade["instrument"], []).append(trade)
+        account["positions"] = [self._position_state(inst, ts) for inst, ts in by_instrument.items()]
+        return {"account": account, "lastTransactionID": str(self.last_transaction_id)}
+
+    def _account_changes(self, endpoint, path, params, data):
+        since = int(params.get("sinceTransactionID", 0))
+        new_transactions = self.transactions[since:]
+        opened, reduced, closed, touched = [], [], [], set()
+        for transaction in new_transactions:
+            if transaction["type"] != "ORDER_FILL":
+                continue
+            touched.add(transaction["instrument"])
+            if "tradeOpened" in transaction:
+                opened.append(transaction["tradeOpened"]["tradeID"])
+            if "tradeReduced" in transaction:
+                reduced.append(transaction["tradeReduced"]["tradeID"])
+            for detail in transaction.get("tradesClosed", []):
+                closed.append({"id": detail["tradeID"], "instrument": transaction["instrument"], "state": "CLOSED"})
+        by_instrument = {inst: [] for inst in touched}
+        for trade in self.trades.values():
+            by_instrument.setdefault(trade["instrument"], []).append(trade)
+        summary = self.summary()
+        changes = {
+            "tradesOpened": [self._trade_state(self.trades[i]) for i in opened if i in self.trades],
+            "tradesReduced": [self._trade_state(self.trades[i]) for i in reduced if i in self.trades and i not in opened],
+            "tradesClosed": closed,
+            "positions": [self._position_state(inst, by_instrument[inst]) for inst in sorted(touched)],
+            "transactions": new_transactions,
+        }
+        state = {
+            "NAV": summary["NAV"],
+            "unrealizedPL": summary["unrealizedPL"],
+            "trades": [{"id": t["id"], "unrealizedPL": f"{self._unrealized_pl(t):.4f}"} for t in self.trades.values()],
+            "positions": [],
+        }
+        for inst, inst_trades in by_instrument.items():
+            position = self._position_state(inst, inst_trades)
+            state["positions"].append({"instrument": inst, "netUnrealizedPL": position["unrealizedPL"],
+                                       "longUnrealizedPL": position["long"]["unrealizedPL"],
+                                       "shortUnrealizedPL": position["short"]["unrealizedPL"]})
+        return {"changes": changes, "state": state, "lastTransactionID": str(self.last_transaction_id)}
+
+    def _open_positions(self, endpoint, path, params, data):
+        by_instrument = {}
+        for trade in self.trades.values():
+            by_instrument.setdefault(trade["instrument"], []).append(trade)
+        return {"positions": [self._position_state(inst, ts) for inst, ts in by_instrument.items()],
+                "lastTransactionID": str(self.last_transaction_id)}
+
+    def _open_trades(self, endpoint, path, params, data):
+        # Most recent trades first, like OANDA
+        return {"trades": [self._trade_state(t) for t in reversed(list(self.trades.values()))],
+                "lastTransactionID": str(self.last_transaction_id)}
+
+    def _order_create(self, endpoint, path, params, data):
+        order = data.get("order", {})
+        instrument = order.get("instrument")
+        if order.get("type") != "MARKET":
+            raise V20Error(400, f"Order type {order.get('type')} is not supported by the broker simulator")
+        try:
+            units = int(float(order.get("units", 0)))
+        except ValueError:
+            raise V20Error(400, f"Invalid value specified for 'units': {order.get('units')}")
+        if units == 0:
+            raise V20Error(400, "Invalid value specified for 'units': 0")
+        bid, ask = self.quote(instrument)
+        price = ask if units > 0 else bid
+        take_profit = float(order["takeProfitOnFill"]["price"]) if order.get("takeProfitOnFill") else None
+        stop_loss = float(order["stopLossOnFill"]["price"]) if order.get("stopLossOnFill") else None
+
+        create = self._transaction(type="MARKET_ORDER", instrument=instrument, units=str(units),
+                                   timeInForce=order.get("timeInForce", "FOK"),
+                                   positionFill=order.get("positionFill", "DEFAULT"), reason="CLIENT_ORDER")
+        response = {"orderCreateTransaction": create}
+        direction = 1 if units > 0 else -1
+        if take_profit is not None and (take_profit - price) * direction <= 0:
+            reason = "TAKE_PROFIT_ON_FILL_LOSS"
+        elif stop_loss is not None and (price - stop_loss) * direction <= 0:
+            reason = "STOP_LOSS_ON_FILL_LOSS"
+        else:
+            reason = None
+        if reason:
+            response["orderCancelTransaction"] = self._transaction(type="ORDER_CANCEL", orderID=create["id"],
+                                                                   reason=reason)
+        else:
+            # Reduce opposite trades first (FIFO), then open a trade with the remaining units
+            fills = []
+            remaining = units
+            for trade in list(self.trades.values()):
+                if trade["instrument"] != instrument or trade["units"] * remaining >= 0:
+                    continue
+                closing = -trade["units"] if abs(trade["units"]) <= abs(remaining) else remaining
+                fills.append(self._close_trade(trade, closing, price, "MARKET_ORDER"))
+                remaining -= closing
+                if remaining == 0:
+                    break
+            fill = {"type": "ORDER_FILL", "orderID": create["id"], "instrument": instrument, "units": str(units),
+                    "price": str(price), "reason": "MARKET_ORDER",
+                    "pl": f"{sum(float(f['pl']) for f in fills):.4f}",
+                    "accountBalance": f"{self.balance:.4f}"}
+            closed = [detail for f in fills for detail in f.get("tradesClosed", [])]
+            if closed:
+                fill["tradesClosed"] = closed
+            reduced = [f["tradeReduced"] for f in fills if "tradeReduced" in f]
+            if reduced:
+                fill["tradeReduced"] = reduced[0]
+            if remaining:
+                trade_id = str(self.last_transaction_id + 1)
+                fill["tradeOpened"] = {"tradeID": trade_id, "units": str(remaining), "price": str(price)}
+            fill = self._transaction(**fill)
+            if remaining:
+                self.trades[fill["id"]] = {
+                    "id": fill["id"], "instrument": instrument, "units": remaining, "initial_units": remaining,
+                    "price": price, "open_time": fill["time"], "take_profit": take_profit,
+                    "stop_loss": stop_loss, "realized_pl": 0.0,
+                }
+            response["orderFillTransaction"] = fill
+        response["relatedTransactionIDs"] = self._related_ids(int(create["id"]))
+        response["lastTransactionID"] = str(self.last_transaction_id)
+        return response
+
+    def _position_close(self, endpoint, path, params, data):
+        instrument = path[4]
+        first_id = self.last_transaction_id + 1
+        response = {}
+        for side, sign in (("long", 1), ("short", -1)):
+            requested = data.get(f"{side}Units")
+            if requested is None or requested == "NONE":
+                continue
+            side_trades = [t for t in self.trades.values() if t["instrument"] == instrument and t["units"] * sign > 0]
+            if not side_trades:
+                raise V20Error(400, f"The Position requested to be closed out does not have a {side} side")
+            bid, ask = self.quote(instrument)
+            price = bid if sign > 0 else ask
+            available = sum(abs(t["units"]) for t in side_trades)
+            to_close = available if requested == "ALL" else min(int(float(requested)), available)
+            create = self._transaction(type="MARKET_ORDER", instrument=instrument, units=str(-sign * to_close),
+                                       reason="POSITION_CLOSEOUT")
+            closed = []
+            for trade in side_trades:
+                if to_close == 0:
+                    break
+                units = min(abs(trade["units"]), to_close)
+                to_close -= units
+                closed.append(self._close_trade(trade, -sign * units, price, "MARKET_ORDER_POSITION_CLOSEOUT"))
+            response[f"{side}OrderCreateTransaction"] = create
+            response[f"{side}OrderFillTransaction"] = closed[-1] if len(closed) == 1 else {
+                "type": "ORDER_FILL", "orderID": create["id"], "instrument": instrument, "price": str(price),
+                "tradesClosed": [d for f in closed for d in f.get("tradesClosed", [])],
+                "pl": f"{sum(float(f['pl']) for f in closed):.4f}", "accountBalance": f"{self.balance:.4f}",
+            }
+        if not response:
+            raise V20Error(400, "Neither longUnits nor shortUnits were specified")
+        response["relatedTransactionIDs"] = self._related_ids(first_id)
+        response["lastTransactionID"] = str(self.last_transaction_id)
+        return response
+
+    def _trade_close(self, endpoint, path, params, data):
+        trade = self.trades.get(path[4])
+        if trade is None:
+            raise V20Error(404, f"The Trade specified does not exist: {path[4]}")
+        requested = data.get("units", "ALL")
+        units = abs(trade["units"]) if requested == "ALL" else min(int(float(requested)), abs(trade["units"]))
+        sign = 1 if trade["units"] > 0 else -1
+        bid, ask = self.quote(trade["instrument"])
+        create = self._transaction(type="MARKET_ORDER", instrument=trade["instrument"], units=str(-sign * units),
+                                   reason="TRADE_CLOSE")
+        fill = self._close_trade(trade, -sign * units, bid if sign > 0 else ask, "MARKET_ORDER_TRADE_CLOSE")
+        return {"orderCreateTransaction": create, "orderFillTransaction": fill,
+                "relatedTransactionIDs": [create["id"], fill["id"]], "lastTransactionID": str(self.last_transaction_id)}
+
+
+class SimulatedBroker(SimulatedAccount):
+    """
+    A simulated account whose prices are replayed bar by bar from a close matrix.
+    """
+
+    def __init__(self, instruments, closes, times=None, granularity_seconds=5, start_bar=None,
+                 initial_balance=100000, spread=0.0001, latency=0.0, latency_jitter=0.0, bar_interval=None,
+                 account_id="SIM-001", seed=None):
+        """
+        Parameters:
+          instruments: Currency pairs, in the row order of closes.
+          closes: A (instruments x bars) array of aligned mid closes to replay.
+          times: 1-D array of bar start times as Unix seconds (default: consecutive bars ending now).
+          granularity_seconds: Bar length used for the default times.
+          start_bar: Index of the first current bar (default: 500, or the last bar for shorter histories),
+                     so candle requests have history to return from the start.
+          initial_balance: Starting account balance in USD.
+          spread: Relative bid/ask spread around the mid price.
+          latency: Seconds added to every request.
+          latency_jitter: Maximum extra random latency in seconds.
+          bar_interval: If set, wall-clock seconds per replayed bar; otherwise bars only move on advance().
+          account_id: Account ID reported in responses (requests for any account ID are accepted).
+          seed: Optional random seed for the latency jitter.
+        """
+        super().__init__(initial_balance=initial_balance, latency=latency, latency_jitter=latency_jitter,
+                         account_id=account_id, seed=seed)
+        self.instruments = list(instruments)
+        self.index = {inst: row for row, inst in enumerate(self.instruments)}
+        self.closes = np.asarray(closes, dtype=np.float64)
+        n_bars = self.closes.shape[1]
+        if times is None:
+            now = int(time.time() // granularity_seconds) * granularity_seconds
+            times = now - granularity_seconds * np.arange(n_bars - 1, -1, -1)
+        self.times = np.asarray(times, dtype=np.float64)
+        self.decimals = {inst: 3 if self.closes[row, 0] > 10 else 5 for inst, row in self.index.items()}
+        self.spread = spread
+        self.bar_interval = bar_interval
+        self.cursor = min(500, n_bars - 1) if start_bar is None else start_bar
+        self.clock_start = (time.time(), self.cursor)
+        self.handlers.update({
+            instruments_endpoints.InstrumentsCandles: self._candles,
+            accounts.AccountInstruments: self._account_instruments,
+        })
+
+    @classmethod
+    def from_candle_store(cls, store, instruments, granularity, start=None, end=None, **kwargs):
+        """
+        Create a broker that replays the closes stored in a CandleStore (see candle_store.py).
+        """
+        from candle_store import load_close_matrix
+        closes, times = load_close_matrix(store, instruments, granularity, start, end)
+        return cls(instruments, closes, times, **kwargs)
+
+    # ------------------------------------------------------------------ #
+    # Price replay
+
+    def advance(self, bars=1):
+        """
+        Move the replay forward and trigger take profit / stop loss orders on every bar passed.
+
+        Returns:
+          False once the end of the price history has been reached, True otherwise.
+        """
+        with self.lock:
+            target = min(self.cursor + bars, self.closes.shape[1] - 1)
+            while self.cursor < target:
+                self.cursor += 1
+                self._check_triggers()
+            return self.cursor < self.closes.shape[1] - 1
+
+    def _sync_clock(self):
+        if self.bar_interval:
+            started, start_bar = self.clock_start
+            target = start_bar + int((time.time() - started) / self.bar_interval)
+            if target > self.cursor:
+                self.advance(target - self.cursor)
+
+    def now(self):
+        return float(self.times[self.cursor])
+
+    def has_price(self, instrument):
+        return instrument in self.index
+
+    def mid(self, instrument):
+        """
+        Current mid price of an instrument.
+        """
+        return self.closes[self.index[instrument], self.cursor]
+
+    def quote(self, instrument):
+        """
+        Current (bid, ask) of an instrument.
+        """
+        if instrument not in self.index:
+            raise V20Error(400, f"Invalid value specified for 'instrument': {instrument}")
+        mid = self.closes[self.index[instrument], self.cursor]
+        half_spread = mid * self.spread / 2
+        decimals = self.decimals[instrument]
+        return round(mid - half_spread, decimals), round(mid + half_spread, decimals)
+
+    # ------------------------------------------------------------------ #
+    # Market data handlers
+
+    def _candles(self, endpoint, path, params, data):
+        instrument = path[2]
+        if instrument not in self.index:
+            raise V20Error(400, f"Invalid value specified for 'instrument': {instrument}")
+        count = int(params.get("count", 500))
+        if "from" in params:
+            first = int(np.searchsorted(self.times[:self.cursor + 1], parse_time(params["from"]), side="left"))
+        else:
+            first = max(self.cursor + 1 - count, 0)
+        last = min(first + count, self.cursor + 1)
+        closes = self.closes[self.index[instrument]]
+        decimals = self.decimals[instrument]
+        candles = []
+        for bar in range(first, last):
+            close = closes[bar]
+            open_ = closes[bar - 1] if bar > 0 else close
+            mid = {"o": str(round(open_, decimals)), "h": str(round(max(open_, close), decimals)),
+                   "l": str(round(min(open_, close), decimals)), "c": str(round(close, decimals))}
+            candles.append({"complete": bar < self.cursor, "volume": 1, "time": format_time(self.times[bar]),
+                            "mid": mid})
+        return {"instrument": instrument, "granularity": params.get("granularity", "S5"), "candles": candles}
+
+    def _account_instruments(self, endpoint, path, params, data):
+        instruments = []
+        for inst in self.instruments:
+            decimals = self.decimals[inst]
+            instruments.append({"name": inst, "type": "CURRENCY", "displayName": inst.replace("_", "/"),
+                                "pipLocation": 1 - decimals,
+                                "displayPrecision": decimals, "tradeUnitsPrecision": 0,
+                                "minimumTradeSize": "1", "marginRate": "0.0333"})
+        return {"instruments": instruments, "lastTransactionID": str(self.last_transaction_id)}
+
+
+# Test section: measure trading loop throughput against the simulator
+if __name__ == "__main__":
+    import argparse
+    import contextlib
+    import io
+    import risk_manager
+    from backtest import generate_random_walk
+    from strategy import LiveStrategy
+
+    parser = argparse.ArgumentParser(description="Benchmark the trading loop against the broker simulator")
+    parser.add_argument("--instruments", type=int, default=200, help="Number of synthetic instruments")
+    parser.add_argument("--loops", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent candle requests")
+    args = parser.parse_args()
+
+    instruments = [f"S{i:03d}_USD" for i in range(args.instruments)]
+    broker = SimulatedBroker(instruments, generate_random_walk(instruments, 500 + args.loops + 1),
+                             latency=args.latency)
+    strategy = LiveStrategy(instruments, lookback_count=200, stma_period=30, ltma_period=40, rsi_period=10,
+                            granularity='S5', delta_fetch=True, max_workers=args.workers)
+    broker.attach(strategy, risk_manager)
+
+    loop_times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(args.loops):
+            start = time.perf_counter()
+            output = strategy.update_signal()
+            buys = {inst: "BUY" for inst, value in output.items() if value["signal"] == "BUY"}
+            if buys:
+                order_params = risk_manager.get_quantities(list(buys), buys,
+                                                           {inst: output[inst]["rsi"] for inst in buys})
+                risk_manager.place_market_orders({inst: (qty, tp, sl)
+                                                  for inst, (sl, tp, qty) in order_params.items() if qty})
+            loop_times.append(time.perf_counter() - start)
+            broker.advance()
+
+    loop_times = np.array(loop_times)
+    print(f"{args.instruments} instruments, {args.loops} loops: mean {loop_times.mean() * 1000:.1f} ms, "
+          f"p95 {np.percentile(loop_times, 95) * 1000:.1f} ms per loop")
+    print(f"Requests: {dict(broker.request_counts)}")
+    print(f"Account: {broker.summary()}")
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+"""
+candle_store.py - Local Candle Store Module
+
+This module keeps completed OANDA candles on local disk so backtests, sweeps and warm starts can read history
+at memory speed instead of paginating the REST API.
+
+Layout: one directory per instrument and granularity, with one append-only binary file per column:
+  <root>/<instrument>/<granularity>/time.bin    int64 Unix seconds (candle start time)
+  <root>/<instrument>/<granularity>/o|h|l|c.bin float64 mid prices
+  <root>/<instrument>/<granularity>/volume.bin  int64 tick volume
+Reads go through np.memmap, and time-range slicing uses a binary search on the time column, so a read only
+touches the pages that are actually used. Appends skip candles that are already stored (found by binary
+search); candles older than the newest stored one are merged in by rewriting the files.
+"""
+
+import os
+import threading
+import numpy as np
+from oandapyV20.endpoints.instruments import InstrumentsCandles
+from price_stream import parse_time, format_time
+
+COLUMNS = {"time": np.int64, "o": np.float64, "h": np.float64, "l": np.float64, "c": np.float64,
+           "volume": np.int64}
+
+
+def candles_to_columns(candles):
+    """
+    Convert completed OANDA candle dictionaries (mid prices) into column arrays sorted by time.
+    """
+    completed = [candle for candle in candles if candle.get("complete", True)]
+    columns = {
+        "time": np.array([int(parse_time(candle["time"])) for candle in completed], dtype=np.int64),
+        "o": np.array([float(candle["mid"]["o"]) for candle in completed], dtype=np.float64),
+        "h": np.array([float(candle["mid"]["h"]) for candle in completed], dtype=np.float64),
+        "l": np.array([float(candle["mid"]["l"]) for candle in completed], dtype=np.float64),
+        "c": np.array([float(candle["mid"]["c"]) for candle in completed], dtype=np.float64),
+        "volume": np.array([int(candle.get("volume", 0)) for candle in completed], dtype=np.int64),
+    }
+    order = np.argsort(columns["time"], kind="stable")
+    return {name: values[order] for name, values in columns.items()}
+
+
+class CandleStore:
+    def __init__(self, root="candle_store"):
+        """
+        Parameters:
+          root: Directory holding the store; created on first write.
+        """
+        self.root = root
+        self.lock = threading.Lock()
+
+    def _path(self, instrument, granularity, column=None):
+        directory = os.path.join(self.root, instrument, granularity)
+        return directory if column is None else os.path.join(directory, f"{column}.bin")
+
+    def series(self):
+        """
+        Yield (instrument, granularity) for every stored series.
+        """
+        if not os.path.isdir(self.root):
+            return
+        for instrument in sorted(os.listdir(self.root)):
+            for granularity in sorted(os.listdir(os.path.join(self.root, instrument))):
+                yield instrument, granularity
+
+    def count(self, instrument, granularity):
+        """
+        Number of complete rows (a partially written row after a crash is ignored).
+        """
+        sizes = []
+        for name, dtype in COLUMNS.items():
+            path = self._path(instrument, granularity, name)
+            if not os.path.exists(path):
+                return 0
+            sizes.append(os.path.getsize(path) // np.dtype(dtype).itemsize)
+        return min(sizes)
+
+    def read(self, instrument, granularity, start=None, end=None, columns=None):
+        """
+        Memory-map the stored candles with start <= time < end.
+
+        Parameters:
+          instrument: A currency pair, e.g. 'EUR_USD'.
+          granularity: The candle granularity, e.g. 'S5'.
+          start, end: Optional Unix-second bounds.
+          columns: Optional list of column names to return (default: all).
+
+        Returns:
+          A dictionary {column: read-only array view}; the arrays are empty if nothing is stored.
+        """
+        columns = columns or list(COLUMNS)
+        n = self.count(instrument, granularity)
+        if n == 0:
+            return {name: np.empty(0, dtype=COLUMNS[name]) for name in columns}
+
+        times = np.memmap(self._path(instrument, granularity, "time"), dtype=np.int64, mode="r", shape=(n,))
+        lo = 0 if start is None else int(np.searchsorted(times, start, side="left"))
+        hi = n if end is None else int(np.searchsorted(times, end, side="left"))
+        result = {}
+        for name in columns:
+            if name == "time":
+                data = times
+            else:
+                data = np.memmap(self._path(instrument, granularity, name), dtype=COLUMNS[name], mode="r",
+                                 shape=(n,))
+            result[name] = data[lo:hi]
+        return result
+
+    def last_time(self, instrument, granularity):
+        """
+        Start time (Unix seconds) of the newest stored candle, or None.
+        """
+        n = self.count(instrument, granularity)
+        if n == 0:
+            return None
+        times = np.memmap(self._path(instrument, granularity, "time"), dtype=np.int64, mode="r", shape=(n,))
+        return int(times[-1])
+
+    def tail(self, instrument, granularity, count):
+        """
+        The newest 'count' candles as a dictionary of column arrays.
+        """
+        n = self.count(instrument, granularity)
+        data = self.read(instrument, granularity)
+        return {name: values[max(n - count, 0):] for name, values in data.items()}
+
+    def append(self, instrument, granularity, candles):
+        """
+        Add candles to the store, skipping ones that are already stored.
+
+        Parameters:
+          candles: A list of OANDA candle dictionaries (incomplete candles are ignored), or a dictionary of
+                   column arrays as returned by candles_to_columns.
+
+        Returns:
+          The number of rows added.
+        """
+        columns = candles_to_columns(candles) if isinstance(candles, list) else candles
+        if len(columns["time"]) == 0:
+            return 0
+        # Drop duplicates inside the batch, keeping the last version of each candle
+        times = columns["time"]
+        keep = np.append(times[1:] != times[:-1], True)
+        columns = {name: np.asarray(values, dtype=COLUMNS[name])[keep] for name, values in columns.items()}
+
+        with self.lock:
+            os.makedirs(self._path(instrument, granularity), exist_ok=True)
+            n = self.count(instrument, granularity)
+            last = self.last_time(instrument, granularity)
+            if last is not None and columns["time"][0] <= last:
+                # Usually only the overlap of an inclusive 'from' fetch: look those times up by binary search
+                # on the sorted time column instead of reading the whole series
+                stored_times = np.memmap(self._path(instrument, granularity, "time"), dtype=np.int64, mode="r",
+                                         shape=(n,))
+                old = columns["time"] <= last
+                overlap = columns["time"][old]
+                index = np.minimum(np.searchsorted(stored_times, overlap), n - 1)
+                if np.array_equal(stored_times[index], overlap):
+                    columns = {name: values[~old] for name, values in columns.items()}
+                    if len(columns["time"]) == 0:
+                        return 0
+                else:
+                    # Candles older than the newest stored one that are not stored yet
+                    stored = self.read(instrument, granularity)
+                    new_rows = ~np.isin(columns["time"], stored["time"])
+                    columns = {name: values[new_rows] for name, values in columns.items()}
+                    if len(columns["time"]) == 0:
+                        return 0
+                    if columns["time"][0] <= last:
+                        return self._merge(instrument, granularity, stored, columns)
+
+            for name in COLUMNS:
+                path = self._path(instrument, granularity, name)
+                with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                    # Truncate a partially written row left by an interrupted append
+                    f.truncate(n * np.dtype(COLUMNS[name]).itemsize)
+                    f.seek(0, os.SEEK_END)
+                    f.write(columns[name].tobytes())
+            return len(columns["time"])
+
+    def _merge(self, instrument, granularity, stored, columns):
+        # Older candles cannot be appended, so rewrite the series in time order
+        merged = {name: np.concatenate([np.asarray(stored[name]), columns[name]]) for name in COLUMNS}
+        order = np.argsort(merged["time"], kind="stable")
+        for name in COLUMNS:
+            path = self._path(instrument, granularity, name)
+            with open(path + ".tmp", "wb") as f:
+                f.write(merged[name][order].tobytes())
+        for name in COLUMNS:
+            path = self._path(instrument, granularity, name)
+            os.replace(path + ".tmp", path)
+        return len(columns["time"])
+
+    def download(self, client, instrument, granularity, start, end=None, page_size=5000):
+        """
+        Fill the store from the OANDA REST API, paginating forward from 'start' (or from the newest stored
+        candle if that is later).
+
+        Parameters:
+          client: An oandapyV20 API client.
+          start, end: RFC3339 strings or Unix seconds.
+          page_size: Candles per request (OANDA allows up to 5000).
+
+        Returns:
+          The number of rows added.
+        """
+        start = parse_time(start) if isinstance(start, str) else start
+        end = parse_time(end) if isinstance(end, str) else end
+        last = self.last_time(instrument, granularity)
+        if last is not None and last >= start:
+            start = last
+        added = 0
+        while True:
+            params = {"from": format_time(start), "count": page_size, "granularity": granularity, "price": "M"}
+            response = client.request(InstrumentsCandles(instrument=instrument, params=params))
+            candles = [candle for candle in response.get("candles", []) if candle.get("complete")]
+            if end is not None:
+                candles = [candle for candle in candles if parse_time(candle["time"]) < end]
+            if not candles:
+                break
+            added += self.append(instrument, granularity, candles)
+            newest = parse_time(candles[-1]["time"])
+            if newest <= start or len(response.get("candles", [])) < page_size:
+                break
+            start = newest
+        return added
+
+
+def load_close_matrix(store, instruments, granularity, start=None, end=None):
+    """
+    Build an aligned (instruments x bars) close matrix from the store for backtests.
+    Bars are the union of all candle times; an instrument without a candle at a bar keeps its previous close
+    (S5 candles only exist when there were ticks). Leading bars before every instrument has a close are dropped.
+
+    Returns:
+      A tuple (closes, times) with times as float Unix seconds.
+    """
+    series = [store.read(inst, granularity, start, end, columns=["time", "c"]) for inst in instruments]
+    if any(len(data["time"]) == 0 for data in series):
+        missing = [inst for inst, data in zip(instruments, series) if len(data["time"]) == 0]
+        raise ValueError(f"No stored {granularity} candles for {missing}")
+    times = series[0]["time"]
+    for data in series[1:]:
+        times = np.union1d(times, data["time"])
+    closes = np.empty((len(instruments), len(times)))
+    first_valid = 0
+    for row, data in enumerate(series):
+        index = np.searchsorted(data["time"], times, side="right") - 1
+        first_valid = max(first_valid, int(np.searchsorted(index, 0)))
+        closes[row] = np.asarray(data["c"])[np.maximum(index, 0)]
+    return closes[:, first_valid:], times[first_valid:].astype(np.float64)
+
+
+if __name__ == "__main__":
+    import argparse
+    from oanda_client import get_client
+
+    parser = argparse.ArgumentParser(description="Download OANDA candles into the local candle store")
+    parser.add_argument("--root", default="candle_store")
+    parser.add_argument("--instruments", default="EUR_USD,GBP_USD,USD_JPY,AUD_USD,USD_CAD")
+    parser.add_argument("--granularity", default="S5")
+    parser.add_argument("--start", required=True, help="RFC3339 start time, e.g. 2024-01-01T00:00:00Z")
+    parser.add_argument("--end", help="RFC3339 end time (default: now)")
+    parser.add_argument("--environment", default="practice")
+    args = parser.parse_args()
+
+    store = CandleStore(args.root)
+    api = get_client(args.environment, timeout=(3.05, 30))
+    for inst in args.instruments.split(","):
+        added = store.download(api, inst, args.granularity, args.start, args.end)
+        print(f"{inst}: {added} candles added, {store.count(inst, args.granularity)} stored")
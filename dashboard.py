@@ -3,18 +3,34 @@ from dash import dcc, html
 from dash.dependencies import Input, Output
 import threading
 import time
+import atexit
 import plotly.graph_objects as go
-from risk_manager import get_current_balance, calculate_total_unrealised_pnl, get_open_positions, close_all_trades
-import oandapyV20.endpoints.instruments as instruments
+from risk_manager import close_all_trades
+from oanda_client import get_client, set_default_priority
+from rate_limiter import PRIORITY_DASHBOARD
+from state_channel import StateReader
+from timeseries import TieredSeries, lttb
+from metrics import PerformanceTracker
+from history_store import HistoryStore
 import os
 import oandapyV20
 import numpy as np
-import pandas as pd
 from datetime import datetime
 
 access_token = os.getenv('access_token')
 account_id = os.getenv('account_id')
-client = oandapyV20.API(access_token=access_token, environment="practice")
+# Dashboard requests (kill switch) yield to the trading loop when requests are throttled
+set_default_priority(PRIORITY_DASHBOARD)
+client = get_client("practice")
+
+# Balance, positions, signals and benchmark prices are published by main.py after every trading cycle
+state_reader = StateReader("oanda_trading_state")
+
+# Every point of the charts is also appended to an on-disk log and reloaded on restart (see history_store.py)
+history = HistoryStore("dashboard_history", sync_interval=30.0)
+strategy_log = history.log("strategy", ("return", "equity"))
+benchmark_log = history.log("benchmark", ("price", "return"))
+atexit.register(history.close)
 
 # Initialize the Dash app
 app = dash.Dash(__name__)
@@ -429,86 +445,19 @@ running_strategy = {
     "risk_free_rate": 0.02  # Annual risk-free rate (2%)
 }
 current_pnl = 0
-current_balance = get_current_balance()
-initial_balance = current_balance  # Record the initial balance
+current_balance = 0.0
+initial_balance = None  # Balance of the first snapshot received from the trading process (kept in the history)
+last_snapshot_time = None  # Time of the newest point in the history; older snapshots are already recorded
 open_positions = []
 kill_switch_triggered = False # Initialize the kill_switch_triggered flag
 
-eurusd_prices = []
-eurusd_returns = []
-eurusd_timestamps = []
+# EUR/USD price and return (%) per snapshot, bounded in memory (see timeseries.py)
+benchmark_history = TieredSeries(("price", "return"))
 initial_eurusd_price = None
 current_eurusd_return = 0
-# Function to calculate Risk of Ruin based on maximum drawdown
-def calculate_max_drawdown(returns):
-    if not returns:
-        return 0.0
-    peak = returns[0]
-    max_drawdown = 0.0
-    for r in returns:
-        if r > peak:
-            peak = r
-        drawdown = peak - r
-        if drawdown > max_drawdown:
-            max_drawdown = drawdown
-    return max_drawdown
-
-def calculate_ratios(returns, timestamps, risk_free_rate=0.02, max_drawdown=0.0):
-    if len(returns) < 2 or len(timestamps) < 2:
-        return {
-            'Sharpe Ratio': 0.0,
-            'Daily Return': 0.0,
-            'Daily Volatility': 0.0,
-            'Calmar Ratio': 0.0,
-            'Sortino Ratio': 0.0
-        }
-
-    total_seconds = (timestamps.iloc[-1] - timestamps.iloc[0]).total_seconds()
-    total_days = total_seconds / (24 * 60 * 60)
-    if total_days == 0:
-        raise ValueError("Time span too short for daily calculation.")
-
-    n = len(returns)
-    rf_daily = (1 + risk_free_rate) ** (1 / 260) - 1  # 转为每日无风险利率
-    excess_returns = returns - rf_daily
-
-    # Sharpe Ratio (daily)
-    std = returns.std()
-    if std == 0:
-        sharpe_ratio = 0.0
-    else:
-        sharpe_ratio = excess_returns.mean() / std
-
-    # Daily Return
-    cumulative_return = (returns + 1).prod() - 1
-    daily_return = (1 + cumulative_return) ** (1 / total_days) - 1
-
-    # Daily Volatility
-    daily_volatility = std
-
-    # Calmar Ratio (daily return / max drawdown)
-    calmar_ratio = daily_return / max_drawdown if max_drawdown != 0 else np.nan
-
-    # Sortino Ratio (daily)
-    downside_returns = excess_returns[excess_returns < 0]
-    downside_vol = downside_returns.std()
-    sortino_ratio = (daily_return - rf_daily) / downside_vol if downside_vol > 0 else np.nan
-
-    # return {
-    #     'Sharpe Ratio': sharpe_ratio,
-    #     'Daily Return': daily_return,
-    #     'Daily Volatility': daily_volatility,
-    #     'Calmar Ratio': calmar_ratio,
-    #     'Sortino Ratio': sortino_ratio,
-    # }
+def format_ratios(ratios):
     result = {}
-    for key, value in {
-        'Sharpe Ratio': sharpe_ratio,
-        'Daily Return': daily_return,
-        'Daily Volatility': daily_volatility,
-        'Calmar Ratio': calmar_ratio,
-        'Sortino Ratio': sortino_ratio,
-    }.items():
+    for key, value in ratios.items():
         if isinstance(value, (int, float)) and not np.isnan(value):
             if abs(value) > 1e6 or (abs(value) < 1e-4 and value != 0):
                 value = "{:.4e}".format(value)
@@ -519,65 +468,104 @@ def calculate_ratios(returns, timestamps, risk_free_rate=0.02, max_drawdown=0.0)
     return result
     
 # Lists to store returns over time
-strategy_returns = []  # List to store strategy returns (percentage values)
-equity_series = [initial_balance]
-timestamps = []  # List to store corresponding timestamps
+CHART_POINTS = 1000  # Points per chart trace sent to the browser (about one per horizontal pixel)
+
+def to_local_datetimes(timestamps):
+    """
+    Convert an array of Unix timestamps to datetime64 values in local time, which Plotly shows as dates.
+    """
+    offset = time.localtime().tm_gmtoff
+    return ((timestamps + offset) * 1000).astype("datetime64[ms]")
+
+# Drawdown and ratios over the whole session, updated once per snapshot (see metrics.py)
+performance = PerformanceTracker(risk_free_rate=running_strategy["risk_free_rate"])
+
+# Strategy return (percentage values) and equity per snapshot: raw points for the last day, then minute
+# and hour buckets, in constant memory
+strategy_history = TieredSeries(("return", "equity"))
 benchmark_return = (running_strategy["risk_free_rate"] / 365) * 100  # Daily risk-free rate converted to percentage
 
-# Update data function
+# Apply one state snapshot published by the trading process
+def apply_snapshot(snapshot):
+    global current_balance, current_pnl, open_positions, initial_eurusd_price, current_eurusd_return
+    global initial_balance, last_snapshot_time
+
+    if snapshot.get("balance") is None:
+        return
+    # After a restart the channel still holds snapshots that were recorded before it
+    if last_snapshot_time is not None and snapshot["time"] <= last_snapshot_time:
+        return
+    last_snapshot_time = snapshot["time"]
+    if initial_balance is None:
+        initial_balance = snapshot["balance"]
+        performance.start(initial_balance)
+        history.write_meta({"initial_balance": initial_balance, "initial_eurusd_price": initial_eurusd_price})
+
+    # Update global variables
+    current_balance = snapshot["balance"]
+    current_pnl = snapshot["unrealized_pnl"]
+    open_positions = snapshot["positions"]
+
+    # Modified return calculation: (unrealized PnL + current balance)/initial_balance
+    strategy_return = ((current_balance + current_pnl - initial_balance) / initial_balance) * 100
+    cur_equity = current_balance + current_pnl
+    # Append data for plotting and risk calculation, at the Unix timestamp of the snapshot
+    strategy_history.append(snapshot["time"], (strategy_return, cur_equity))
+    strategy_log.append(snapshot["time"], (strategy_return, cur_equity))
+    performance.add(snapshot["time"], strategy_return, cur_equity)
+
+    # Update EUR/USD data from the latest close the strategy computed its signal on
+    current_price = snapshot.get("signals", {}).get(running_strategy["instrument"], {}).get("price")
+    if current_price is not None:
+        # Check if initial price is set
+        if initial_eurusd_price is None:
+            initial_eurusd_price = current_price
+            history.write_meta({"initial_balance": initial_balance, "initial_eurusd_price": initial_eurusd_price})
+
+        # Calculate the return
+        eurusd_return = ((current_price - initial_eurusd_price) / initial_eurusd_price) * 100
+        current_eurusd_return = eurusd_return
+
+        # Append data for EUR/USD
+        benchmark_history.append(snapshot["time"], (current_price, eurusd_return))
+        benchmark_log.append(snapshot["time"], (current_price, eurusd_return))
+
+# Reload the history recorded by previous runs: the logs are memory-mapped and loaded in bulk
+def restore_history():
+    global initial_balance, initial_eurusd_price, current_eurusd_return, last_snapshot_time
+
+    meta = history.read_meta()
+    if meta.get("initial_balance") is None:
+        return
+    initial_balance = meta["initial_balance"]
+    initial_eurusd_price = meta.get("initial_eurusd_price")
+    performance.start(initial_balance)
+
+    times, values = strategy_log.read()
+    strategy_history.extend(times, values)
+    performance.extend(times, values[:, 0], values[:, 1])
+    eurusd_times, eurusd_values = benchmark_log.read()
+    benchmark_history.extend(eurusd_times, eurusd_values)
+    if len(eurusd_times):
+        current_eurusd_return = float(eurusd_values[-1, 1])
+
+    last_times = [float(t[-1]) for t in (times, eurusd_times) if len(t)]
+    last_snapshot_time = max(last_times) if last_times else None
+    print(f"Restored {len(times)} strategy and {len(eurusd_times)} EUR/USD history points")
+
+restore_history()
+
+# Update data function: read the snapshots published since the last read (no network requests)
 def update_data():
-    global current_balance, current_pnl, open_positions, strategy_returns, timestamps, equity_series
-    global eurusd_prices, eurusd_returns, eurusd_timestamps, initial_eurusd_price, current_eurusd_return
-    
     while True:
         try:
-            # Update balance and calculate return
-            current_balance = get_current_balance()
-            open_positions_dict = get_open_positions()
-            _, _, current_pnl = calculate_total_unrealised_pnl(open_positions_dict)
-
-            # Update global variables
-            open_positions = open_positions_dict
-            
-            # Modified return calculation: (unrealized PnL + current balance)/initial_balance
-            strategy_return = ((current_balance + current_pnl - initial_balance) / initial_balance) * 100
-            cur_equity = current_balance + current_pnl
-            # Append data for plotting and risk calculation
-            strategy_returns.append(strategy_return)
-            equity_series.append(cur_equity)
-            timestamps.append(time.time())  # Use Unix timestamp for accurate time filtering
-            
-            # Update EUR/USD data
-            params = {
-                "count": 1,
-                "granularity": "S5"  # 5-second granularity
-            }
-            
-            r = instruments.InstrumentsCandles(instrument="EUR_USD", params=params)
-            client.request(r)
-            candles = r.response.get('candles', [])
-            
-            if candles and len(candles) > 0:
-                # get the current price
-                current_price = float(candles[0]['mid']['c'])
-                current_timestamp = time.time()
-                
-                # Check if initial price is set
-                if initial_eurusd_price is None:
-                    initial_eurusd_price = current_price
-                
-                # Calculate the return
-                eurusd_return = ((current_price - initial_eurusd_price) / initial_eurusd_price) * 100
-                current_eurusd_return = eurusd_return
-                
-                # Append data for EUR/USD
-                eurusd_prices.append(current_price)
-                eurusd_returns.append(eurusd_return)
-                eurusd_timestamps.append(current_timestamp)
-            
+            for snapshot in state_reader.read_new():
+                apply_snapshot(snapshot)
+            # Make the recorded history durable even when no new snapshots arrive
+            history.sync_if_due()
         except Exception as e:
             print(f"Error updating data: {e}")
-        time.sleep(5)
+        time.sleep(1)
 
 # Start the data update thread
 thread = threading.Thread(target=update_data, daemon=True)
@@ -817,6 +805,9 @@ app.layout = html.Div(
                         {"label": "Last 5 Minutes", "value": 300},
                         {"label": "Last 15 Minutes", "value": 900},
                         {"label": "Last 1 Hour", "value": 3600},
+                        {"label": "Last 1 Day", "value": 86400},
+                        {"label": "Last 7 Days", "value": 604800},
+                        {"label": "Last 30 Days", "value": 2592000},
                     ],
                     value=120,  # Default to 2 minutes
                     clearable=False,
@@ -853,7 +844,7 @@ app.layout = html.Div(
     [Input("interval", "n_intervals")]
 )
 def update_strategy_data(n):
-    global current_balance, current_pnl, open_positions, strategy_returns, current_eurusd_return
+    global current_balance, current_pnl, open_positions, current_eurusd_return
     
     equity = f"${current_balance:.2f}"
     pnl = f"${current_pnl:.2f}"
@@ -876,7 +867,7 @@ def update_strategy_data(n):
         eurusd_return_class = "metric-value neutral"
     
     # Calculate Risk of Ruin based on strategy returns
-    risk = calculate_max_drawdown(strategy_returns)
+    risk = performance.max_drawdown
     risk_str = f"{risk:.2f}%"
     if risk < 10:
         risk_class = "metric-value positive"
@@ -888,13 +879,8 @@ def update_strategy_data(n):
     # Calculate risk metrics
     try:
         all_ratios = {}
-        if len(strategy_returns) > 1 and len(timestamps) > 1:
-            all_ratios = calculate_ratios(
-                pd.Series(equity_series).pct_change(), 
-                pd.Series([datetime.fromtimestamp(ts) for ts in timestamps]), 
-                risk_free_rate=running_strategy["risk_free_rate"],
-                max_drawdown=risk/100
-            )
+        if performance.count > 1:
+            all_ratios = format_ratios(performance.ratios(max_drawdown=risk/100))
         else:
             all_ratios = {
                 'Sharpe Ratio': 0.0,
@@ -1033,24 +1019,21 @@ def display_confirmation(n_clicks):
      Input("interval", "n_intervals")]
 )
 def update_performance_chart(time_range, n):
-    global strategy_returns, timestamps, eurusd_returns, eurusd_timestamps
-
     # Filter data based on selected time range
     current_time = time.time()
     
-    # filter strategy returns
-    filtered_indices = [i for i, t in enumerate(timestamps) if current_time - t <= time_range]
-    filtered_timestamps = [timestamps[i] for i in filtered_indices]
-    filtered_returns = [strategy_returns[i] for i in filtered_indices]
+    # filter strategy returns (raw points or minute / hour buckets, depending on the range, found by binary
+    # search) and reduce them to the chart's point budget
+    filtered_timestamps, filtered_returns = lttb(
+        *strategy_history.window("return", current_time - time_range), CHART_POINTS)
 
     # filter eurusd returns
-    filtered_eurusd_indices = [i for i, t in enumerate(eurusd_timestamps) if current_time - t <= time_range]
-    # filtered_eurusd_timestamps = [eurusd_timestamps[i] for i in filtered_eurusd_indices]
-    filtered_eurusd_returns = [eurusd_returns[i] for i in filtered_eurusd_indices]
+    filtered_eurusd_timestamps, filtered_eurusd_returns = lttb(
+        *benchmark_history.window("return", current_time - time_range), CHART_POINTS)
 
-    # Convert timestamps to readable format
-    readable_timestamps = [time.strftime("%H:%M:%S", time.localtime(t)) for t in filtered_timestamps]
-    # readable_eurusd_timestamps = [time.strftime("%H:%M:%S", time.localtime(t)) for t in filtered_eurusd_timestamps]
+    # Native datetimes; Plotly formats the time axis itself
+    readable_timestamps = to_local_datetimes(filtered_timestamps)
+    readable_eurusd_timestamps = to_local_datetimes(filtered_eurusd_timestamps)
 
     # Create the figure with improved styling
     fig = go.Figure()
@@ -1067,7 +1050,7 @@ def update_performance_chart(time_range, n):
 
     # Add EUR/USD returns as a line (instead of benchmark)
     fig.add_trace(go.Scatter(
-        x=readable_timestamps,
+        x=readable_eurusd_timestamps,
         y=filtered_eurusd_returns,
         mode='lines',
         name="EUR/USD Returns",
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+execution.py - Execution Backend Module
+
+This module provides PaperBroker, an in-memory paper trading account that fills orders at the current live
+bid/ask. risk_manager sends its order and account requests (OrderCreate, PositionClose, TradeClose,
+OpenTrades, OpenPositions, AccountDetails) to an execution backend, i.e. any object with the
+oandapyV20.API request method, selected with risk_manager.use_execution_backend:
+  - the shared OANDA client (the default) executes on the OANDA account;
+  - a PaperBroker executes in this process and never sends execution requests over the network.
+Market data (prices, candles, instrument metadata) always comes from OANDA.
+
+PaperBroker keeps the account logic of the broker simulator (broker_sim.SimulatedAccount): FIFO trades per
+instrument, take profit / stop loss on fill, realized and unrealized profit and loss in the account currency,
+and OANDA-style responses, so the trading loop and account_state.AccountState work against it unchanged.
+Prices come from two places:
+  - on_price(instrument, bid, ask), e.g. registered as a price_stream listener, which also triggers the
+    take profit / stop loss orders of that instrument;
+  - otherwise a PricingInfo request on the price client when a quote is needed and older than quote_ttl.
+Several PaperBrokers can be fed from one price source to run strategy variants side by side.
+"""
+
+import threading
+import time
+import oandapyV20.endpoints.pricing as pricing
+from oandapyV20.exceptions import V20Error
+from broker_sim import SimulatedAccount
+
+
+class PaperBroker(SimulatedAccount):
+    def __init__(self, price_client=None, price_account_id=None, initial_balance=100000, quote_ttl=1.0,
+                 account_id="PAPER-001"):
+        """
+        Parameters:
+          price_client: An oandapyV20 API client used for PricingInfo requests when a quote is missing or
+                        stale (None: only prices pushed with on_price are used).
+          price_account_id: The OANDA account ID for those PricingInfo requests.
+          initial_balance: Starting account balance in USD.
+          quote_ttl: Maximum age in seconds of a quote used for a fill before it is requested again.
+          account_id: Account ID reported in responses (requests for any account ID are accepted).
+        """
+        super().__init__(initial_balance=initial_balance, account_id=account_id)
+        self.price_client = price_client
+        self.price_account_id = price_account_id
+        self.quote_ttl = quote_ttl
+        self.quotes = {}  # {instrument: (bid, ask, time received)}
+        self.price_lock = threading.Lock()  # one PricingInfo request at a time
+
+    # ------------------------------------------------------------------ #
+    # Live prices
+
+    def on_price(self, instrument, bid, ask):
+        """
+        Store a new quote and trigger the take profit / stop loss orders of the instrument's trades.
+        Same signature as price_stream listeners and ExitEngine.on_price.
+        """
+        with self.lock:
+            self._store_quote(instrument, bid, ask)
+            self._check_triggers(instrument)
+
+    def _store_quote(self, instrument, bid, ask):
+        self.quotes[instrument] = (float(bid), float(ask), time.time())
+        if instrument not in self.decimals:
+            self.decimals[instrument] = 3 if bid > 10 else 5
+
+    def refresh_quotes(self, instruments):
+        """
+        Request current prices for the instruments whose quote is missing or older than quote_ttl.
+        """
+        if self.price_client is None:
+            return
+        now = time.time()
+        stale = sorted({inst for inst in instruments
+                        if inst not in self.quotes or now - self.quotes[inst][2] > self.quote_ttl})
+        if not stale:
+            return
+        with self.price_lock:
+            response = self.price_client.request(
+                pricing.PricingInfo(accountID=self.price_account_id, params={"instruments": ",".join(stale)}))
+        for price in response.get("prices", []):
+            if price.get("bids") and price.get("asks"):
+                self._store_quote(price["instrument"], float(price["bids"][0]["price"]),
+                                  float(price["asks"][0]["price"]))
+
+    def now(self):
+        return time.time()
+
+    def has_price(self, instrument):
+        return instrument in self.quotes
+
+    def mid(self, instrument):
+        bid, ask, _ = self.quotes[instrument]
+        return (bid + ask) / 2
+
+    def quote(self, instrument):
+        """
+        Current (bid, ask) of an instrument.
+        """
+        try:
+            self.refresh_quotes([instrument])
+        except Exception as e:
+            print(f"Error requesting the price of {instrument}: {e}")
+        if instrument not in self.quotes:
+            raise V20Error(400, f"No price available for instrument {instrument}")
+        bid, ask, _ = self.quotes[instrument]
+        return bid, ask
+
+    def _sync_clock(self):
+        # Before each request: bring the quotes of open trades up to date and apply their TP / SL orders
+        if self.trades and self.price_client is not None:
+            try:
+                self.refresh_quotes({trade["instrument"] for trade in self.trades.values()})
+            except Exception as e:
+                print(f"Error refreshing paper trading prices: {e}")
+            self._check_triggers()
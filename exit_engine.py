@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+exit_engine.py - Local Exit Engine Module
+
+This module checks take profit and stop loss levels locally on every price update instead of polling
+positions. Levels are kept per instrument in four sorted books:
+  - long take profit / short stop loss: triggered when the price rises to the level or above
+  - long stop loss / short take profit: triggered when the price falls to the level or below
+Long levels are checked against the bid and short levels against the ask. A price update finds all crossed
+levels with one binary search per book (bisect), so the cost does not depend on how many levels are far from
+the market, and thousands of layered levels per instrument are cheap.
+
+When any level of a position is crossed, all of that position's levels are removed and the exit callback is
+called once with (key, instrument, price, reason).
+"""
+
+import bisect
+import threading
+
+
+class TriggerBook:
+    """
+    Sorted price levels that trigger when the price moves through them in one direction.
+    """
+
+    def __init__(self, rising):
+        """
+        Parameters:
+          rising: True if levels trigger when the price is at or above them, False if at or below.
+        """
+        self.rising = rising
+        self.levels = []
+        self.entries = []  # (key, reason), in the order of levels
+
+    def __len__(self):
+        return len(self.levels)
+
+    def add(self, level, key, reason):
+        index = bisect.bisect_right(self.levels, level)
+        self.levels.insert(index, level)
+        self.entries.insert(index, (key, reason))
+
+    def remove(self, keys):
+        """
+        Drop every level belonging to one of the given keys.
+        """
+        keep = [i for i, (entry_key, _) in enumerate(self.entries) if entry_key not in keys]
+        if len(keep) != len(self.entries):
+            self.levels = [self.levels[i] for i in keep]
+            self.entries = [self.entries[i] for i in keep]
+
+    def crossed(self, price):
+        """
+        Entries whose level has been reached at this price, as a list of (level, key, reason).
+        """
+        if self.rising:
+            end = bisect.bisect_right(self.levels, price)
+            return [(self.levels[i], *self.entries[i]) for i in range(end)]
+        start = bisect.bisect_left(self.levels, price)
+        return [(self.levels[i], *self.entries[i]) for i in range(start, len(self.levels))]
+
+
+class ExitEngine:
+    def __init__(self, on_exit):
+        """
+        Parameters:
+          on_exit: Callback on_exit(key, instrument, price, reason) called once when a position's level is
+                   crossed; reason is "TAKE_PROFIT" or "STOP_LOSS".
+        """
+        self.on_exit = on_exit
+        self.books = {}  # {instrument: {(is_long, rising): TriggerBook}}
+        self.positions = {}  # {key: (instrument, is_long)}
+        self.lock = threading.Lock()
+
+    def _book(self, instrument, is_long, rising):
+        books = self.books.setdefault(instrument, {})
+        book = books.get((is_long, rising))
+        if book is None:
+            book = books[(is_long, rising)] = TriggerBook(rising)
+        return book
+
+    def add(self, key, instrument, units, take_profit=None, stop_loss=None):
+        """
+        Register exit levels for a position.
+
+        Parameters:
+          key: Identifier passed back to on_exit, e.g. the instrument or a trade ID.
+          instrument: The currency pair, e.g. 'EUR_USD'.
+          units: Position size; positive for long, negative for short.
+          take_profit, stop_loss: A price, a list of prices (layered levels) or None.
+        """
+        is_long = units > 0
+        with self.lock:
+            self.positions[key] = (instrument, is_long)
+            for reason, levels in (("TAKE_PROFIT", take_profit), ("STOP_LOSS", stop_loss)):
+                if levels is None:
+                    continue
+                # Long take profit and short stop loss trigger on a rising price
+                rising = is_long == (reason == "TAKE_PROFIT")
+                book = self._book(instrument, is_long, rising)
+                for level in (levels if isinstance(levels, (list, tuple)) else [levels]):
+                    book.add(float(level), key, reason)
+
+    def remove(self, key):
+        """
+        Drop all levels of a position (e.g. after it was closed for another reason).
+        """
+        with self.lock:
+            position = self.positions.pop(key, None)
+            if position is not None:
+                for book in self.books[position[0]].values():
+                    book.remove({key})
+
+    def on_price(self, instrument, bid, ask):
+        """
+        Check an instrument's levels against a new price and exit the positions whose levels were crossed.
+
+        Returns:
+          A list of (key, price, reason) for the positions that were exited.
+        """
+        triggered = []
+        with self.lock:
+            books = self.books.get(instrument)
+            if not books:
+                return triggered
+            keys = set()
+            for (is_long, rising), book in books.items():
+                price = bid if is_long else ask
+                for _, key, reason in book.crossed(price):
+                    if key not in keys:
+                        keys.add(key)
+                        triggered.append((key, price, reason))
+            if keys:
+                for book in books.values():
+                    book.remove(keys)
+                for key in keys:
+                    self.positions.pop(key, None)
+        # Call back outside the lock so the callback can add or remove levels
+        for key, price, reason in triggered:
+            try:
+                self.on_exit(key, instrument, price, reason)
+            except Exception as e:
+                print(f"Error exiting {key} on {instrument}: {e}")
+        return triggered
+
+    def level_count(self):
+        with self.lock:
+            return sum(len(book) for books in self.books.values() for book in books.values())
+
+
+# Test section
+if __name__ == "__main__":
+    import random
+    import time
+
+    exits = []
+    engine = ExitEngine(lambda key, instrument, price, reason: exits.append((key, reason)))
+    for i in range(5000):
+        entry = 1.08 + random.uniform(-0.01, 0.01)
+        units = random.choice([1000, -1000])
+        side = 1 if units > 0 else -1
+        engine.add(i, "EUR_USD", units, take_profit=[entry + side * 0.002, entry + side * 0.004],
+                   stop_loss=entry - side * 0.001)
+    print(f"{engine.level_count()} levels")
+
+    price = 1.08
+    start = time.perf_counter()
+    for _ in range(10000):
+        price += random.gauss(0, 0.0001)
+        engine.on_price("EUR_USD", price - 0.00005, price + 0.00005)
+    elapsed = time.perf_counter() - start
+    print(f"10000 price updates in {elapsed * 1000:.1f} ms, {len(exits)} exits, {engine.level_count()} levels left")
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+"""
+history_store.py - Dashboard History Store Module
+
+This module keeps the dashboard's time series on local disk so a restarted dashboard continues its
+performance chart and risk metrics instead of starting from an empty history.
+
+Layout: one directory with an append-only binary log per series and a small JSON metadata file:
+  <root>/<name>.bin   header (magic, number of value columns), then one row per point:
+                      float64 Unix time followed by one float64 per value column
+  <root>/meta.json    values fixed for the lifetime of the history (e.g. the initial balance)
+Appends are written to the operating system immediately, so stopping the dashboard loses nothing, and
+fsynced in batches: by the next append or sync_if_due call once sync_interval seconds have passed. The owner
+calls sync_if_due periodically (the dashboard every second), so a power failure loses at most about
+sync_interval seconds of points even when appends stop.
+Reads go through np.memmap, so reloading months of 5 second points costs one mapping, not a parse.
+A partially written row left by an interrupted append is ignored and overwritten by the next append.
+"""
+
+import json
+import os
+import struct
+import time
+import numpy as np
+
+MAGIC = b"DASHHIST"
+HEADER = struct.Struct("<8sQ")  # magic, number of value columns
+
+
+class HistoryLog:
+    def __init__(self, path, columns, sync_interval=30.0):
+        """
+        Parameters:
+          path: File of the log; created on first append.
+          columns: Names of the value columns (only their number is stored).
+          sync_interval: Maximum seconds between an append and the fsync that makes it durable.
+        """
+        self.path = path
+        self.columns = list(columns)
+        self.width = len(self.columns)
+        self.row_size = 8 * (1 + self.width)
+        self.sync_interval = sync_interval
+        self.file = None
+        self.unsynced = 0  # rows appended since the last fsync
+        self.synced_at = time.time()
+        if os.path.exists(path) and not self._valid():
+            # Keep a log of a different layout instead of appending mismatched rows to it
+            print(f"History log {path} does not have {self.width} value columns; moving it to {path}.old")
+            os.replace(path, path + ".old")
+
+    def _valid(self):
+        try:
+            with open(self.path, "rb") as f:
+                header = f.read(HEADER.size)
+        except OSError:
+            return False
+        return len(header) == HEADER.size and HEADER.unpack(header) == (MAGIC, self.width)
+
+    def count(self):
+        """
+        Number of complete rows stored.
+        """
+        if not os.path.exists(self.path):
+            return 0
+        return max(os.path.getsize(self.path) - HEADER.size, 0) // self.row_size
+
+    def read(self):
+        """
+        Memory-map the stored rows.
+
+        Returns:
+          A tuple (times, values) of read-only views: times has one entry per row, values one column per
+          value column. Both are empty if nothing is stored.
+        """
+        n = self.count()
+        if n == 0:
+            return np.empty(0), np.empty((0, self.width))
+        rows = np.memmap(self.path, dtype=np.float64, mode="r", offset=HEADER.size, shape=(n, 1 + self.width))
+        return rows[:, 0], rows[:, 1:]
+
+    def _open(self):
+        n = self.count()
+        new = not os.path.exists(self.path)
+        self.file = open(self.path, "wb" if new else "r+b")
+        if new:
+            self.file.write(HEADER.pack(MAGIC, self.width))
+        else:
+            # Drop a partially written row left by an interrupted append
+            self.file.truncate(HEADER.size + n * self.row_size)
+            self.file.seek(0, os.SEEK_END)
+
+    def append(self, t, values):
+        """
+        Add a point (a Unix time and one value per column) and fsync if due (see sync_if_due).
+        """
+        if self.file is None:
+            self._open()
+        row = np.empty(1 + self.width, dtype=np.float64)
+        row[0] = t
+        row[1:] = values
+        self.file.write(row.tobytes())
+        self.file.flush()
+        self.unsynced += 1
+        self.sync_if_due()
+
+    def sync_if_due(self):
+        """
+        Fsync the unsynced rows if the last fsync is at least sync_interval seconds old.
+        """
+        if self.unsynced and time.time() - self.synced_at >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        """
+        Make all appended rows durable.
+        """
+        if self.file is not None and self.unsynced:
+            os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.synced_at = time.time()
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+
+class HistoryStore:
+    def __init__(self, root="dashboard_history", sync_interval=30.0):
+        """
+        Parameters:
+          root: Directory holding the logs; created on first use.
+          sync_interval: Maximum seconds between an append and its fsync, for every log.
+        """
+        self.root = root
+        self.sync_interval = sync_interval
+        self.logs = {}
+        os.makedirs(root, exist_ok=True)
+
+    def log(self, name, columns):
+        """
+        Returns:
+          The HistoryLog of a series, e.g. log("strategy", ("return", "equity")).
+        """
+        if name not in self.logs:
+            self.logs[name] = HistoryLog(os.path.join(self.root, f"{name}.bin"), columns, self.sync_interval)
+        return self.logs[name]
+
+    def read_meta(self):
+        """
+        Returns:
+          The metadata dictionary, or an empty dictionary if there is none.
+        """
+        path = os.path.join(self.root, "meta.json")
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable history metadata {path}: {e}")
+            return {}
+
+    def write_meta(self, meta):
+        """
+        Replace the metadata (atomically and durably; it is written rarely).
+        """
+        path = os.path.join(self.root, "meta.json")
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(meta, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing history metadata {path}: {e}")
+
+    def sync(self):
+        for log in self.logs.values():
+            log.sync()
+
+    def sync_if_due(self):
+        """
+        Fsync every log with unsynced rows whose last fsync is at least sync_interval seconds old; call this
+        periodically.
+        """
+        for log in self.logs.values():
+            log.sync_if_due()
+
+    def close(self):
+        for log in self.logs.values():
+            log.close()
+
+
+# Test section
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+
+    root = tempfile.mkdtemp()
+    try:
+        store = HistoryStore(root)
+        log = store.log("strategy", ("return", "equity"))
+        rows = 90 * 17280  # 90 days of 5 s points
+        start = time.perf_counter()
+        for i in range(10000):
+            log.append(1.7e9 + 5 * i, (i * 1e-4, 100000.0 + i))
+        print(f"append: {(time.perf_counter() - start) / 10000 * 1e6:.1f} µs per point")
+        # Fill the rest in bulk for the reload measurement
+        data = np.column_stack([1.7e9 + 5 * np.arange(10000, rows), np.zeros(rows - 10000), np.ones(rows - 10000)])
+        log.file.write(data.tobytes())
+        store.close()
+
+        start = time.perf_counter()
+        times, values = HistoryStore(root).log("strategy", ("return", "equity")).read()
+        print(f"read {len(times)} points ({(time.perf_counter() - start) * 1e3:.2f} ms), last equity {values[-1, 1]}")
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""
+instrument_metadata.py - Instrument Metadata Module
+
+This module loads the trading rules of every instrument tradeable on the account (display precision, pip
+location, minimum trade size, margin rate) with one AccountInstruments request and keeps them in memory as
+a dictionary indexed by instrument name, so lookups during order sizing make no API calls.
+
+The response is saved to a local JSON cache file. On the next start the cache is used as long as it is
+younger than the TTL and belongs to the same account; otherwise the metadata is requested again. If that
+request fails, a stale cache is still better than nothing and is used with a warning.
+"""
+
+import json
+import os
+import time
+from oandapyV20.endpoints.accounts import AccountInstruments
+
+DEFAULT_CACHE_FILE = "instrument_cache.json"
+DEFAULT_TTL = 24 * 3600  # seconds; instrument rules change rarely
+
+
+def parse_instrument(instrument):
+    """
+    Convert one instrument of an AccountInstruments response into the fields we use.
+
+    Returns:
+      A dictionary with display_precision, pip_location, trade_units_precision, minimum_trade_size,
+      margin_rate and type.
+    """
+    return {
+        "display_precision": int(instrument["displayPrecision"]),
+        "pip_location": int(instrument["pipLocation"]),
+        "trade_units_precision": int(instrument.get("tradeUnitsPrecision", 0)),
+        "minimum_trade_size": float(instrument.get("minimumTradeSize", 1)),
+        "margin_rate": float(instrument.get("marginRate", 0)),
+        "type": instrument.get("type"),
+    }
+
+
+class InstrumentMetadata:
+    def __init__(self, client, account_id, cache_file=DEFAULT_CACHE_FILE, ttl=DEFAULT_TTL):
+        """
+        Parameters:
+          client: An oandapyV20 API client (or any object with the same request method).
+          account_id: The OANDA account ID.
+          cache_file: Path of the JSON cache file (None disables the cache).
+          ttl: Maximum age of the cache in seconds before the metadata is requested again.
+        """
+        self.client = client
+        self.account_id = account_id
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.instruments = {}  # {instrument: parsed metadata}
+        self.loaded_at = None
+
+    def load(self, force=False):
+        """
+        Fill the index from the cache file if it is fresh, otherwise from the API.
+
+        Parameters:
+          force: If True, ignore the cache and request the metadata.
+
+        Returns:
+          True if metadata is available.
+        """
+        cache = None if force else self._read_cache()
+        if cache is not None and time.time() - cache["fetched_at"] < self.ttl:
+            self._set(cache["instruments"], cache["fetched_at"])
+            return True
+        if self.fetch():
+            return True
+        if cache is not None:
+            print(f"Using instrument metadata cached at {time.ctime(cache['fetched_at'])}")
+            self._set(cache["instruments"], cache["fetched_at"])
+            return True
+        return False
+
+    def fetch(self):
+        """
+        Request the metadata of all tradeable instruments and save it to the cache file.
+
+        Returns:
+          True on success.
+        """
+        try:
+            response = self.client.request(AccountInstruments(accountID=self.account_id))
+            instruments = {inst["name"]: parse_instrument(inst) for inst in response["instruments"]}
+        except Exception as e:
+            print(f"Error retrieving instrument metadata: {e}")
+            return False
+        self._set(instruments, time.time())
+        self._write_cache()
+        return True
+
+    def _set(self, instruments, fetched_at):
+        self.instruments = instruments
+        self.loaded_at = fetched_at
+
+    def _read_cache(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return None
+        try:
+            with open(self.cache_file) as f:
+                cache = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable instrument cache {self.cache_file}: {e}")
+            return None
+        if cache.get("account_id") != self.account_id:
+            return None
+        return cache
+
+    def _write_cache(self):
+        if not self.cache_file:
+            return
+        cache = {"account_id": self.account_id, "fetched_at": self.loaded_at, "instruments": self.instruments}
+        tmp_path = self.cache_file + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            print(f"Error writing instrument cache {self.cache_file}: {e}")
+
+    def get(self, instrument):
+        """
+        Returns:
+          The metadata dictionary of an instrument (see parse_instrument), or None if it is unknown.
+        """
+        return self.instruments.get(instrument)
+
+    def precision(self, instrument):
+        """
+        Returns:
+          The number of decimals OANDA accepts in prices of the instrument, or None if it is unknown.
+        """
+        metadata = self.instruments.get(instrument)
+        return metadata["display_precision"] if metadata else None
+
+    def pip_size(self, instrument):
+        """
+        Returns:
+          The size of one pip in price units (e.g. 0.0001 for EUR_USD), or None if the instrument is unknown.
+        """
+        metadata = self.instruments.get(instrument)
+        return 10.0 ** metadata["pip_location"] if metadata else None
+
+    def minimum_trade_size(self, instrument):
+        metadata = self.instruments.get(instrument)
+        return metadata["minimum_trade_size"] if metadata else None
+
+    def margin_rate(self, instrument):
+        metadata = self.instruments.get(instrument)
+        return metadata["margin_rate"] if metadata else None
+
+
+# Test section
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from oanda_client import get_client
+
+    load_dotenv()
+    metadata = InstrumentMetadata(get_client("practice"), os.getenv('account_id'))
+    start = time.perf_counter()
+    if metadata.load():
+        print(f"{len(metadata.instruments)} instruments loaded in {(time.perf_counter() - start) * 1000:.1f} ms")
+        for inst in ['EUR_USD', 'GBP_USD', 'USD_JPY', 'AUD_USD', 'USD_CAD']:
+            print(inst, metadata.get(inst))
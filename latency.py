@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+"""
+latency.py - Pipeline Latency Module
+
+This module times the stages of the signal -> order pipeline with low overhead (one perf_counter pair and a
+bisect per span). Each span has a stage name, an optional instrument and the loop iteration it belongs to.
+Spans are aggregated into latency histograms per stage and per (stage, instrument), from which p50 / p95 /
+p99 are read. The most recent spans are also kept individually, for per-iteration queries and for service
+level objective (SLO) checks over a recent window.
+
+Stages recorded by the trading loop:
+  candle_fetch  - candle request(s) for one instrument (strategy.py)
+  indicators    - indicator and signal computation (strategy.py)
+  sizing        - order parameter calculation, including the price and balance lookups (main.py)
+  order_submit  - market order request until the fill (or cancel) is acknowledged (risk_manager.py)
+  tick_to_trade - candle close until the order fill is acknowledged (main.py)
+  cycle         - one whole trading cycle (main.py)
+
+The histograms can be dumped to a JSON file (dump) and read back from another process while the bot runs:
+  python latency.py latency_stats.json [stage]
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+import numpy as np
+
+# Histogram bucket upper bounds in seconds: 10 µs to 100 s, 40 buckets per decade (about 6% wide)
+BUCKET_BOUNDS = (10.0 ** np.arange(-5, 2.0001, 0.025)).tolist()
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram:
+    """
+    Fixed log-bucket latency histogram; percentiles are accurate to one bucket width.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, p):
+        """
+        Returns:
+          The upper bound of the bucket holding the p-th percentile, clamped to the observed min / max,
+          or None if nothing was recorded.
+        """
+        if not self.count:
+            return None
+        rank = max(1, int(np.ceil(self.count * p / 100.0)))
+        bucket = int(np.searchsorted(np.cumsum(self.counts), rank))
+        bound = BUCKET_BOUNDS[bucket] if bucket < len(BUCKET_BOUNDS) else self.max
+        return min(max(bound, self.min), self.max)
+
+    def summary(self):
+        """
+        Returns:
+          A dictionary with the count and the mean, max and PERCENTILES in milliseconds.
+        """
+        if not self.count:
+            return {"count": 0}
+        result = {"count": self.count, "mean_ms": self.total / self.count * 1000, "max_ms": self.max * 1000}
+        for p in PERCENTILES:
+            result[f"p{p}_ms"] = self.percentile(p) * 1000
+        return result
+
+
+class Span:
+    """
+    Context manager returned by LatencyRecorder.span.
+    """
+    __slots__ = ("recorder", "stage", "instrument", "iteration", "start")
+
+    def __init__(self, recorder, stage, instrument):
+        self.recorder = recorder
+        self.stage = stage
+        self.instrument = instrument
+        self.iteration = recorder.iteration
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.record(self.stage, time.perf_counter() - self.start, self.instrument, self.iteration)
+        return False
+
+
+class LatencyRecorder:
+    def __init__(self, recent=10000):
+        """
+        Parameters:
+          recent: Number of most recent spans kept individually (for queries and SLO windows).
+        """
+        self.histograms = {}  # {(stage, instrument or None): Histogram}; None aggregates all instruments
+        self.spans = deque(maxlen=recent)  # (end time, stage, instrument, iteration, seconds)
+        self.iteration = None
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def start_iteration(self, iteration):
+        """
+        Tag the spans recorded from now on (in any thread) with this loop iteration.
+        """
+        self.iteration = iteration
+
+    def record(self, stage, seconds, instrument=None, iteration=None):
+        """
+        Add one measured duration (in seconds) to the stage's histograms.
+        """
+        if iteration is None:
+            iteration = self.iteration
+        with self.lock:
+            keys = ((stage, None), (stage, instrument)) if instrument is not None else ((stage, None),)
+            for key in keys:
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram()
+                histogram.add(seconds)
+            self.spans.append((time.time(), stage, instrument, iteration, seconds))
+
+    def span(self, stage, instrument=None):
+        """
+        Time the enclosed block, e.g. 'with recorder.span("candle_fetch", "EUR_USD"): ...'.
+        The duration is recorded even if the block raises.
+        """
+        return Span(self, stage, instrument)
+
+    def percentiles(self, stage, instrument=None):
+        """
+        Returns:
+          The histogram summary (see Histogram.summary) of a stage, for one instrument or all of them.
+        """
+        with self.lock:
+            histogram = self.histograms.get((stage, instrument))
+            return histogram.summary() if histogram else {"count": 0}
+
+    def summary(self):
+        """
+        Returns:
+          A dictionary {stage: summary with an extra "instruments": {instrument: summary}}.
+        """
+        with self.lock:
+            result = {}
+            for (stage, instrument), histogram in sorted(self.histograms.items(), key=lambda item: (
+                    item[0][0], item[0][1] or "")):
+                if instrument is None:
+                    result.setdefault(stage, {"instruments": {}}).update(histogram.summary())
+                else:
+                    result.setdefault(stage, {"instruments": {}})["instruments"][instrument] = histogram.summary()
+            return result
+
+    def recent_spans(self, stage=None, instrument=None, iteration=None):
+        """
+        Returns:
+          The recent spans matching the given stage / instrument / iteration, as a list of
+          (end time, stage, instrument, iteration, seconds), oldest first.
+        """
+        with self.lock:
+            spans = list(self.spans)
+        return [s for s in spans if (stage is None or s[1] == stage) and (instrument is None or s[2] == instrument)
+                and (iteration is None or s[3] == iteration)]
+
+    def check_slo(self, stage, limit_ms, percentile=99, window=100):
+        """
+        Check a latency objective over the stage's most recent spans.
+
+        Parameters:
+          stage: The stage name, e.g. "tick_to_trade".
+          limit_ms: The objective in milliseconds.
+          percentile: The percentile that must stay at or below limit_ms.
+          window: Number of most recent spans of the stage to evaluate.
+
+        Returns:
+          The measured percentile in milliseconds if the objective is missed, otherwise None.
+        """
+        durations = [s[4] for s in self.recent_spans(stage)][-window:]
+        if not durations:
+            return None
+        value = float(np.percentile(durations, percentile)) * 1000
+        return value if value > limit_ms else None
+
+    def dump(self, path):
+        """
+        Write the histogram summary to a JSON file (replaced atomically, so readers never see a partial file).
+        """
+        data = {"started": self.started, "updated": time.time(), "iteration": self.iteration,
+                "stages": self.summary()}
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=1)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing latency statistics to {path}: {e}")
+
+    def print_summary(self):
+        print_stages(self.summary())
+
+
+def print_stages(stages, stage=None):
+    """
+    Print a summary as returned by LatencyRecorder.summary, optionally with the per-instrument rows of one stage.
+    """
+    for name, stats in stages.items():
+        if stage is not None and name != stage:
+            continue
+        rows = [(name, stats)]
+        if stage is not None:
+            rows += [(f"  {inst}", inst_stats) for inst, inst_stats in stats.get("instruments", {}).items()]
+        for label, row in rows:
+            if not row.get("count"):
+                continue
+            print(f"{label:<14} n: {row['count']:>7}  p50: {row['p50_ms']:8.2f} ms  p95: {row['p95_ms']:8.2f} ms  "
+                  f"p99: {row['p99_ms']:8.2f} ms  max: {row['max_ms']:8.2f} ms")
+
+
+# Default recorder used by the trading loop
+recorder = LatencyRecorder()
+
+
+# Test section: print a dumped latency file, e.g. python latency.py latency_stats.json tick_to_trade
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            data = json.load(f)
+        print(f"Iteration {data['iteration']}, updated {time.ctime(data['updated'])}")
+        print_stages(data["stages"], sys.argv[2] if len(sys.argv) > 2 else None)
+    else:
+        import random
+        start = time.perf_counter()
+        for i in range(100000):
+            recorder.start_iteration(i // 10)
+            with recorder.span("test", random.choice(["EUR_USD", "USD_JPY"])):
+                pass
+        print(f"100000 spans in {(time.perf_counter() - start) * 1000:.0f} ms")
+        for _ in range(10000):
+            recorder.record("lognormal", random.lognormvariate(-4, 1))
+        recorder.print_summary()
+        samples = [s[4] for s in recorder.recent_spans("lognormal")]
+        print("exact p50/p95/p99 (ms):", [round(float(np.percentile(samples, p)) * 1000, 1) for p in PERCENTILES])
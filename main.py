@@ -1,19 +1,36 @@
 #!/usr/bin/env python
 import time
 import os
+import queue
+import threading
 import traceback
 from dotenv import load_dotenv
 import oandapyV20
 
 # Import the strategy module and the risk management module
 from strategy import LiveStrategy
+from price_stream import PriceStreamFeed
+from candle_store import CandleStore
+from account_state import AccountState
+from oanda_client import get_client, print_request_stats
+from scheduler import CandleScheduler
+from exit_engine import ExitEngine
+from instrument_metadata import InstrumentMetadata
+from latency import recorder
+from execution import PaperBroker
+from state_channel import StatePublisher
 from risk_manager import (
     get_quantities,           # Revised function with RSI weighting to calculate order parameters
     place_market_orders,      # Bulk order placement interface
     get_open_positions,
     get_current_balance,
     close_all_trades,
-    close_position            # Function for closing an individual instrument’s position
+    close_position,           # Function for closing an individual instrument’s position
+    get_current_quotes,
+    calculate_total_unrealised_pnl,
+    use_account_state,
+    use_instrument_metadata,
+    use_execution_backend
 )
 # Uncomment the following import if email notifications are required
 # from notification import send_email_notification
@@ -25,8 +42,8 @@ access_token = os.getenv('access_token')
 account_id = os.getenv('account_id')
 accountID = account_id
 
-# Initialize the OANDA API client (using practice mode)
-client = oandapyV20.API(access_token=access_token, environment="practice")
+# Use the shared OANDA API client (using practice mode)
+client = get_client("practice")
 
 # --------------------- Settings --------------------- #
 # Define the instruments (5 currency pairs)
@@ -37,6 +54,44 @@ ltma_period = 40              # Long-term moving average period
 granularity = 'S5'            # Candle granularity
 rsi_period = 10               # RSI period
 rsi_weight_param = 1         # Weighting parameter for RSI in order quantity calculation
+delta_fetch = True            # Only request candles completed since the previous loop
+fetch_workers = 5             # Maximum number of concurrent candle requests
+request_timeout = 3           # Timeout (in seconds) for each candle request
+use_price_stream = False      # Build candles from the OANDA pricing stream instead of polling candles
+order_workers = 5             # Maximum number of orders submitted in parallel
+candle_store_dir = "candle_store"  # Local candle history used to warm start after a restart (None disables it)
+schedule_slack = 0.5          # Seconds after each candle close before the cycle runs (time to publish the candle)
+account_poll_interval = 5     # Seconds between account change polls; balance and positions are read from memory
+instrument_cache_file = "instrument_cache.json"  # Local copy of the instrument metadata (precision, pip location, ...)
+instrument_cache_ttl = 24 * 3600  # Seconds before the instrument metadata is requested again
+latency_stats_file = "latency_stats.json"  # Per-stage latency histograms, rewritten every cycle (python latency.py <file>)
+tick_to_trade_slo_ms = 2000   # Alert when the p99 time from candle close to order fill exceeds this
+slo_alert_cooldown = 3600     # Seconds before a still missed objective is alerted again
+execution_mode = "oanda"      # "oanda" sends orders to the account, "paper" fills them in memory at live prices
+paper_balance = 100000        # Starting balance of the paper account
+state_channel_name = "oanda_trading_state"  # Shared memory block the dashboard reads the trading state from
+
+# Orders, closes and account queries go to the OANDA account or to an in-memory paper account
+if execution_mode == "paper":
+    execution_backend = PaperBroker(price_client=client, price_account_id=account_id,
+                                    initial_balance=paper_balance)
+    use_execution_backend(execution_backend)
+    print("Paper trading: orders are filled in memory at live prices")
+else:
+    execution_backend = client
+
+# Keep balance, positions and trades in memory, updated through the account changes endpoint
+account_state = AccountState(execution_backend, account_id, poll_interval=account_poll_interval)
+account_state.start()
+use_account_state(account_state)
+
+# Price precision and trade rules of every tradeable instrument, from the local cache or one request
+instrument_metadata = InstrumentMetadata(client, account_id, cache_file=instrument_cache_file,
+                                         ttl=instrument_cache_ttl)
+if instrument_metadata.load():
+    use_instrument_metadata(instrument_metadata)
+else:
+    print("Instrument metadata unavailable; using the built-in precision table")
 
 # Get the initial account balance
 opening_balance = get_current_balance()
@@ -46,8 +101,13 @@ opening_balance = get_current_balance()
 # Format: { "EUR_USD": (stop_loss_price, take_profit_price, quantity), ... }
 inposition = False
 open_trade_params = {}
+# Held while the trading cycle opens or closes positions and while the exit worker closes one, so the two
+# never act on the same instrument at once (reentrant: without the stream, exits are triggered from inside
+# the cycle)
+trading_lock = threading.RLock()
 
 last_print_time = time.time()
+slo_alerted_at = None  # Time of the last tick-to-trade alert while the objective is missed, None once it is met
 time_interval = 15  # Log output interval (in seconds)
 
 print("=" * 50)
@@ -57,7 +117,7 @@ print("Starting balance     : {:.2f}".format(opening_balance))
 print("-" * 50)
 
 # Create a strategy object. It is assumed that the LiveStrategy class implements the update_signal() method
-# which returns a dictionary of the form {instrument: {"signal": signal, "rsi": rsi}}.
+# which returns a dictionary of the form {instrument: {"signal": signal, "rsi": rsi, "price": price}}.
 live_strategy = LiveStrategy(
     instruments=instruments,
     lookback_count=lookback_count,
@@ -65,10 +125,84 @@ live_strategy = LiveStrategy(
     ltma_period=ltma_period,
     granularity=granularity,
     environment="practice",
-    rsi_period=rsi_period
+    rsi_period=rsi_period,
+    delta_fetch=delta_fetch,
+    max_workers=fetch_workers,
+    request_timeout=request_timeout,
+    streaming=use_price_stream,
+    candle_store=CandleStore(candle_store_dir) if candle_store_dir else None
 )
 
-def find_quantities_and_trade(signal_results):
+# State snapshots for the dashboard, published after every cycle (see state_channel.py)
+state_publisher = StatePublisher(state_channel_name)
+
+def publish_state(signal_results):
+    """
+    Publish balance, PnL, positions and the latest signals, RSI and prices for the dashboard.
+    """
+    balance = get_current_balance()
+    positions_list = get_open_positions()
+    _, _, unrealized_pnl = calculate_total_unrealised_pnl(positions_list)
+    state_publisher.publish({
+        "time": time.time(),
+        "iteration": scheduler.cycles,
+        "balance": balance,
+        "unrealized_pnl": unrealized_pnl,
+        "equity": balance + unrealized_pnl if balance is not None else None,
+        "opening_balance": opening_balance,
+        "inposition": inposition,
+        "positions": positions_list,
+        "signals": signal_results,
+    })
+
+def exit_position(inst, instrument, price, reason):
+    """
+    Close the position whose take profit or stop loss level was crossed (exit engine callback, run by the
+    exit worker when the price stream is used).
+    """
+    with trading_lock:
+        # The trading cycle may have closed the position, or closed and reopened it, while this callback waited
+        if inst in exit_engine.positions:
+            print(f"{inst}: {reason} level crossed by a position that has since been replaced, not closing.")
+            return
+        if instrument not in {pos.get("instrument") for pos in get_open_positions()}:
+            print(f"{inst}: {reason} level crossed but the position is already closed.")
+            return
+        print(f"{inst}: Current price {price} reached its {reason} level, closing position.")
+        close_position(instrument)
+        open_trade_params.pop(inst, None)
+
+def exit_worker():
+    """
+    Close the positions queued by the exit engine, one at a time, off the price stream thread.
+    """
+    while True:
+        crossed = exit_queue.get()
+        try:
+            exit_position(*crossed)
+        except Exception:
+            print("Exception occurred while closing a position:")
+            traceback.print_exc()
+
+# Take profit / stop loss levels of the open positions, checked on every price update.
+# With the price stream the stream thread only queues crossed positions: closing them means waiting for
+# trading_lock and making REST calls, which would stall the stream (and its candles) for that long.
+if use_price_stream:
+    exit_queue = queue.Queue()
+    threading.Thread(target=exit_worker, daemon=True).start()
+    exit_engine = ExitEngine(lambda *crossed: exit_queue.put(crossed))
+else:
+    exit_engine = ExitEngine(exit_position)
+
+if use_price_stream:
+    price_feed = PriceStreamFeed(instruments, granularities=[granularity], environment="practice")
+    price_feed.attach(live_strategy)
+    if execution_mode == "paper":
+        price_feed.add_price_listener(execution_backend.on_price)
+    price_feed.add_price_listener(exit_engine.on_price)
+    price_feed.start()
+
+def find_quantities_and_trade(signal_results, boundary=None):
     """
     Calculate order parameters using RSI weights and place orders.
     This function extracts the trade directions and RSI values from the signal results and passes them into
@@ -76,6 +210,8 @@ def find_quantities_and_trade(signal_results):
 
     Parameters:
       signal_results: A dictionary of the format {instrument: {"signal": signal, "rsi": rsi}}.
+      boundary: Close time (Unix seconds) of the candle the signals were computed on; used to record the
+                "tick_to_trade" latency of each fill.
     """
     global inposition, open_trade_params
     trade_directions = {}
@@ -87,7 +223,8 @@ def find_quantities_and_trade(signal_results):
         trade_directions[inst] = data.get("signal")
         rsi_dict[inst] = data.get("rsi")
     
-    orders_params = get_quantities(instruments, trade_directions, rsi_dict, rsi_weight_param=rsi_weight_param)
+    with recorder.span("sizing"):
+        orders_params = get_quantities(instruments, trade_directions, rsi_dict, rsi_weight_param=rsi_weight_param)
     if orders_params is None or len(orders_params) == 0:
         print("Failed to compute order parameters, abandoning trade")
         return
@@ -102,89 +239,122 @@ def find_quantities_and_trade(signal_results):
     # Place orders in bulk for all instruments with computed order parameters
     order_dict = {inst: (quantity, takeprofit_price, stoploss_price)
                   for inst, (stoploss_price, takeprofit_price, quantity) in orders_params.items()}
-    place_market_orders(order_dict)
+    fills = place_market_orders(order_dict, max_workers=order_workers)
+    for inst, fill in fills.items():
+        if fill["price"] is not None:
+            print(f"{inst} filled at {fill['price']} (trade {fill['trade_id']}, {fill['latency'] * 1000:.0f} ms)")
+            if boundary is not None:
+                recorder.record("tick_to_trade", fill["acknowledged_at"] - boundary, inst)
+            stoploss_price, takeprofit_price, quantity = orders_params[inst]
+            exit_engine.add(inst, inst, quantity, take_profit=takeprofit_price, stop_loss=stoploss_price)
     print("-" * 30)
     # Save the order parameters for later monitoring
     open_trade_params = orders_params.copy()
     inposition = True
-    time.sleep(3)
 
-# Main trading loop
-while True:
+def trading_cycle(boundary):
+    """
+    Run the signal -> sizing -> order pipeline once for the candle that closed at 'boundary'.
+    """
+    global inposition, open_trade_params, opening_balance, last_print_time, slo_alerted_at
+    recorder.start_iteration(scheduler.cycles)
+    cycle_start = time.perf_counter()
+    signal_results = {}
     try:
         signal_results = live_strategy.update_signal()
-        # If no positions are open, generate signals and place orders
-        if not inposition:
-            # uncomment the below one if we don't allow short selling
-            # buy_signals = {inst: data for inst, data in signal_results.items() if data.get("signal") == "BUY"}
-            if not signal_results or len(signal_results) == 0:
-                print("No signal generated")
-            else:
-                print(f"Signal results: {signal_results}")
-                find_quantities_and_trade(signal_results)
-                
-        # If positions are open, monitor each instrument's position individually
-        if inposition:
-            positions_list = get_open_positions()  # Returns a list containing position information for each instrument
-            for pos in positions_list:
-                # Assume position info contains an "instrument" field and current position info
-                inst = pos.get("instrument")
-                if not inst:
-                    continue
-                try:
-                    # This example uses pos.get("currentPrice", 0); modify as needed to fetch the actual current price
-                    current_price = float(pos.get("currentPrice", 0))
-                except Exception as e:
-                    print(f"Error reading current price for {inst}: {e}")
-                    continue
+        with trading_lock:
+            # If no positions are open, generate signals and place orders
+            if not inposition:
+                # uncomment the below one if we don't allow short selling
+                # buy_signals = {inst: data for inst, data in signal_results.items() if data.get("signal") == "BUY"}
+                if not signal_results or len(signal_results) == 0:
+                    print("No signal generated")
+                else:
+                    print(f"Signal results: {signal_results}")
+                    find_quantities_and_trade(signal_results, boundary)
                 
-                signal = signal_results.get(inst, {}).get("signal")
-                if signal == "SELL":
-                    print(f"{inst}: SELL signal triggered by indicators, closing position.")
-                    close_position(inst)
-                    open_trade_params.pop(inst, None)
-                    continue
-
-                # If order parameters exist for this instrument, check if the individual exit condition is met
-                if inst in open_trade_params:
-                    stoploss_price, takeprofit_price, _ = open_trade_params[inst]
-                    # For a long position: if current price >= take profit or current price <= stop loss, then exit
-                    if current_price >= takeprofit_price or current_price <= stoploss_price:
-                        print(f"{inst}: Current price {current_price} reached target levels (TP: {takeprofit_price}, SL: {stoploss_price}).")
-                        close_position(inst)  # Close the position for this instrument only
-                        # Remove the record from open_trade_params
+            # If positions are open, monitor each instrument's position individually
+            if inposition:
+                positions_list = get_open_positions()  # Returns a list containing position information for each instrument
+                open_instruments = {pos.get("instrument") for pos in positions_list}
+                # Forget exit levels of positions closed elsewhere (e.g. by the broker-side TP/SL orders)
+                for key in list(exit_engine.positions):
+                    if key not in open_instruments:
+                        exit_engine.remove(key)
+                # Without the price stream, check the exit levels against the current quotes once per cycle
+                if not use_price_stream and exit_engine.positions:
+                    quotes = get_current_quotes(list(exit_engine.positions)) or {}
+                    for inst, (bid, ask) in quotes.items():
+                        exit_engine.on_price(inst, bid, ask)
+                    # Positions the exit engine just closed must not be closed again below
+                    positions_list = get_open_positions()
+
+                for pos in positions_list:
+                    inst = pos.get("instrument")
+                    if not inst:
+                        continue
+                    signal = signal_results.get(inst, {}).get("signal")
+                    if signal == "SELL":
+                        print(f"{inst}: SELL signal triggered by indicators, closing position.")
+                        exit_engine.remove(inst)
+                        close_position(inst)
                         open_trade_params.pop(inst, None)
-                else:
-                    continue
 
-            # not in positions_list instruments list
-            new_buy_inst = [inst for inst in instruments if (inst not in positions_list and signal_results.get(inst, {}).get("signal") == "BUY")]
-            if new_buy_inst:
-                print(f"New buy signals detected for: {new_buy_inst}")
+                # not in positions_list instruments list
+                new_buy_inst = [inst for inst in instruments if (inst not in positions_list and signal_results.get(inst, {}).get("signal") == "BUY")]
+                if new_buy_inst:
+                    print(f"New buy signals detected for: {new_buy_inst}")
                 
-                # Create a filtered signal_results dictionary with only the new buy instruments
-                new_buy_signals = {inst: data for inst, data in signal_results.items() if inst in new_buy_inst}
+                    # Create a filtered signal_results dictionary with only the new buy instruments
+                    new_buy_signals = {inst: data for inst, data in signal_results.items() if inst in new_buy_inst}
                 
-                # Use the existing function with the filtered signals
-                find_quantities_and_trade(new_buy_signals)
+                    # Use the existing function with the filtered signals
+                    find_quantities_and_trade(new_buy_signals, boundary)
             
 
-            # Check whether all positions have been closed
-            positions_list = get_open_positions()
-            if not positions_list or len(positions_list) == 0:
-                inposition = False
-                current_balance = get_current_balance()
-                print("=" * 50)
-                print("All positions closed")
-                print("Current balance: {:.2f}".format(current_balance))
-                # Update account balance and reset state
-                opening_balance = current_balance
-                open_trade_params = {}
-        else:
-            pass
+                # Check whether all positions have been closed
+                positions_list = get_open_positions()
+                if not positions_list or len(positions_list) == 0:
+                    inposition = False
+                    current_balance = get_current_balance()
+                    print("=" * 50)
+                    print("All positions closed")
+                    print("Current balance: {:.2f}".format(current_balance))
+                    # Update account balance and reset state
+                    opening_balance = current_balance
+                    open_trade_params = {}
+            else:
+                pass
 
     except Exception as e:
         print("Exception occurred in main loop:")
         traceback.print_exc()
 
-    time.sleep(5)
+    recorder.record("cycle", time.perf_counter() - cycle_start)
+    try:
+        publish_state(signal_results)
+    except Exception as e:
+        print(f"Error publishing the trading state: {e}")
+    recorder.dump(latency_stats_file)
+    slo_miss = recorder.check_slo("tick_to_trade", tick_to_trade_slo_ms)
+    # Alert when the objective is first missed, then at most once per cooldown until it is met again
+    if slo_miss is not None:
+        if slo_alerted_at is None or time.time() - slo_alerted_at >= slo_alert_cooldown:
+            still = "still " if slo_alerted_at is not None else ""
+            print(f"ALERT: tick-to-trade p99 {slo_miss:.0f} ms {still}exceeds the {tick_to_trade_slo_ms} ms objective")
+            # send_email_notification("Tick-to-trade SLO missed", f"p99 {slo_miss:.0f} ms")
+            slo_alerted_at = time.time()
+    elif slo_alerted_at is not None:
+        print(f"RECOVERED: tick-to-trade p99 is back within the {tick_to_trade_slo_ms} ms objective")
+        # send_email_notification("Tick-to-trade SLO met again", f"p99 within {tick_to_trade_slo_ms} ms")
+        slo_alerted_at = None
+
+    if time.time() - last_print_time >= time_interval:
+        print_request_stats()
+        scheduler.print_stats()
+        recorder.print_summary()
+        last_print_time = time.time()
+
+# Main trading loop: one cycle just after each candle closes
+scheduler = CandleScheduler(granularity, slack=schedule_slack)
+scheduler.run(trading_cycle)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+"""
+metrics.py - Streaming Performance Metrics Module
+
+This module keeps the dashboard's risk metrics up to date one equity point at a time, in O(1) per point
+and per read, instead of recomputing them from the full history on every refresh:
+  - running peak and maximum drawdown of the strategy return (percentage points)
+  - Welford mean / variance of the per-point equity returns (Sharpe ratio, volatility)
+  - Welford variance of the negative excess returns (Sortino ratio)
+  - cumulative growth factor of the equity returns (daily return, Calmar ratio); kept as a running product
+    rather than a sum of log returns because it reproduces pandas' prod() exactly
+The results equal the same quantities computed from the whole series with pandas, up to floating point
+rounding (checked against that reference computation in the test section below).
+
+PerformanceTracker.extend adds a whole array of points at once (e.g. history reloaded from disk) by merging
+vectorized batch statistics into the accumulators; the result equals adding them one by one up to rounding.
+"""
+
+import math
+from datetime import datetime
+import numpy as np
+
+
+class RunningStats:
+    """
+    Welford's online mean and sample variance.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def extend(self, values):
+        """
+        Add an array of values, merging its mean and squared deviations into the running ones (Chan et al.).
+        """
+        n = len(values)
+        if n == 0:
+            return
+        mean = float(values.mean())
+        m2 = float(((values - mean) ** 2).sum())
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+
+    def std(self):
+        """
+        Sample standard deviation (ddof=1, like pandas), NaN with fewer than two values.
+        """
+        if self.count < 2:
+            return float("nan")
+        return math.sqrt(self.m2 / (self.count - 1))
+
+
+class PerformanceTracker:
+    def __init__(self, risk_free_rate=0.02):
+        """
+        Parameters:
+          risk_free_rate: Annual risk-free rate; converted to a daily rate over 260 trading days.
+        """
+        self.rf_daily = (1 + risk_free_rate) ** (1 / 260) - 1
+        self.first_time = None
+        self.last_time = None
+        self.count = 0
+        self.peak = None
+        self.max_drawdown = 0.0  # in the units of the strategy return (percentage points)
+        self.previous_equity = None
+        self.returns = RunningStats()
+        self.downside = RunningStats()  # excess returns below zero
+        self.growth = 1.0  # product of (1 + return)
+
+    def start(self, initial_equity):
+        """
+        Set the equity the first return is measured against (the initial balance).
+        """
+        self.previous_equity = initial_equity
+
+    def add(self, timestamp, strategy_return, equity):
+        """
+        Add one point.
+
+        Parameters:
+          timestamp: Unix time of the point.
+          strategy_return: Strategy return in percent since the initial balance.
+          equity: Account equity (balance plus unrealized PnL).
+        """
+        if self.first_time is None:
+            self.first_time = timestamp
+        self.last_time = timestamp
+        self.count += 1
+
+        # Running peak and drawdown of the strategy return
+        if self.peak is None or strategy_return > self.peak:
+            self.peak = strategy_return
+        self.max_drawdown = max(self.max_drawdown, self.peak - strategy_return)
+
+        # Per-point equity return
+        if self.previous_equity is not None:
+            r = equity / self.previous_equity - 1
+            self.returns.add(r)
+            excess = r - self.rf_daily
+            if excess < 0:
+                self.downside.add(excess)
+            self.growth *= 1 + r
+        self.previous_equity = equity
+
+    def extend(self, timestamps, strategy_returns, equities):
+        """
+        Add many points at once; same parameters as add, as arrays.
+        """
+        n = len(timestamps)
+        if n == 0:
+            return
+        strategy_returns = np.asarray(strategy_returns, dtype=np.float64)
+        equities = np.asarray(equities, dtype=np.float64)
+        if self.first_time is None:
+            self.first_time = float(timestamps[0])
+        self.last_time = float(timestamps[-1])
+        self.count += n
+
+        peaks = np.maximum.accumulate(strategy_returns)
+        if self.peak is not None:
+            peaks = np.maximum(peaks, self.peak)
+        self.peak = float(peaks[-1])
+        self.max_drawdown = max(self.max_drawdown, float((peaks - strategy_returns).max()))
+
+        if self.previous_equity is not None:
+            r = equities / np.concatenate(([self.previous_equity], equities[:-1])) - 1
+        else:
+            r = equities[1:] / equities[:-1] - 1
+        self.returns.extend(r)
+        excess = r - self.rf_daily
+        self.downside.extend(excess[excess < 0])
+        self.growth *= float(np.prod(1 + r))
+        self.previous_equity = float(equities[-1])
+
+    def ratios(self, max_drawdown):
+        """
+        Daily ratios of the equity returns so far.
+
+        Parameters:
+          max_drawdown: Maximum drawdown as a fraction, used for the Calmar ratio.
+
+        Returns:
+          A dictionary with 'Sharpe Ratio', 'Daily Return', 'Daily Volatility', 'Calmar Ratio' and
+          'Sortino Ratio' (unformatted floats; NaN where undefined).
+        """
+        # Same time span as the datetimes the dashboard used to build, which are rounded to microseconds
+        total_seconds = (datetime.fromtimestamp(self.last_time) - datetime.fromtimestamp(self.first_time)).total_seconds()
+        total_days = total_seconds / (24 * 60 * 60)
+        if total_days == 0:
+            raise ValueError("Time span too short for daily calculation.")
+
+        std = self.returns.std()
+        sharpe_ratio = 0.0 if std == 0 else (self.returns.mean - self.rf_daily) / std
+        daily_return = self.growth ** (1 / total_days) - 1
+        calmar_ratio = daily_return / max_drawdown if max_drawdown != 0 else float("nan")
+        downside_vol = self.downside.std()
+        sortino_ratio = (daily_return - self.rf_daily) / downside_vol if downside_vol > 0 else float("nan")
+        return {
+            'Sharpe Ratio': sharpe_ratio,
+            'Daily Return': daily_return,
+            'Daily Volatility': std,
+            'Calmar Ratio': calmar_ratio,
+            'Sortino Ratio': sortino_ratio,
+        }
+
+
+# Test section
+if __name__ == "__main__":
+    import pandas as pd
+
+    def reference_ratios(times, equities, initial_equity, max_drawdown, risk_free_rate=0.02):
+        """
+        The ratios recomputed from the whole series with pandas.
+        """
+        returns = pd.Series(equities).pct_change()
+        returns.iloc[0] = equities[0] / initial_equity - 1
+        rf_daily = (1 + risk_free_rate) ** (1 / 260) - 1
+        excess_returns = returns - rf_daily
+        total_days = (datetime.fromtimestamp(times[-1]) - datetime.fromtimestamp(times[0])).total_seconds() / 86400
+        std = returns.std()
+        daily_return = (returns + 1).prod() ** (1 / total_days) - 1
+        downside_vol = excess_returns[excess_returns < 0].std()
+        return {
+            'Sharpe Ratio': 0.0 if std == 0 else excess_returns.mean() / std,
+            'Daily Return': daily_return,
+            'Daily Volatility': std,
+            'Calmar Ratio': daily_return / max_drawdown if max_drawdown != 0 else float("nan"),
+            'Sortino Ratio': (daily_return - rf_daily) / downside_vol if downside_vol > 0 else float("nan"),
+        }
+
+    rng = np.random.default_rng(0)
+    n = 200000
+    times = 1.7e9 + 5 * np.arange(n)
+    equities = 100000 * np.cumprod(1 + rng.normal(0, 1e-4, n))
+    strategy_returns = (equities / 100000 - 1) * 100
+
+    tracker = PerformanceTracker()
+    tracker.start(100000)
+    tracker.extend(times[:n // 2], strategy_returns[:n // 2], equities[:n // 2])
+    for i in range(n // 2, n):
+        tracker.add(times[i], strategy_returns[i], equities[i])
+
+    max_drawdown = float((np.maximum.accumulate(strategy_returns) - strategy_returns).max())
+    print(f"max drawdown: {tracker.max_drawdown:.12g} (reference {max_drawdown:.12g})")
+    expected = reference_ratios(times, equities, 100000, max_drawdown / 100)
+    for key, value in tracker.ratios(tracker.max_drawdown / 100).items():
+        print(f"{key}: {value:.12g} (reference {expected[key]:.12g})")
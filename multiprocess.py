@@ -1,5 +1,6 @@
 import multiprocessing
 import subprocess
+from rate_limiter import start_server
 
 def run_main():
     subprocess.run(["python", "main.py"])
@@ -8,6 +9,9 @@ def run_dashboard():
     subprocess.run(["python", "dashboard.py"])
 
 if __name__ == "__main__":
+    # Shared request rate limiter for both processes (its address is passed on in the environment)
+    rate_limiter = start_server()
+
     # create two processes  
     main_process = multiprocessing.Process(target=run_main)
     dashboard_process = multiprocessing.Process(target=run_dashboard)
@@ -19,3 +23,4 @@ if __name__ == "__main__":
     # wait for the processes to finish
     main_process.join()
     dashboard_process.join()
+    rate_limiter.shutdown()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+oanda_client.py - Shared OANDA Client Module
+
+This module hands out oandapyV20 API clients that share one keep-alive connection pool (requests.Session)
+per trading environment, so every module reuses the same TLS connections instead of opening its own.
+Clients apply connect/read timeouts and record the latency and error count of every request per endpoint
+type (e.g. InstrumentsCandles, OrderCreate); see get_request_stats and print_request_stats.
+Every request first takes a token from the shared rate limiter (rate_limiter.py): order and close requests
+with PRIORITY_ORDER, everything else with the process's default priority (see set_default_priority).
+
+The pricing stream (price_stream.py) keeps its own client: a stream holds its connection open indefinitely
+and would otherwise take a slot of the pool.
+"""
+
+import os
+import threading
+import time
+import requests
+from dotenv import load_dotenv
+from oandapyV20 import API
+from rate_limiter import get_scheduler, PRIORITY_ORDER, PRIORITY_SIGNAL
+
+load_dotenv()
+
+DEFAULT_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+DEFAULT_POOL_SIZE = 10
+
+# Endpoints that place or close orders; they are served first when requests are throttled
+ORDER_ENDPOINTS = {"OrderCreate", "OrderReplace", "OrderCancel", "PositionClose", "TradeClose", "TradeCRCDO"}
+default_priority = PRIORITY_SIGNAL
+
+_lock = threading.Lock()
+_sessions = {}  # {environment: (session, pool size)}
+_clients = {}  # {(environment, timeout): client}
+_stats = {}  # {endpoint name: {"count", "errors", "total_time", "max_time", "wait_time"}}
+
+
+class InstrumentedAPI(API):
+    """
+    oandapyV20.API that records the latency and errors of each request per endpoint type.
+    """
+
+    def request(self, endpoint):
+        name = type(endpoint).__name__
+        waited = get_scheduler().acquire(PRIORITY_ORDER if name in ORDER_ENDPOINTS else default_priority)
+        start = time.perf_counter()
+        error = False
+        try:
+            return super().request(endpoint)
+        except Exception:
+            error = True
+            raise
+        finally:
+            record_request(name, time.perf_counter() - start, error, waited or 0.0)
+
+
+def set_default_priority(priority):
+    """
+    Set the rate limiter priority of this process's non-order requests (e.g. PRIORITY_DASHBOARD).
+    """
+    global default_priority
+    default_priority = priority
+
+
+def record_request(name, elapsed, error=False, waited=0.0):
+    """
+    Add one request to the per-endpoint counters (elapsed excludes the time waited for the rate limiter).
+    """
+    with _lock:
+        stats = _stats.setdefault(name, {"count": 0, "errors": 0, "total_time": 0.0, "max_time": 0.0,
+                                         "wait_time": 0.0})
+        stats["count"] += 1
+        stats["errors"] += int(error)
+        stats["total_time"] += elapsed
+        stats["max_time"] = max(stats["max_time"], elapsed)
+        stats["wait_time"] += waited
+
+
+def _get_session(environment, pool_size):
+    # Called with _lock held
+    session, size = _sessions.get(environment, (None, 0))
+    if session is None:
+        session = requests.Session()
+    if pool_size > size:
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        size = pool_size
+    _sessions[environment] = (session, size)
+    return session
+
+
+def get_client(environment="practice", timeout=None, pool_size=None):
+    """
+    Return the shared client for an environment.
+
+    Parameters:
+      environment: The trading environment, "practice", "live" or a registered local environment.
+      timeout: Request timeout in seconds, or a (connect, read) tuple (default DEFAULT_TIMEOUT).
+               Clients with different timeouts still share the connection pool.
+      pool_size: Number of connections to keep open to the server; the pool grows to the largest size
+                 requested (default DEFAULT_POOL_SIZE).
+
+    Returns:
+      An InstrumentedAPI instance.
+    """
+    timeout = timeout or DEFAULT_TIMEOUT
+    with _lock:
+        session = _get_session(environment, max(pool_size or 0, DEFAULT_POOL_SIZE))
+        client = _clients.get((environment, timeout))
+        if client is None:
+            client = InstrumentedAPI(access_token=os.getenv('access_token'), environment=environment,
+                                     request_params={"timeout": timeout})
+            # oandapyV20 sets the authorization headers on its own session; carry them over
+            session.headers.update(client.client.headers)
+            session.stream = False
+            client.client.close()
+            client.client = session
+            _clients[(environment, timeout)] = client
+        return client
+
+
+def get_request_stats():
+    """
+    Returns:
+      A dictionary {endpoint name: {"count", "errors", "mean_ms", "max_ms", "mean_wait_ms"}}.
+    """
+    with _lock:
+        return {
+            name: {
+                "count": stats["count"],
+                "errors": stats["errors"],
+                "mean_ms": stats["total_time"] / stats["count"] * 1000,
+                "max_ms": stats["max_time"] * 1000,
+                "mean_wait_ms": stats["wait_time"] / stats["count"] * 1000,
+            }
+            for name, stats in _stats.items()
+        }
+
+
+def print_request_stats():
+    for name, stats in sorted(get_request_stats().items()):
+        print(f"{name:<20} requests: {stats['count']:>6}  errors: {stats['errors']:>4}  "
+              f"mean: {stats['mean_ms']:7.1f} ms  max: {stats['max_ms']:7.1f} ms  "
+              f"throttled: {stats['mean_wait_ms']:6.1f} ms")
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+"""
+price_stream.py - Streaming Price Feed Module
+
+This module consumes the OANDA pricing stream and builds candles locally instead of polling
+InstrumentsCandles and PricingInfo:
+  - BarAggregator turns price ticks into completed mid-price candles for one or more granularities
+    (S5 and coarser). A candle is completed by the first tick of the next period, or by a heartbeat
+    once its period has ended.
+  - PriceStreamFeed runs the stream in a background thread, keeps the latest bid/ask per instrument,
+    and pushes completed candles into a LiveStrategy created with streaming=True.
+The stream reconnects automatically. Candles missed while disconnected are recovered by a full REST fetch
+on the next update_signal call.
+
+For offline testing, run stream_server.py and use environment="local" (see stream_server.register_environment).
+"""
+
+import os
+import threading
+import time
+import calendar
+from datetime import datetime
+from oandapyV20 import API
+import oandapyV20.endpoints.pricing as pricing
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Candle length in seconds for the supported granularities
+GRANULARITY_SECONDS = {
+    "S5": 5, "S10": 10, "S15": 15, "S30": 30,
+    "M1": 60, "M2": 120, "M4": 240, "M5": 300, "M10": 600, "M15": 900, "M30": 1800,
+    "H1": 3600,
+}
+
+
+def parse_time(value):
+    """
+    Convert an OANDA RFC3339 timestamp (e.g. '2024-01-01T00:00:05.123456789Z') to Unix seconds.
+    """
+    seconds, _, fraction = value.rstrip("Z").partition(".")
+    timestamp = calendar.timegm(datetime.strptime(seconds, "%Y-%m-%dT%H:%M:%S").timetuple())
+    if fraction:
+        timestamp += float("0." + fraction)
+    return timestamp
+
+
+def format_time(timestamp):
+    """
+    Convert Unix seconds to the RFC3339 format OANDA uses for candle times.
+    """
+    whole = int(timestamp)
+    nanos = int(round((timestamp - whole) * 1e9))
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(whole)) + f".{nanos:09d}Z"
+
+
+class BarAggregator:
+    """
+    Aggregate price ticks into OANDA-style mid-price candles.
+    """
+
+    def __init__(self, granularities=("S5",)):
+        """
+        Parameters:
+          granularities: The candle granularities to build, e.g. ['S5', 'M1'].
+        """
+        for granularity in granularities:
+            if granularity not in GRANULARITY_SECONDS:
+                raise ValueError(f"Unsupported granularity for streaming candles: {granularity}")
+        self.granularities = list(granularities)
+        self.bars = {}  # {(instrument, granularity): bar in progress}
+
+    def _complete(self, key):
+        bar = self.bars.pop(key)
+        candle = {
+            "complete": True,
+            "volume": bar["volume"],
+            "time": format_time(bar["start"]),
+            "mid": {"o": str(bar["o"]), "h": str(bar["h"]), "l": str(bar["l"]), "c": str(bar["c"])},
+        }
+        return key[0], key[1], candle
+
+    def on_tick(self, instrument, timestamp, price):
+        """
+        Add a tick and return the candles it completed as a list of (instrument, granularity, candle).
+        """
+        completed = []
+        for granularity in self.granularities:
+            seconds = GRANULARITY_SECONDS[granularity]
+            start = int(timestamp // seconds) * seconds
+            key = (instrument, granularity)
+            bar = self.bars.get(key)
+            if bar is not None and bar["start"] != start:
+                if start < bar["start"]:
+                    # Late tick for an earlier period; that candle is already final
+                    continue
+                completed.append(self._complete(key))
+                bar = None
+            if bar is None:
+                self.bars[key] = {"start": start, "o": price, "h": price, "l": price, "c": price, "volume": 1}
+            else:
+                bar["h"] = max(bar["h"], price)
+                bar["l"] = min(bar["l"], price)
+                bar["c"] = price
+                bar["volume"] += 1
+        return completed
+
+    def on_heartbeat(self, timestamp):
+        """
+        Complete every candle whose period ended before the given time.
+        """
+        completed = []
+        for key, bar in list(self.bars.items()):
+            if bar["start"] + GRANULARITY_SECONDS[key[1]] <= timestamp:
+                completed.append(self._complete(key))
+        return completed
+
+
+class PriceStreamFeed:
+    """
+    Background consumer of the OANDA pricing stream.
+    """
+
+    def __init__(self, instruments, granularities=("S5",), environment="practice", stream_timeout=15,
+                 reconnect_delay=1):
+        """
+        Parameters:
+          instruments: A list of currency pairs, e.g., ['EUR_USD', 'GBP_USD', ...].
+          granularities: The candle granularities to build from the stream.
+          environment: The trading environment, "practice", "live" or a registered local environment.
+          stream_timeout: Seconds without any message (OANDA sends heartbeats every 5 s) before reconnecting.
+          reconnect_delay: Seconds to wait before reconnecting after an error.
+        """
+        if isinstance(instruments, str):
+            instruments = [instruments]
+        self.instruments = instruments
+        self.aggregator = BarAggregator(granularities)
+        self.reconnect_delay = reconnect_delay
+
+        self.access_token = os.getenv('access_token')
+        self.account_id = os.getenv('account_id')
+        self.client = API(access_token=self.access_token, environment=environment,
+                          request_params={"timeout": stream_timeout})
+
+        self.latest_prices = {}  # {instrument: {"bid": bid, "ask": ask, "time": timestamp}}
+        self.listeners = []
+        self.price_listeners = []
+        self.disconnect_listeners = []
+        self.running = False
+        self.thread = None
+        self.request = None
+
+    def attach(self, strategy):
+        """
+        Push completed candles of the strategy's granularity into a LiveStrategy created with streaming=True.
+        """
+        def on_candle(instrument, granularity, candle):
+            if granularity == strategy.granularity:
+                strategy.on_candle(instrument, candle)
+        self.listeners.append(on_candle)
+        self.disconnect_listeners.append(strategy.reset_candle_buffers)
+
+    def add_listener(self, callback):
+        """
+        Register callback(instrument, granularity, candle), called for each completed candle.
+        """
+        self.listeners.append(callback)
+
+    def add_price_listener(self, callback):
+        """
+        Register callback(instrument, bid, ask), called for every price update (e.g. ExitEngine.on_price).
+        """
+        self.price_listeners.append(callback)
+
+    def get_current_prices(self, instruments):
+        """
+        Same contract as risk_manager.get_current_prices, served from the stream instead of PricingInfo.
+
+        Returns:
+          A dictionary in the format {instrument: bid price}, or None if no prices have been received.
+        """
+        if not isinstance(instruments, list):
+            instruments = [instruments]
+        prices = {inst: self.latest_prices[inst]["bid"] for inst in instruments if inst in self.latest_prices}
+        return prices or None
+
+    def _publish(self, completed):
+        for instrument, granularity, candle in completed:
+            for callback in self.listeners:
+                try:
+                    callback(instrument, granularity, candle)
+                except Exception as e:
+                    print(f"Error handling streamed candle for {instrument}: {e}")
+
+    def handle_message(self, message):
+        """
+        Process one message from the pricing stream.
+        """
+        if message.get("type") == "HEARTBEAT":
+            self._publish(self.aggregator.on_heartbeat(parse_time(message["time"])))
+            return
+        if message.get("type") != "PRICE" or not message.get("bids") or not message.get("asks"):
+            return
+        instrument = message["instrument"]
+        timestamp = parse_time(message["time"])
+        bid = float(message["bids"][0]["price"])
+        ask = float(message["asks"][0]["price"])
+        self.latest_prices[instrument] = {"bid": bid, "ask": ask, "time": timestamp}
+        for callback in self.price_listeners:
+            try:
+                callback(instrument, bid, ask)
+            except Exception as e:
+                print(f"Error handling streamed price for {instrument}: {e}")
+        self._publish(self.aggregator.on_tick(instrument, timestamp, (bid + ask) / 2))
+
+    def run(self):
+        """
+        Consume the pricing stream until stop() is called, reconnecting after errors.
+        """
+        params = {"instruments": ",".join(self.instruments)}
+        while self.running:
+            try:
+                self.request = pricing.PricingStream(accountID=self.account_id, params=params)
+                for message in self.client.request(self.request):
+                    if not self.running:
+                        break
+                    self.handle_message(message)
+            except Exception as e:
+                if self.running:
+                    print(f"Price stream disconnected: {e}")
+            if self.running:
+                # Candles may have been missed while disconnected
+                self.aggregator.bars.clear()
+                for callback in self.disconnect_listeners:
+                    callback()
+                time.sleep(self.reconnect_delay)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+
+# Test section
+if __name__ == "__main__":
+    from strategy import LiveStrategy
+    from stream_server import StreamServer, register_environment
+
+    instruments = ['EUR_USD', 'GBP_USD', 'USD_JPY', 'AUD_USD', 'USD_CAD']
+    server = StreamServer(instruments, port=8081)
+    server.start()
+    register_environment("127.0.0.1", 8081)
+
+    strategy = LiveStrategy(instruments=instruments, lookback_count=200, stma_period=30, ltma_period=40,
+                            rsi_period=10, granularity='S5', environment="local", streaming=True)
+    feed = PriceStreamFeed(instruments, granularities=['S5', 'M1'], environment="local")
+    feed.attach(strategy)
+    feed.start()
+
+    while True:
+        output = strategy.update_signal()
+        print(f"Current output: {output}")
+        print(f"Current prices: {feed.get_current_prices(instruments)}")
+        time.sleep(5)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+"""
+rate_limiter.py - Shared Request Rate Limiter Module
+
+This module keeps the OANDA request rate of all our processes under one token bucket. Every request takes a
+token before it is sent. Tokens refill at a fixed rate up to a burst size, and when requests have to wait
+they are served by priority:
+  PRIORITY_ORDER     - order placement, trade and position closes
+  PRIORITY_SIGNAL    - candle fetches, prices and account polling of the trading loop
+  PRIORITY_DASHBOARD - dashboard polling
+then in arrival order within a priority.
+
+multiprocess.py hosts the bucket in a multiprocessing manager (start_server) and passes its address to
+main.py and dashboard.py in environment variables; get_scheduler connects to it there. A process started
+on its own gets a local bucket instead.
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from multiprocessing.managers import BaseManager
+
+PRIORITY_ORDER = 0
+PRIORITY_SIGNAL = 1
+PRIORITY_DASHBOARD = 2
+
+# OANDA allows about 120 requests per second per connection; stay below it
+DEFAULT_RATE = 100
+DEFAULT_BURST = 20
+
+ADDRESS_ENV = "OANDA_RATE_LIMITER_ADDRESS"
+AUTHKEY_ENV = "OANDA_RATE_LIMITER_AUTHKEY"
+
+
+class TokenBucketScheduler:
+    """
+    Token bucket that hands out tokens to waiting requests in priority order.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        """
+        Parameters:
+          rate: Tokens (requests) added per second.
+          burst: Maximum number of tokens, i.e. the largest burst sent without waiting.
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.condition = threading.Condition()
+        self.waiting = []  # heap of (priority, arrival number)
+        self.arrivals = itertools.count()
+        self.counts = {}  # {priority: [requests, total wait, max wait, timeouts]}
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self, priority=PRIORITY_SIGNAL, timeout=None):
+        """
+        Wait for a token.
+
+        Parameters:
+          priority: PRIORITY_ORDER, PRIORITY_SIGNAL or PRIORITY_DASHBOARD (lower is served first).
+          timeout: Maximum seconds to wait (None waits as long as needed).
+
+        Returns:
+          The seconds waited, or None if the timeout expired.
+        """
+        start = time.monotonic()
+        entry = (priority, next(self.arrivals))
+        with self.condition:
+            heapq.heappush(self.waiting, entry)
+            while True:
+                self._refill()
+                if self.waiting[0] == entry and self.tokens >= 1:
+                    self.tokens -= 1
+                    heapq.heappop(self.waiting)
+                    # Let the next request in line check the bucket
+                    self.condition.notify_all()
+                    waited = time.monotonic() - start
+                    self._count(priority, waited)
+                    return waited
+                delay = (1 - self.tokens) / self.rate if self.waiting[0] == entry else None
+                if timeout is not None:
+                    remaining = start + timeout - time.monotonic()
+                    if remaining <= 0:
+                        self.waiting.remove(entry)
+                        heapq.heapify(self.waiting)
+                        self.condition.notify_all()
+                        self._count(priority, time.monotonic() - start, timed_out=True)
+                        return None
+                    delay = remaining if delay is None else min(delay, remaining)
+                self.condition.wait(delay)
+
+    def _count(self, priority, waited, timed_out=False):
+        counts = self.counts.setdefault(priority, [0, 0.0, 0.0, 0])
+        counts[0] += 1
+        counts[1] += waited
+        counts[2] = max(counts[2], waited)
+        counts[3] += int(timed_out)
+
+    def stats(self):
+        """
+        Returns:
+          A dictionary {priority: {"requests", "mean_wait_ms", "max_wait_ms", "timeouts"}}.
+        """
+        with self.condition:
+            return {
+                priority: {
+                    "requests": requests,
+                    "mean_wait_ms": total / requests * 1000,
+                    "max_wait_ms": longest * 1000,
+                    "timeouts": timeouts,
+                }
+                for priority, (requests, total, longest, timeouts) in self.counts.items()
+            }
+
+
+# ---------------------------------------------------------------------- #
+# Sharing the bucket between processes
+
+_shared_scheduler = None
+_local_scheduler = None
+_lock = threading.Lock()
+
+
+def _init_server(rate, burst):
+    global _shared_scheduler
+    _shared_scheduler = TokenBucketScheduler(rate, burst)
+
+
+def _get_shared_scheduler():
+    return _shared_scheduler
+
+
+class RateLimitManager(BaseManager):
+    pass
+
+
+RateLimitManager.register("scheduler", callable=_get_shared_scheduler)
+
+
+def start_server(rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+    """
+    Start the shared bucket in a manager process and publish its address in the environment, so processes
+    started afterwards (e.g. with subprocess) use it through get_scheduler.
+
+    Returns:
+      The started RateLimitManager; call shutdown() on it when done.
+    """
+    authkey = os.urandom(16)
+    manager = RateLimitManager(address=("127.0.0.1", 0), authkey=authkey)
+    manager.start(_init_server, (rate, burst))
+    host, port = manager.address
+    os.environ[ADDRESS_ENV] = f"{host}:{port}"
+    os.environ[AUTHKEY_ENV] = authkey.hex()
+    return manager
+
+
+def get_scheduler():
+    """
+    Return the shared bucket if this process was started under start_server, otherwise a bucket local to
+    this process.
+    """
+    global _local_scheduler
+    with _lock:
+        if _local_scheduler is None:
+            address = os.getenv(ADDRESS_ENV)
+            if address:
+                host, port = address.rsplit(":", 1)
+                try:
+                    manager = RateLimitManager(address=(host, int(port)),
+                                               authkey=bytes.fromhex(os.getenv(AUTHKEY_ENV, "")))
+                    manager.connect()
+                    _local_scheduler = manager.scheduler()
+                except Exception as e:
+                    print(f"Could not connect to the shared rate limiter at {address}: {e}")
+            if _local_scheduler is None:
+                _local_scheduler = TokenBucketScheduler()
+        return _local_scheduler
+
+
+# Test section
+if __name__ == "__main__":
+    bucket = TokenBucketScheduler(rate=20, burst=5)
+    served = []
+
+    def worker(priority, name):
+        for _ in range(10):
+            bucket.acquire(priority)
+            served.append(name)
+
+    threads = [threading.Thread(target=worker, args=(p, n))
+               for p, n in ((PRIORITY_DASHBOARD, "dashboard"), (PRIORITY_SIGNAL, "signal"), (PRIORITY_ORDER, "order"))]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"30 requests at 20/s (burst 5) in {time.time() - start:.2f} s")
+    print("Service order:", " ".join(name[0] for name in served))
+    print(bucket.stats())
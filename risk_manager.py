@@ -4,17 +4,24 @@ risk_manager.py - Risk Management Module
 
 This module provides functions for retrieving prices, account balance, computing order parameters,
 placing market orders, querying open positions, calculating unrealized PnL, and closing trades.
+Orders, closes and account queries go to the execution backend (see use_execution_backend), prices to
+the OANDA client.
 """
 
 import os
+import time
+import numpy as np
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import oandapyV20
 import oandapyV20.endpoints.positions as positions
 import oandapyV20.endpoints.orders as orders
 import oandapyV20.endpoints.trades as trades
 import oandapyV20.endpoints.pricing as pricing
 from oandapyV20.endpoints.accounts import AccountDetails
 from oandapyV20.exceptions import V20Error
+from oanda_client import get_client
+from latency import recorder
 # Uncomment the following lines for email notifications if needed
 # from notification import send_email_notification
 
@@ -24,7 +31,60 @@ access_token = os.getenv('access_token')
 account_id = os.getenv('account_id')
 accountID = account_id  # Ensure global variable consistency
 
-client = oandapyV20.API(access_token=access_token, environment="practice")
+client = get_client("practice")
+
+# Sign of the position for each trade direction
+SIDES = {"BUY": 1, "SELL": -1}
+
+# Optional account_state.AccountState serving balance and positions from memory (see use_account_state)
+account_state = None
+
+# Optional execution backend, e.g. an execution.PaperBroker (see use_execution_backend); None uses 'client'
+execution_backend = None
+
+# Optional instrument_metadata.InstrumentMetadata giving the price precision of every instrument
+# (see use_instrument_metadata)
+instrument_metadata = None
+
+
+def use_account_state(state):
+    """
+    Serve get_current_balance and get_open_positions from an AccountState cache instead of the REST API.
+    Pass None to go back to direct requests.
+    """
+    global account_state
+    account_state = state
+
+
+def use_execution_backend(backend):
+    """
+    Send orders, closes and account queries to another backend with the oandapyV20.API request method,
+    e.g. an execution.PaperBroker for paper trading. Pass None to execute on the OANDA account again.
+    """
+    global execution_backend
+    execution_backend = backend
+
+
+def _execution_client():
+    return execution_backend if execution_backend is not None else client
+
+
+def use_instrument_metadata(metadata):
+    """
+    Take instrument precisions from an InstrumentMetadata index instead of the built-in table.
+    Pass None to go back to the table.
+    """
+    global instrument_metadata
+    instrument_metadata = metadata
+    _precision_array.cache_clear()
+
+
+def refresh_account_state():
+    """
+    Bring the account state cache (if any) up to date after orders or closes.
+    """
+    if account_state is not None:
+        account_state.refresh()
 
 
 def get_current_prices(instruments):
@@ -62,15 +122,43 @@ def get_current_prices(instruments):
         return None
 
 
+def get_current_quotes(instruments):
+    """
+    Retrieve the current bid and ask prices for a list of currency pairs in bulk.
+
+    Returns:
+      A dictionary in the format {instrument: (bid, ask)}. Returns None if the request fails.
+    """
+    if not isinstance(instruments, list):
+        instruments = [instruments]
+    params = {"instruments": ",".join(instruments)}
+    try:
+        response = client.request(pricing.PricingInfo(accountID=account_id, params=params))
+        return {
+            price_info['instrument']: (float(price_info['bids'][0]['price']), float(price_info['asks'][0]['price']))
+            for price_info in response.get('prices', [])
+            if price_info.get('bids') and price_info.get('asks')
+        }
+    except Exception as e:
+        print(f"Error retrieving prices: {e}")
+        return None
+
+
 def get_instrument_precision(instrument):
     """
-    Return the decimal precision for the given currency pair (e.g., EUR_USD has 4 decimal places,
-    USD_JPY has 2 decimal places).
+    Return the decimal precision for the given currency pair: the display precision from the instrument
+    metadata if registered (see use_instrument_metadata), otherwise from a built-in table (e.g., EUR_USD has
+    4 decimal places, USD_JPY has 2 decimal places).
     """
+    if instrument_metadata is not None:
+        precision = instrument_metadata.precision(instrument)
+        if precision is not None:
+            return precision
     instrument_precision = {
         "EUR_USD": 4,
         "AUD_USD": 4,
         "NZD_USD": 4,
+        "USD_CAD": 4,
         "GBP_USD": 4,
         "GBP_JPY": 2,
         "USD_JPY": 2,
@@ -84,9 +172,14 @@ def get_current_balance():
     """
     Retrieve the current account balance.
     """
+    if account_state is not None:
+        balance = account_state.get_balance()
+        if balance is not None:
+            print(f"Current account balance: {balance}")
+            return balance
     try:
         request = AccountDetails(accountID=accountID)
-        response = client.request(request)
+        response = _execution_client().request(request)
         if response and 'account' in response:
             balance = float(response['account']['balance'])
             print(f"Current account balance: {balance}")
@@ -102,7 +195,7 @@ def get_quantities(instruments, trade_directions, rsi_dict, rsi_weight_param=1):
     in bulk based on current prices, available account funds, preset percentages, and each pair's RSI data.
 
     Parameters:
-      instruments: A list of currency pairs (must be 5 pairs).
+      instruments: A list of currency pairs (any number).
       trade_directions: A dictionary where keys are currency pairs and values are "BUY" or "SELL", e.g.:
           {
               "EUR_USD": "BUY",
@@ -150,8 +243,31 @@ def get_quantities(instruments, trade_directions, rsi_dict, rsi_weight_param=1):
         print("Unable to obtain account balance; cannot compute order parameters")
         return None
 
-    take_profit_percentage = 0.01  # 1%
-    stop_loss_percentage = 0.005      # 0.5%
+    return compute_order_params_batch(instruments, trade_directions, rsi_dict, prices, available_cash,
+                                      rsi_weight_param=rsi_weight_param)
+
+
+def compute_order_params(instruments, trade_directions, rsi_dict, prices, available_cash, rsi_weight_param=1,
+                         take_profit_percentage=0.01, stop_loss_percentage=0.005, verbose=True):
+    """
+    Compute stop loss price, take profit price and position size for each currency pair from already known
+    prices and available funds. This is the calculation behind get_quantities (see its docstring for the
+    weighting and sizing rules); it makes no API calls, so it is also used by the backtester.
+
+    Parameters:
+      instruments: A list of currency pairs.
+      trade_directions: A dictionary {currency_pair: "BUY" or "SELL"}.
+      rsi_dict: A dictionary {currency_pair: RSI value}.
+      prices: A dictionary {currency_pair: current price}.
+      available_cash: Funds available for allocation.
+      rsi_weight_param: RSI weighting parameter (default is 1).
+      take_profit_percentage: Take profit distance as a fraction of the price (default 1%).
+      stop_loss_percentage: Stop loss distance as a fraction of the price (default 0.5%).
+      verbose: If True, print the per-instrument results and problems.
+
+    Returns:
+      A dictionary in the format {currency_pair: (stop_loss_price, take_profit_price, position_size)}.
+    """
     quantities = {}
 
     # Calculate weights separately for BUY and SELL signals.
@@ -160,7 +276,8 @@ def get_quantities(instruments, trade_directions, rsi_dict, rsi_weight_param=1):
     for inst in instruments:
         direction = trade_directions.get(inst)
         if inst not in rsi_dict:
-            print(f"{inst} is missing RSI data")
+            if verbose:
+                print(f"{inst} is missing RSI data")
             continue
         current_rsi = rsi_dict[inst]
         weight = max(70 - current_rsi, 0) ** rsi_weight_param
@@ -168,7 +285,7 @@ def get_quantities(instruments, trade_directions, rsi_dict, rsi_weight_param=1):
             buy_weights[inst] = weight
         elif direction == "SELL":
             sell_weights[inst] = weight
-        else:
+        elif verbose:
             print(f"{inst} has an invalid trade direction")
     total_buy_weight = sum(buy_weights.values()) if buy_weights else 0
     total_sell_weight = sum(sell_weights.values()) if sell_weights else 0
@@ -176,7 +293,8 @@ def get_quantities(instruments, trade_directions, rsi_dict, rsi_weight_param=1):
     for inst in instruments:
         current_price = prices.get(inst)
         if current_price is None:
-            print(f"{inst} has no current price; unable to compute order parameters")
+            if verbose:
+                print(f"{inst} has no current price; unable to compute order parameters")
             continue
 
         precision = get_instrument_precision(inst)
@@ -198,12 +316,92 @@ def get_quantities(instruments, trade_directions, rsi_dict, rsi_weight_param=1):
                 allocation = 0
             quantity = -round(allocation / current_price, 0)
         else:
-            print(f"{inst} has an invalid trade direction")
+            if verbose:
+                print(f"{inst} has an invalid trade direction")
             continue
 
         quantities[inst] = (stop_loss_price, take_profit_price, quantity)
-        print(f"{inst} Calculation result: StopLoss={stop_loss_price}, TakeProfit={take_profit_price}, Quantity={quantity}")
+        if verbose:
+            print(f"{inst} Calculation result: StopLoss={stop_loss_price}, TakeProfit={take_profit_price}, Quantity={quantity}")
+
+    return quantities
+
+
+@lru_cache(maxsize=32)
+def _precision_array(instruments):
+    return np.array([get_instrument_precision(inst) for inst in instruments], dtype=np.float64)
+
+
+def round_prices(values, precision):
+    """
+    Round each value to its own number of decimals, with the same result as Python's round(value, precision).
+    np.rint(value * 10**precision) is exact except next to a rounding tie, so those few values are rounded
+    with round() instead.
+    """
+    scale = 10.0 ** precision
+    scaled = values * scale
+    rounded = np.rint(scaled) / scale
+    near_tie = np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie).tolist():
+        rounded[i] = round(float(values[i]), int(precision[i]))
+    return rounded
+
 
+def compute_order_params_batch(instruments, trade_directions, rsi_dict, prices, available_cash, rsi_weight_param=1,
+                               take_profit_percentage=0.01, stop_loss_percentage=0.005, verbose=True):
+    """
+    Vectorized version of compute_order_params for large instrument lists: weights, allocations, take profit
+    and stop loss levels and quantities are computed for all instruments as arrays in one pass, and each
+    price is rounded to its instrument's precision. Parameters and return value are the same as for
+    compute_order_params, and so are the results.
+    """
+    instruments = tuple(instruments)
+    n = len(instruments)
+    if n == 0:
+        return {}
+    rsi_values = [rsi_dict.get(inst) for inst in instruments]
+    has_rsi = np.fromiter((value is not None for value in rsi_values), dtype=bool, count=n)
+    rsi = np.fromiter((70.0 if value is None else value for value in rsi_values), dtype=np.float64, count=n)
+    price = np.fromiter((prices.get(inst, np.nan) for inst in instruments), dtype=np.float64, count=n)
+    side = np.fromiter((SIDES.get(trade_directions.get(inst), 0) for inst in instruments), dtype=np.float64, count=n)
+    buy = side > 0
+    sell = side < 0
+
+    # Instruments without RSI data keep a zero weight, as in compute_order_params
+    weight = np.where(has_rsi, np.maximum(70 - rsi, 0) ** rsi_weight_param, 0.0)
+    # Sequential sums (cumsum) so the totals match the scalar path bit for bit
+    total_buy = np.cumsum(np.where(buy, weight, 0.0))[-1]
+    total_sell = np.cumsum(np.where(sell, weight, 0.0))[-1]
+    total = np.where(buy, total_buy, total_sell)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        allocation = np.where(total > 0, available_cash * (weight / total), 0.0)
+        quantity = np.round(allocation / price, 0) * np.where(sell, -1.0, 1.0)
+
+    precision = _precision_array(instruments)
+    take_profit = round_prices(price * (1 + side * take_profit_percentage), precision)
+    stop_loss = round_prices(price * (1 - side * stop_loss_percentage), precision)
+
+    valid = (side != 0) & ~np.isnan(price)
+    quantities = {
+        inst: (sl, tp, qty)
+        for inst, ok, sl, tp, qty in zip(instruments, valid.tolist(), stop_loss.tolist(), take_profit.tolist(),
+                                         quantity.tolist())
+        if ok
+    }
+    if verbose:
+        for inst, ok, direction_ok in zip(instruments, has_rsi.tolist(), (side != 0).tolist()):
+            if not ok:
+                print(f"{inst} is missing RSI data")
+            elif not direction_ok:
+                print(f"{inst} has an invalid trade direction")
+        for inst, no_price in zip(instruments, np.isnan(price).tolist()):
+            if inst in quantities:
+                stop_loss_price, take_profit_price, qty = quantities[inst]
+                print(f"{inst} Calculation result: StopLoss={stop_loss_price}, TakeProfit={take_profit_price}, Quantity={qty}")
+            elif no_price:
+                print(f"{inst} has no current price; unable to compute order parameters")
+            else:
+                print(f"{inst} has an invalid trade direction")
     return quantities
 
 
@@ -211,9 +409,14 @@ def get_open_positions():
     """
     Query all currently open positions.
     """
+    if account_state is not None:
+        open_positions = account_state.get_open_positions()
+        if open_positions is not None:
+            print(f"Number of open positions: {len(open_positions)}")
+            return open_positions
     try:
         request = positions.OpenPositions(accountID=account_id)
-        response = client.request(request)
+        response = _execution_client().request(request)
         open_positions = response.get("positions", [])
         print(f"Number of open positions: {len(open_positions)}")
         return open_positions
@@ -244,43 +447,89 @@ def calculate_total_unrealised_pnl(positions_dict):
     return long_pnl, short_pnl, total_pnl
 
 
-def place_market_orders(order_dict):
+def submit_market_order(inst, units, tp, sl):
     """
-    Place market orders in bulk with attached take profit and stop loss orders.
-    
-    Parameters:
-      order_dict: A dictionary where keys are instruments and values are tuples of
-                  (units, take_profit_price, stop_loss_price).
+    Submit one market order with attached take profit and stop loss orders.
+
+    Returns:
+      A dictionary with the fill price, trade ID, request latency (in seconds) and the time (time.time()) the
+      fill or cancel was acknowledged. Price and trade ID are None if the order was not filled; 'error'
+      holds the reason. The latency is also recorded as an "order_submit" span (see latency.py).
     """
-    for inst, (units, tp, sl) in order_dict.items():
-        data = {
-            "order": {
-                "units": str(units),
-                "instrument": inst,
-                "timeInForce": "FOK",
-                "type": "MARKET",
-                "positionFill": "DEFAULT",
-                "takeProfitOnFill": {
-                    "price": str(float(tp)),
-                },
-                "stopLossOnFill": {
-                    "price": str(float(sl)),
-                }
+    data = {
+        "order": {
+            "units": str(units),
+            "instrument": inst,
+            "timeInForce": "FOK",
+            "type": "MARKET",
+            "positionFill": "DEFAULT",
+            "takeProfitOnFill": {
+                "price": str(float(tp)),
+            },
+            "stopLossOnFill": {
+                "price": str(float(sl)),
             }
         }
-        try:
-            request = orders.OrderCreate(accountID, data=data)
-            response = client.request(request)
+    }
+    result = {"price": None, "trade_id": None, "latency": None, "acknowledged_at": None, "error": None}
+    start = time.perf_counter()
+    try:
+        request = orders.OrderCreate(accountID, data=data)
+        response = _execution_client().request(request)
+        result["latency"] = time.perf_counter() - start
+        result["acknowledged_at"] = time.time()
+        recorder.record("order_submit", result["latency"], inst)
+        fill = response.get("orderFillTransaction")
+        if fill:
+            result["price"] = float(fill["price"])
+            result["trade_id"] = fill.get("tradeOpened", {}).get("tradeID")
             # print(f"Order for {inst} submitted successfully: {response}")
             print(f"Order for {inst} submitted successfully!")
-        except V20Error as e:
-            print(f"Error submitting order for {inst}: {e}")
+        else:
+            result["error"] = response.get("orderCancelTransaction", {}).get("reason", "not filled")
+            print(f"Order for {inst} was not filled: {result['error']}")
+    except Exception as e:
+        result["latency"] = time.perf_counter() - start
+        result["error"] = str(e)
+        print(f"Error submitting order for {inst}: {e}")
+    return result
 
 
-def close_all_trades(client, account_id):
+def place_market_orders(order_dict, max_workers=1):
+    """
+    Place market orders in bulk with attached take profit and stop loss orders.
+    
+    Parameters:
+      order_dict: A dictionary where keys are instruments and values are tuples of
+                  (units, take_profit_price, stop_loss_price).
+      max_workers: Maximum number of orders in flight at once. With more than one worker the orders of the
+                   batch are submitted in parallel, so the last order goes out about one round trip after
+                   the first instead of one round trip per order.
+
+    Returns:
+      A dictionary in the format {instrument: result}, where result is returned by submit_market_order.
+    """
+    if max_workers <= 1 or len(order_dict) <= 1:
+        results = {inst: submit_market_order(inst, units, tp, sl) for inst, (units, tp, sl) in order_dict.items()}
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(order_dict))) as executor:
+            futures = {inst: executor.submit(submit_market_order, inst, units, tp, sl)
+                       for inst, (units, tp, sl) in order_dict.items()}
+            results = {inst: future.result() for inst, future in futures.items()}
+    refresh_account_state()
+    return results
+
+
+def close_all_trades(client=None, account_id=None):
     """
     Close all open trades.
+
+    Parameters:
+      client: The client to close them with (default: the execution backend).
+      account_id: The account whose trades are closed (default: this module's account).
     """
+    client = client or _execution_client()
+    account_id = account_id or accountID
     try:
         trades_request = trades.OpenTrades(accountID=account_id)
         response = client.request(trades_request)
@@ -300,6 +549,7 @@ def close_all_trades(client, account_id):
             print("There are no open trades.")
     except Exception as e:
         print(f"Error while closing all trades: {e}")
+    refresh_account_state()
 
 
 def close_position(instrument):
@@ -317,10 +567,10 @@ def close_position(instrument):
     data = {"longUnits": "ALL", "shortUnits": "ALL"}
     try:
         request = PositionClose(accountID, instrument=instrument, data=data)
-        response = client.request(request)
+        response = _execution_client().request(request)
         # print(f"Position for {instrument} closed successfully: {response}")
         print(f"Position for {instrument} closed successfully")
-
+        refresh_account_state()
         return response
     except Exception as e:
         print(f"Error closing position for {instrument}: {e}")
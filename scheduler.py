@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+scheduler.py - Candle-Aligned Scheduler Module
+
+This module runs a callback once per completed candle: CandleScheduler sleeps until just after the next
+granularity boundary (plus a configurable slack that gives OANDA time to publish the completed candle),
+then calls the callback with the boundary time. It records how late each wake-up was (jitter) and counts
+overruns, i.e. cycles that were still running when the next candle closed; the candles missed that way are
+skipped instead of being processed late.
+"""
+
+import time
+import numpy as np
+from price_stream import GRANULARITY_SECONDS
+
+
+class CandleScheduler:
+    def __init__(self, granularity, slack=0.5, history=1000):
+        """
+        Parameters:
+          granularity: The candle granularity to align to, e.g. 'S5', 'M1' or 'H1'.
+          slack: Seconds to wait after each boundary before running the callback.
+          history: Number of recent cycles kept for the jitter and duration statistics.
+        """
+        if granularity not in GRANULARITY_SECONDS:
+            raise ValueError(f"Unsupported granularity for scheduling: {granularity}")
+        self.granularity = granularity
+        self.period = GRANULARITY_SECONDS[granularity]
+        self.slack = slack
+        self.history = history
+        self.jitter = []  # seconds between the scheduled and the actual wake-up
+        self.durations = []  # seconds spent in the callback
+        self.cycles = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.last_boundary = None
+
+    def next_boundary(self, now):
+        """
+        The first candle boundary (Unix seconds) after 'now'.
+        """
+        return (int(now // self.period) + 1) * self.period
+
+    def wait(self):
+        """
+        Sleep until the slack after the next boundary.
+
+        Returns:
+          The boundary time, i.e. the close time of the candle that has just completed.
+        """
+        now = time.time()
+        boundary = self.next_boundary(now - self.slack)
+        if self.last_boundary is not None and boundary - self.period > self.last_boundary:
+            # The previous cycle ran past one or more boundaries
+            self.overruns += 1
+            self.skipped += int((boundary - self.period - self.last_boundary) // self.period)
+        target = boundary + self.slack
+        if target > now:
+            time.sleep(target - now)
+        self._record(self.jitter, time.time() - target)
+        self.last_boundary = boundary
+        return boundary
+
+    def _record(self, values, value):
+        values.append(value)
+        if len(values) > self.history:
+            del values[:len(values) - self.history]
+
+    def run_once(self, callback):
+        """
+        Wait for the next boundary and run callback(boundary); exceptions are printed, not raised.
+        """
+        boundary = self.wait()
+        start = time.time()
+        try:
+            callback(boundary)
+        except Exception as e:
+            print(f"Error in scheduled cycle for candle closing at {boundary}: {e}")
+        self.cycles += 1
+        self._record(self.durations, time.time() - start)
+
+    def run(self, callback):
+        """
+        Run callback(boundary) once per completed candle, forever.
+        """
+        while True:
+            self.run_once(callback)
+
+    def stats(self):
+        """
+        Returns:
+          A dictionary with the cycle count, overruns, skipped candles and jitter / duration percentiles
+          in milliseconds over the recent cycles.
+        """
+        result = {"cycles": self.cycles, "overruns": self.overruns, "skipped": self.skipped}
+        for name, values in (("jitter", self.jitter), ("duration", self.durations)):
+            if values:
+                ms = np.array(values) * 1000
+                result[f"{name}_mean_ms"] = float(ms.mean())
+                result[f"{name}_p95_ms"] = float(np.percentile(ms, 95))
+                result[f"{name}_max_ms"] = float(ms.max())
+        return result
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"Scheduler ({self.granularity}): {stats['cycles']} cycles, {stats['overruns']} overruns, "
+              f"{stats['skipped']} skipped candles")
+        if "jitter_mean_ms" in stats:
+            print(f"  jitter   mean {stats['jitter_mean_ms']:.1f} ms, p95 {stats['jitter_p95_ms']:.1f} ms, "
+                  f"max {stats['jitter_max_ms']:.1f} ms")
+            print(f"  duration mean {stats['duration_mean_ms']:.1f} ms, p95 {stats['duration_p95_ms']:.1f} ms, "
+                  f"max {stats['duration_max_ms']:.1f} ms")
+
+
+# Test section
+if __name__ == "__main__":
+    import random
+    scheduler = CandleScheduler("S5", slack=0.2)
+    for _ in range(4):
+        scheduler.run_once(lambda boundary: time.sleep(random.choice([0.1, 0.1, 6])))
+        scheduler.print_stats()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+"""
+state_channel.py - Trading State Channel Module
+
+This module passes state snapshots from the trading process (main.py) to the dashboard through a ring
+buffer in shared memory, so the dashboard shows exactly what the bot computed without requests of its own.
+
+A snapshot is a small JSON-serializable dictionary (equity, PnL, positions, signals, ...). StatePublisher
+writes each one into the next of a fixed number of slots; StateReader returns every snapshot published
+since its previous read, oldest first, so a reader polling less often than the writer publishes still gets
+the full history as long as it keeps up within one ring length.
+
+Layout of the shared memory block:
+  header: published count (uint64), number of slots (uint64), slot size (uint64), generation (uint64)
+  slot:   snapshot number (uint64), payload length (uint64), JSON payload
+Snapshot numbers start at 1. The writer clears a slot's number before rewriting the slot and sets it after
+the payload is complete; a reader copies the payload and accepts it only if the number was the expected one
+both before and after the copy (a sequence lock), so it never returns a half-written snapshot.
+
+The block outlives the trading process (it is not left to the resource tracker, which would remove it at
+exit), so a restarted publisher continues in the same block and running readers keep working. Each
+publisher writes a new generation into the header; before a block is removed (StatePublisher.close, or a
+restart with a different layout) its generation is set to CLOSED, and readers then attach to the block
+that now has the name. On Linux a reader also notices a block removed by other means by comparing its
+mapping with the file under /dev/shm.
+"""
+
+import json
+import os
+import struct
+import time
+from multiprocessing import shared_memory, resource_tracker
+
+DEFAULT_NAME = "oanda_trading_state"
+DEFAULT_SLOTS = 256
+DEFAULT_SLOT_SIZE = 64 * 1024
+
+HEADER = struct.Struct("<QQQQ")
+SLOT_HEADER = struct.Struct("<QQ")
+CLOSED = 0  # generation of a block that is about to be removed
+
+
+def _untrack(shm):
+    # Keep this process's resource tracker from removing the block when the process exits
+    resource_tracker.unregister(shm._name, "shared_memory")
+
+
+def _unlink(shm):
+    # SharedMemory.unlink unregisters the block from the resource tracker, so register it again first
+    resource_tracker.register(shm._name, "shared_memory")
+    shm.close()
+    shm.unlink()
+
+
+class StatePublisher:
+    def __init__(self, name=DEFAULT_NAME, slots=DEFAULT_SLOTS, slot_size=DEFAULT_SLOT_SIZE):
+        """
+        Create the shared memory block. A block left behind by a previous run is reused (and its snapshot
+        numbers continued) if it has the same layout, so running readers keep working; otherwise it is marked
+        CLOSED and replaced.
+
+        Parameters:
+          name: Name of the shared memory block; readers must use the same name.
+          slots: Number of snapshots kept in the ring.
+          slot_size: Bytes per slot, including the slot header; larger snapshots are not published.
+        """
+        self.slots = slots
+        self.slot_size = slot_size
+        size = HEADER.size + slots * slot_size
+        self.name = name
+        self.count = 0
+        self.generation = time.time_ns()
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            self.shm = shared_memory.SharedMemory(name=name)
+            old = HEADER.unpack_from(self.shm.buf, 0) if self.shm.size >= HEADER.size else None
+            if old is not None and old[1:3] == (slots, slot_size) and self.shm.size >= size:
+                self.count = old[0]
+            else:
+                if self.shm.size >= HEADER.size:
+                    HEADER.pack_into(self.shm.buf, 0, 0, 0, 0, CLOSED)
+                _unlink(self.shm)
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _untrack(self.shm)
+        HEADER.pack_into(self.shm.buf, 0, self.count, slots, slot_size, self.generation)
+
+    def publish(self, snapshot):
+        """
+        Write a snapshot into the next slot.
+
+        Returns:
+          The snapshot number, or None if the snapshot does not fit into a slot.
+        """
+        payload = json.dumps(snapshot, separators=(",", ":"), default=float).encode()
+        if len(payload) > self.slot_size - SLOT_HEADER.size:
+            print(f"State snapshot of {len(payload)} bytes does not fit into a {self.slot_size} byte slot")
+            return None
+        number = self.count + 1
+        offset = HEADER.size + ((number - 1) % self.slots) * self.slot_size
+        buf = self.shm.buf
+        SLOT_HEADER.pack_into(buf, offset, 0, 0)
+        start = offset + SLOT_HEADER.size
+        buf[start:start + len(payload)] = payload
+        SLOT_HEADER.pack_into(buf, offset, number, len(payload))
+        HEADER.pack_into(buf, 0, number, self.slots, self.slot_size, self.generation)
+        self.count = number
+        return number
+
+    def close(self):
+        """
+        Remove the block; attached readers move to the next publisher's block.
+        """
+        HEADER.pack_into(self.shm.buf, 0, self.count, self.slots, self.slot_size, CLOSED)
+        _unlink(self.shm)
+
+
+class StateReader:
+    def __init__(self, name=DEFAULT_NAME):
+        """
+        Parameters:
+          name: Name of the shared memory block created by the StatePublisher.
+        """
+        self.name = name
+        self.shm = None
+        self.last = 0  # number of the last snapshot returned
+
+    def _attach(self):
+        if self.shm is not None:
+            return True
+        try:
+            shm = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return False
+        if shm.size < HEADER.size or HEADER.unpack_from(shm.buf, 0)[3] == CLOSED:
+            # Being replaced by a new publisher; try again on the next read
+            shm.close()
+            return False
+        _untrack(shm)
+        self.shm = shm
+        return True
+
+    def _detach(self):
+        # The block was removed: read the block that now has the name from its first snapshot
+        self.shm.close()
+        self.shm = None
+        self.last = 0
+
+    def _replaced(self):
+        # True if the name now refers to another block than the mapped one (Linux, where blocks are files)
+        path = "/dev/shm" + self.shm._name
+        fd = getattr(self.shm, "_fd", -1)
+        if fd < 0 or not os.path.isdir("/dev/shm"):
+            return False
+        try:
+            return os.stat(path).st_ino != os.fstat(fd).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _header(self):
+        # The header of the current block, following the publisher to a new block; None without a publisher
+        if not self._attach():
+            return None
+        header = HEADER.unpack_from(self.shm.buf, 0)
+        if header[3] == CLOSED or (header[0] == self.last and self._replaced()):
+            self._detach()
+            if not self._attach():
+                return None
+            header = HEADER.unpack_from(self.shm.buf, 0)
+        return header
+
+    def _read_slot(self, number, slots, slot_size):
+        offset = HEADER.size + ((number - 1) % slots) * slot_size
+        buf = self.shm.buf
+        stored, length = SLOT_HEADER.unpack_from(buf, offset)
+        if stored != number:
+            return None
+        start = offset + SLOT_HEADER.size
+        payload = bytes(buf[start:start + length])
+        if SLOT_HEADER.unpack_from(buf, offset)[0] != number:
+            return None
+        return json.loads(payload)
+
+    def read_new(self):
+        """
+        Returns:
+          The snapshots published since the previous call, oldest first (at most one ring length; older
+          ones have been overwritten). An empty list if nothing new was published or there is no publisher.
+        """
+        header = self._header()
+        if header is None:
+            return []
+        count, slots, slot_size, _ = header
+        if count < self.last:
+            # The publisher was restarted
+            self.last = 0
+        first = max(self.last + 1, count - slots + 1, 1)
+        snapshots = []
+        for number in range(first, count + 1):
+            snapshot = self._read_slot(number, slots, slot_size)
+            if snapshot is not None:
+                snapshots.append(snapshot)
+        self.last = count
+        return snapshots
+
+    def latest(self):
+        """
+        Returns:
+          The most recent snapshot, or None if nothing has been published. Does not change what read_new returns.
+        """
+        header = self._header()
+        if header is None:
+            return None
+        count, slots, slot_size, _ = header
+        return self._read_slot(count, slots, slot_size) if count else None
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm = None
+
+
+# Test section
+if __name__ == "__main__":
+    import time
+
+    publisher = StatePublisher(name="state_channel_test", slots=8)
+    reader = StateReader(name="state_channel_test")
+    for i in range(5):
+        publisher.publish({"iteration": i, "equity": 100000 + i, "positions": []})
+    print("first read:", [s["iteration"] for s in reader.read_new()])
+    for i in range(5, 20):
+        publisher.publish({"iteration": i, "equity": 100000 + i, "positions": []})
+    print("after wrap:", [s["iteration"] for s in reader.read_new()])
+    start = time.perf_counter()
+    for i in range(10000):
+        publisher.publish({"iteration": i, "equity": 100000.0, "positions": [{"instrument": "EUR_USD"}] * 5})
+        reader.read_new()
+    print(f"publish + read: {(time.perf_counter() - start) / 10000 * 1e6:.1f} µs")
+    reader.close()
+    publisher.close()
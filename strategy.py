@@ -10,23 +10,109 @@ It supports multiple currency pairs. The signal generation logic for each pair i
   - Otherwise, return "HOLD".
 
 Additionally, this version returns the latest computed RSI along with the signal.
+By default the indicator window is maintained incrementally per instrument (see indicators.py), so each call
+only adds the candles completed since the previous call and computes the same values as the pandas pipeline
+without building a Series.
 """
 
 import numpy as np
 import os
 import time
 import pandas as pd
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from oandapyV20 import API
 from oandapyV20.endpoints.instruments import InstrumentsCandles
 from dotenv import load_dotenv
+from oanda_client import get_client
+from indicators import IncrementalIndicators, compute_indicator_matrix, stack_close_histories
+from price_stream import format_time
+from latency import recorder
 
 # Load environment variables from .env file
 load_dotenv()
 
+
+def compute_indicators(close_prices, stma_period, ltma_period, rsi_period):
+    """
+    Compute the strategy indicators from a full close history with pandas.
+
+    Parameters:
+      close_prices: A list of closing prices, oldest first.
+      stma_period: Period for the short-term SMA and EMA.
+      ltma_period: Period for the long-term SMA.
+      rsi_period: Period for the RSI.
+
+    Returns:
+      A dictionary with the keys short_sma, long_sma, short_ema, rsi and price.
+    """
+    price_series = pd.Series(close_prices)
+
+    # Calculate short-term SMA and long-term SMA
+    short_sma = price_series.rolling(window=stma_period).mean().iloc[-1]
+    long_sma = price_series.rolling(window=ltma_period).mean().iloc[-1]
+
+    # Calculate short-term EMA
+    short_ema = price_series.ewm(span=stma_period, adjust=False).mean().iloc[-1]
+
+    # Calculate RSI
+    delta = price_series.diff()
+    gain = delta.clip(lower=0)
+    loss = -delta.clip(upper=0)
+    avg_gain = gain.rolling(window=rsi_period, min_periods=rsi_period).mean().iloc[-1]
+    avg_loss = loss.rolling(window=rsi_period, min_periods=rsi_period).mean().iloc[-1]
+    if avg_loss == 0:
+        rsi = 100
+    else:
+        rs = avg_gain / avg_loss
+        rsi = 100 - (100 / (1 + rs))
+
+    return {
+        "short_sma": short_sma,
+        "long_sma": long_sma,
+        "short_ema": short_ema,
+        "rsi": rsi,
+        "price": price_series.iloc[-1],
+    }
+
+
+def generate_signal(short_sma, long_sma, short_ema, rsi, current_price):
+    """
+    Apply the strategy rules to the latest indicator values and return "BUY", "SELL" or "HOLD".
+    """
+    if (short_sma > long_sma) and (rsi < 70) and (current_price > short_ema):
+        return "BUY"
+    elif (short_sma < long_sma) or (rsi > 70):
+        return "SELL"
+    return "HOLD"
+
+
+def signal_masks(short_sma, long_sma, short_ema, rsi, current_price):
+    """
+    Element-wise strategy rules on arrays of indicator values.
+
+    Returns:
+      A tuple (buy, sell) of boolean arrays; sell is only True where buy is False.
+    """
+    buy = (short_sma > long_sma) & (rsi < 70) & (current_price > short_ema)
+    sell = ~buy & ((short_sma < long_sma) | (rsi > 70))
+    return buy, sell
+
+
+def generate_signals(short_sma, long_sma, short_ema, rsi, current_price):
+    """
+    Vectorized version of generate_signal: apply the strategy rules element-wise to arrays of indicator
+    values and return an array of "BUY", "SELL" or "HOLD".
+    """
+    buy, sell = signal_masks(short_sma, long_sma, short_ema, rsi, current_price)
+    return np.select([buy, sell], ["BUY", "SELL"], default="HOLD")
+
+
 class LiveStrategy:
     def __init__(self, instruments, lookback_count=200, stma_period=9, ltma_period=20, rsi_period=30, 
-                 granularity='H1', environment="practice"):
+                 granularity='H1', environment="practice", incremental=True, delta_fetch=False,
+                 max_workers=1, request_timeout=None, batched=False, streaming=False, candle_store=None):
         """
         Initialize live trading strategy parameters.
         
@@ -39,6 +125,22 @@ class LiveStrategy:
           rsi_period: Period for calculating RSI.
           granularity: The candlestick granularity (default is 'H1').
           environment: The trading environment, "practice" or "live".
+          incremental: If True, keep per-instrument indicator state and update it only with newly
+                       completed candles instead of recomputing everything with pandas on each call.
+          delta_fetch: If True, keep a ring buffer of the last 'lookback_count' completed candles per
+                       instrument and only request candles after the last stored one.
+          max_workers: Maximum number of candle requests in flight at once. With more than one worker the
+                       instruments are fetched concurrently from a thread pool.
+          request_timeout: Connect/read timeout in seconds for each candle request (None uses the shared
+                           client's default, see oanda_client.py).
+          batched: If True, stack the close histories of all instruments into one matrix and compute the
+                   indicators and signals for every instrument in a single vectorized pass.
+          streaming: If True, candles are pushed in by a PriceStreamFeed (see price_stream.py) through
+                     on_candle; the REST API is only used to fill the candle buffers on start and after
+                     a stream disconnect.
+          candle_store: Optional CandleStore (see candle_store.py). Every completed candle received from the
+                        REST API is saved to it, and with delta_fetch enabled the candle buffers are warm
+                        started from it, so a restart only requests the candles completed since the last run.
         """
         if isinstance(instruments, str):
             instruments = [instruments]
@@ -49,6 +151,14 @@ class LiveStrategy:
         self.rsi_period = rsi_period
         self.granularity = granularity
         self.environment = environment
+        self.incremental = incremental
+        self.indicators = {}
+        self.delta_fetch = delta_fetch
+        self.candle_buffers = {}
+        self.buffer_lock = threading.Lock()
+        self.batched = batched
+        self.streaming = streaming
+        self.candle_store = candle_store
         
         self.access_token = os.getenv('access_token')
         if not self.access_token:
@@ -57,24 +167,27 @@ class LiveStrategy:
         if not self.account_id:
             raise ValueError("account_id is not set. Please configure it in your environment variables.")
         
-        self.client = API(access_token=self.access_token, environment=self.environment)
+        # Shared client; the pool keeps at least one connection per worker open
+        self.client = get_client(self.environment, timeout=request_timeout, pool_size=max_workers)
+        
+        self.executor = None
+        if max_workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers=max_workers)
     
-    def fetch_candlestick_data(self, instrument):
+    def request_candles(self, instrument, params):
         """
-        Retrieve the most recent 'lookback_count' candlestick data for the specified currency pair from OANDA.
-        Uses the 'M' (mid) price data.
+        Request candlestick data (mid prices) for the specified currency pair from OANDA.
         
         Parameters:
           instrument: A single currency pair, e.g., 'EUR_USD'
+          params: Query parameters for the InstrumentsCandles endpoint (granularity and price are added).
           
         Returns:
-          A list of closing prices, or None if data retrieval fails.
+          A tuple (completed, received) where completed is a list of (time, close) tuples for completed
+          candles, oldest first, and received is the number of candles in the response.
+          Returns None if data retrieval fails.
         """
-        params = {
-            'count': self.lookback_count,
-            'granularity': self.granularity,
-            'price': 'M'
-        }
+        params = dict(params, granularity=self.granularity, price='M')
         candles_request = InstrumentsCandles(instrument=instrument, params=params)
         try:
             response = self.client.request(candles_request)
@@ -88,12 +201,179 @@ class LiveStrategy:
             return None
         
         # Process only completed candles
-        close_prices = [float(candle['mid']['c']) for candle in candles if candle.get('complete', False)]
-        if len(close_prices) < max(self.ltma_period, self.rsi_period):
+        completed = [(candle['time'], float(candle['mid']['c'])) for candle in candles if candle.get('complete', False)]
+        if self.candle_store is not None:
+            try:
+                self.candle_store.append(instrument, self.granularity, candles)
+            except Exception as e:
+                print(f"Error saving candles for {instrument}: {e}")
+        return completed, len(candles)
+
+    def load_stored_candles(self, instrument):
+        """
+        Read the newest 'lookback_count' candles of the instrument from the candle store.
+        
+        Returns:
+          A list of (time, close) tuples, oldest first, or an empty list if nothing is stored.
+        """
+        stored = self.candle_store.tail(instrument, self.granularity, self.lookback_count)
+        return [(format_time(t), close) for t, close in zip(stored['time'].tolist(), stored['c'].tolist())]
+
+    def fetch_new_candles(self, instrument, buffer):
+        """
+        Extend the instrument's candle ring buffer with the candles completed after its last stored candle.
+        The request starts at the last stored candle time ('from' is inclusive), so the first returned candle
+        must be the last stored one. If it is missing or different, or if the response is truncated at
+        'lookback_count' candles, there is a gap and the buffer is refilled with a full fetch.
+        
+        Returns:
+          True if the buffer is up to date, False if the caller should fall back to a full fetch.
+          Returns None if data retrieval fails.
+        """
+        last_time, last_close = buffer[-1]
+        result = self.request_candles(instrument, {'from': last_time, 'count': self.lookback_count})
+        if result is None:
+            return None
+        completed, received = result
+        if received >= self.lookback_count or not completed or completed[0] != (last_time, last_close):
+            print(f"Gap detected in candle history for {instrument}; refetching {self.lookback_count} candles")
+            return False
+        buffer.extend(completed[1:])
+        return True
+
+    def fetch_candles(self, instrument):
+        """
+        Retrieve the most recent 'lookback_count' candlestick data for the specified currency pair from OANDA.
+        Uses the 'M' (mid) price data. With delta_fetch enabled, only candles after the last buffered one
+        are requested once the buffer has been filled.
+        
+        Parameters:
+          instrument: A single currency pair, e.g., 'EUR_USD'
+          
+        Returns:
+          A list of (time, close) tuples for completed candles, oldest first, or None if data retrieval fails.
+        """
+        buffer = self.candle_buffers.get(instrument)
+        if self.streaming and buffer:
+            with self.buffer_lock:
+                return list(buffer)
+        if self.delta_fetch and not buffer and self.candle_store is not None:
+            stored = self.load_stored_candles(instrument)
+            if stored:
+                buffer = deque(stored, maxlen=self.lookback_count)
+                with self.buffer_lock:
+                    self.candle_buffers[instrument] = buffer
+        if self.delta_fetch and buffer:
+            up_to_date = self.fetch_new_candles(instrument, buffer)
+            if up_to_date is None:
+                return None
+            if up_to_date:
+                return list(buffer)
+        
+        result = self.request_candles(instrument, {'count': self.lookback_count})
+        if result is None:
+            return None
+        completed, _ = result
+        if len(completed) < max(self.ltma_period, self.rsi_period):
             print(f"Insufficient data for {instrument}; at least {max(self.ltma_period, self.rsi_period)} complete candles are required.")
             return None
         
-        return close_prices
+        if self.delta_fetch or self.streaming:
+            with self.buffer_lock:
+                self.candle_buffers[instrument] = deque(completed, maxlen=self.lookback_count)
+        return completed
+
+    def on_candle(self, instrument, candle):
+        """
+        Append a completed candle pushed by the streaming feed to the instrument's candle buffer.
+        Candles arriving before the buffer has been filled, or not newer than its last candle, are ignored.
+        
+        Parameters:
+          instrument: A single currency pair, e.g., 'EUR_USD'
+          candle: An OANDA-style candle dictionary with 'time' and 'mid' fields.
+        """
+        with self.buffer_lock:
+            buffer = self.candle_buffers.get(instrument)
+            if buffer and candle['time'] > buffer[-1][0]:
+                buffer.append((candle['time'], float(candle['mid']['c'])))
+
+    def reset_candle_buffers(self):
+        """
+        Drop all buffered candles so the next fetch refills them from the REST API.
+        """
+        with self.buffer_lock:
+            self.candle_buffers.clear()
+
+    def fetch_candlestick_data(self, instrument):
+        """
+        Retrieve the closing prices of the most recent completed candles for the specified currency pair.
+        
+        Parameters:
+          instrument: A single currency pair, e.g., 'EUR_USD'
+          
+        Returns:
+          A list of closing prices, or None if data retrieval fails.
+        """
+        candles = self.fetch_candles(instrument)
+        if candles is None:
+            return None
+        return [close for _, close in candles]
+
+    def fetch_all_candles(self):
+        """
+        Retrieve completed candles for every instrument, concurrently when a thread pool is configured.
+        
+        Returns:
+          A dictionary in the format {instrument: candles}, where candles is the result of fetch_candles.
+        """
+        if self.executor is None:
+            return {inst: self.timed_fetch_candles(inst) for inst in self.instruments}
+        futures = {inst: self.executor.submit(self.timed_fetch_candles, inst) for inst in self.instruments}
+        return {inst: future.result() for inst, future in futures.items()}
+
+    def timed_fetch_candles(self, instrument):
+        """
+        fetch_candles, recorded as a "candle_fetch" latency span (see latency.py).
+        """
+        with recorder.span("candle_fetch", instrument):
+            return self.fetch_candles(instrument)
+
+    def update_indicators(self, instrument, candles):
+        """
+        Feed completed candles into the instrument's incremental indicator state.
+        Only candles newer than the last one already applied are pushed; if the last applied candle is no
+        longer part of the fetched history (a gap), or the history got shorter, the state is rebuilt from the
+        fetched candles. The EMA stays anchored at the first fetched candle, like compute_indicators.
+        
+        Parameters:
+          instrument: A single currency pair, e.g., 'EUR_USD'
+          candles: A list of (time, close) tuples for completed candles, oldest first.
+          
+        Returns:
+          A dictionary with the keys short_sma, long_sma, short_ema, rsi and price.
+        """
+        state = self.indicators.get(instrument)
+        if state is None:
+            state = IncrementalIndicators(self.stma_period, self.ltma_period, self.rsi_period, self.lookback_count)
+            self.indicators[instrument] = state
+        
+        # Walk back from the newest candle until the last applied one is found
+        start = None
+        if state.last_time is not None:
+            for i in range(len(candles) - 1, -1, -1):
+                if candles[i][0] <= state.last_time:
+                    if candles[i][0] == state.last_time:
+                        start = i + 1
+                    break
+        
+        if start is None or len(candles) < state.window:
+            state.seed([close for _, close in candles], last_time=candles[-1][0])
+        else:
+            # A candle buffer that is still filling up keeps its first candle as the anchor
+            state.grow_window(len(candles))
+            for candle_time, close in candles[start:]:
+                state.update(close, candle_time)
+        return state.snapshot()
 
     def update_signal(self):
         """
@@ -106,49 +386,68 @@ class LiveStrategy:
           - Otherwise, "HOLD".
         
         Returns:
-          A dictionary in the format {instrument: {"signal": signal, "rsi": latest_rsi}}.
+          A dictionary in the format {instrument: {"signal": signal, "rsi": latest_rsi, "price": latest_close}}.
         """
+        candles_by_inst = self.fetch_all_candles()
+        if self.batched:
+            return self.update_signal_batched(candles_by_inst)
+        
         results = {}
         for inst in self.instruments:
-            close_prices = self.fetch_candlestick_data(inst)
-            if close_prices is None:
-                results[inst] = {"signal": None, "rsi": None}
+            candles = candles_by_inst.get(inst)
+            if candles is None:
+                results[inst] = {"signal": None, "rsi": None, "price": None}
                 continue
-            
-            price_series = pd.Series(close_prices)
-            
-            # Calculate short-term SMA and long-term SMA
-            short_sma = price_series.rolling(window=self.stma_period).mean().iloc[-1]
-            long_sma = price_series.rolling(window=self.ltma_period).mean().iloc[-1]
-            
-            # Calculate short-term EMA
-            short_ema = price_series.ewm(span=self.stma_period, adjust=False).mean().iloc[-1]
-            
-            # Calculate RSI
-            delta = price_series.diff()
-            gain = delta.clip(lower=0)
-            loss = -delta.clip(upper=0)
-            avg_gain = gain.rolling(window=self.rsi_period, min_periods=self.rsi_period).mean().iloc[-1]
-            avg_loss = loss.rolling(window=self.rsi_period, min_periods=self.rsi_period).mean().iloc[-1]
-            if avg_loss == 0:
-                rsi = 100
-            else:
-                rs = avg_gain / avg_loss
-                rsi = 100 - (100 / (1 + rs))
-            
-            current_price = price_series.iloc[-1]
-            
-            # Generate signal based on strategy
-            if (short_sma > long_sma) and (rsi < 70) and (current_price > short_ema):
-                signal = "BUY"
-            elif (short_sma < long_sma) or (rsi > 70):
-                signal = "SELL"
-            else:
-                signal = "HOLD"
+            with recorder.span("indicators", inst):
+                if self.incremental:
+                    values = self.update_indicators(inst, candles)
+                else:
+                    close_prices = [close for _, close in candles]
+                    values = compute_indicators(close_prices, self.stma_period, self.ltma_period, self.rsi_period)
+                
+                short_sma = values["short_sma"]
+                long_sma = values["long_sma"]
+                short_ema = values["short_ema"]
+                rsi = values["rsi"]
+                current_price = values["price"]
+                
+                # Generate signal based on strategy
+                signal = generate_signal(short_sma, long_sma, short_ema, rsi, current_price)
             
             print(f"[{datetime.now()}] {inst} - short_SMA: {short_sma:.5f}, long_SMA: {long_sma:.5f}, "
                   f"short_EMA: {short_ema:.5f}, RSI: {rsi:.2f}, Price: {current_price:.5f}, Signal: {signal}")
-            results[inst] = {"signal": signal, "rsi": rsi}
+            results[inst] = {"signal": signal, "rsi": rsi, "price": current_price}
+        
+        return results
+
+    def update_signal_batched(self, candles_by_inst):
+        """
+        Generate signals for all instruments at once from a (instruments x lookback_count) close matrix.
+        
+        Parameters:
+          candles_by_inst: A dictionary in the format {instrument: candles}, as returned by fetch_all_candles.
+        
+        Returns:
+          A dictionary in the format {instrument: {"signal": signal, "rsi": latest_rsi, "price": latest_close}}.
+        """
+        results = {inst: {"signal": None, "rsi": None, "price": None} for inst in self.instruments}
+        available = [inst for inst in self.instruments if candles_by_inst.get(inst) is not None]
+        if not available:
+            return results
+        
+        with recorder.span("indicators"):
+            price_matrix = stack_close_histories(
+                [[close for _, close in candles_by_inst[inst]] for inst in available], self.lookback_count)
+            values = compute_indicator_matrix(price_matrix, self.stma_period, self.ltma_period, self.rsi_period)
+            signals = generate_signals(values["short_sma"], values["long_sma"], values["short_ema"],
+                                       values["rsi"], values["price"])
+        
+        for row, inst in enumerate(available):
+            print(f"[{datetime.now()}] {inst} - short_SMA: {values['short_sma'][row]:.5f}, "
+                  f"long_SMA: {values['long_sma'][row]:.5f}, short_EMA: {values['short_ema'][row]:.5f}, "
+                  f"RSI: {values['rsi'][row]:.2f}, Price: {values['price'][row]:.5f}, Signal: {signals[row]}")
+            results[inst] = {"signal": str(signals[row]), "rsi": float(values["rsi"][row]),
+                             "price": float(values["price"][row])}
         
         return results
 
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""
+stream_server.py - Local Stand-in for the OANDA Pricing Stream
+
+This module serves a synthetic random-walk price stream with the same message format as OANDA's
+v3/accounts/{accountID}/pricing/stream endpoint (PRICE messages plus a HEARTBEAT every 5 seconds), so the
+streaming feed in price_stream.py can be run and tested without network access. It also answers
+v3/instruments/{instrument}/candles with a synthetic S5 backfill that ends at the current stream price,
+which is enough for LiveStrategy to warm up its candle buffers.
+
+Usage:
+  python stream_server.py --port 8081
+and create the oandapyV20 clients with environment="local" after calling register_environment().
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from oandapyV20.oandapyV20 import TRADING_ENVIRONMENTS
+from price_stream import GRANULARITY_SECONDS, format_time
+
+# Starting prices for the synthetic random walk
+BASE_PRICES = {
+    "EUR_USD": 1.08,
+    "GBP_USD": 1.27,
+    "USD_JPY": 150.0,
+    "AUD_USD": 0.66,
+    "USD_CAD": 1.36,
+}
+
+
+def register_environment(host, port, name="local"):
+    """
+    Make an oandapyV20 environment name point at a local server for both REST and streaming requests.
+    """
+    url = f"http://{host}:{port}"
+    TRADING_ENVIRONMENTS[name] = {"stream": url, "api": url}
+
+
+class StreamServer:
+    """
+    Threaded HTTP server producing synthetic OANDA pricing stream messages.
+    """
+
+    def __init__(self, instruments, host="127.0.0.1", port=8081, tick_interval=0.25, heartbeat_interval=5,
+                 volatility=0.0001, spread=0.0001, seed=None):
+        """
+        Parameters:
+          instruments: The currency pairs to quote.
+          host, port: Address to listen on.
+          tick_interval: Seconds between price updates per instrument.
+          heartbeat_interval: Seconds between HEARTBEAT messages.
+          volatility: Relative standard deviation of each random-walk step.
+          spread: Relative bid/ask spread.
+          seed: Optional random seed.
+        """
+        self.instruments = list(instruments)
+        self.tick_interval = tick_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.volatility = volatility
+        self.spread = spread
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.prices = {inst: BASE_PRICES.get(inst, 1.0) for inst in self.instruments}
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    def next_price(self, instrument):
+        with self.lock:
+            price = self.prices[instrument] * (1 + self.random.gauss(0, self.volatility))
+            self.prices[instrument] = price
+            return price
+
+    def price_message(self, instrument, timestamp):
+        mid = self.next_price(instrument)
+        half_spread = mid * self.spread / 2
+        return {
+            "type": "PRICE",
+            "instrument": instrument,
+            "time": format_time(timestamp),
+            "tradeable": True,
+            "bids": [{"price": f"{mid - half_spread:.5f}", "liquidity": 10000000}],
+            "asks": [{"price": f"{mid + half_spread:.5f}", "liquidity": 10000000}],
+            "closeoutBid": f"{mid - half_spread:.5f}",
+            "closeoutAsk": f"{mid + half_spread:.5f}",
+        }
+
+    def backfill_candles(self, instrument, granularity, count):
+        """
+        Synthetic completed candles ending at the current price, plus the incomplete current candle.
+        """
+        seconds = GRANULARITY_SECONDS.get(granularity, 5)
+        with self.lock:
+            price = self.prices.get(instrument, BASE_PRICES.get(instrument, 1.0))
+        current_start = int(time.time() // seconds) * seconds
+        closes = [price]
+        for _ in range(count - 1):
+            closes.append(closes[-1] / (1 + self.random.gauss(0, self.volatility)))
+        closes.reverse()
+        candles = []
+        for i, close in enumerate(closes):
+            start = current_start - (count - 1 - i) * seconds
+            mid = f"{close:.5f}"
+            candles.append({
+                "complete": start != current_start,
+                "volume": 1,
+                "time": format_time(start),
+                "mid": {"o": mid, "h": mid, "l": mid, "c": mid},
+            })
+        return candles
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.0"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, body):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                if url.path.endswith("/pricing/stream"):
+                    instruments = [inst for inst in query.get("instruments", "").split(",") if inst]
+                    self._stream(instruments or server.instruments)
+                    return
+                match = re.match(r"^/v3/instruments/([A-Z_]+)/candles$", url.path)
+                if match:
+                    granularity = query.get("granularity", "S5")
+                    count = int(query.get("count", 500))
+                    candles = server.backfill_candles(match.group(1), granularity, count)
+                    self._send_json(200, {"instrument": match.group(1), "granularity": granularity,
+                                          "candles": candles})
+                    return
+                self._send_json(404, {"errorMessage": f"Unsupported endpoint {url.path}"})
+
+            def _stream(self, instruments):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.end_headers()
+                last_heartbeat = time.time()
+                try:
+                    while True:
+                        now = time.time()
+                        for inst in instruments:
+                            line = json.dumps(server.price_message(inst, now)) + "\n"
+                            self.wfile.write(line.encode("utf-8"))
+                        if now - last_heartbeat >= server.heartbeat_interval:
+                            heartbeat = {"type": "HEARTBEAT", "time": format_time(now)}
+                            self.wfile.write((json.dumps(heartbeat) + "\n").encode("utf-8"))
+                            last_heartbeat = now
+                        self.wfile.flush()
+                        time.sleep(server.tick_interval)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client disconnected
+                    return
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the OANDA pricing stream")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--instruments", default=",".join(BASE_PRICES))
+    parser.add_argument("--tick-interval", type=float, default=0.25)
+    args = parser.parse_args()
+
+    stream_server = StreamServer(args.instruments.split(","), host=args.host, port=args.port,
+                                 tick_interval=args.tick_interval)
+    print(f"Serving synthetic pricing stream on http://{args.host}:{args.port}")
+    stream_server.server.serve_forever()
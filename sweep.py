@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+"""
+sweep.py - Parameter Sweep Module
+
+This module runs the strategy parameter grid through the vectorized backtester (backtest.py) on all CPU cores
+and writes the results in the layout of tuning_results.json:
+  - best_params / best_ratio: the combination with the highest Sharpe Ratio on the training period.
+  - all_results: one entry per combination with its training Sharpe Ratio.
+  - final_train_metrics / final_test_metrics: full metrics of the best combination on both periods.
+
+The price history is placed in shared memory once; worker processes map it without copying, so each task
+only carries its parameter dictionary. Each worker keeps an IndicatorCache, so an SMA, EMA or RSI period is
+computed once per worker and data range instead of once per combination. Results are printed and appended
+to a JSON-lines progress file as soon as each combination finishes.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+from backtest import VectorizedBacktester, generate_random_walk
+from candle_store import CandleStore, load_close_matrix
+from indicators import IndicatorCache
+
+# The grid behind tuning_results.json
+DEFAULT_PARAM_GRID = {
+    "short_window": [10, 20, 30],
+    "long_window": [20, 30, 40],
+    "stop_loss_percentage": [0.5, 1.0, 1.5],
+    "rsi_period": [10, 20, 30],
+    "rsi_weight_param": [0.5, 1.0, 1.5],
+}
+
+# Set in each worker process by _init_worker
+_worker_data = {}
+
+
+def build_grid(param_grid):
+    """
+    Expand a parameter grid into a list of parameter dictionaries, skipping combinations where the
+    short window is not shorter than the long window.
+    """
+    keys = list(param_grid)
+    combinations = []
+    for values in itertools.product(*(param_grid[key] for key in keys)):
+        params = dict(zip(keys, values))
+        if params["short_window"] < params["long_window"]:
+            combinations.append(params)
+    return combinations
+
+
+def make_backtester(instruments, params, **kwargs):
+    """
+    Create a VectorizedBacktester for one grid point (stop_loss_percentage is given in percent).
+    """
+    return VectorizedBacktester(
+        instruments,
+        stma_period=params["short_window"],
+        ltma_period=params["long_window"],
+        rsi_period=params["rsi_period"],
+        rsi_weight_param=params["rsi_weight_param"],
+        stop_loss_percentage=params["stop_loss_percentage"] / 100,
+        **kwargs
+    )
+
+
+def _init_worker(shm_name, shape, times_name, n_bars, instruments, train_bars, cache_bytes, backtest_kwargs):
+    closes_shm = shared_memory.SharedMemory(name=shm_name)
+    times_shm = shared_memory.SharedMemory(name=times_name)
+    _worker_data["shm"] = (closes_shm, times_shm)
+    _worker_data["closes"] = np.ndarray(shape, dtype=np.float64, buffer=closes_shm.buf)
+    _worker_data["times"] = np.ndarray((n_bars,), dtype=np.float64, buffer=times_shm.buf)
+    _worker_data["instruments"] = instruments
+    _worker_data["train_bars"] = train_bars
+    _worker_data["backtest_kwargs"] = backtest_kwargs
+    _worker_data["cache"] = IndicatorCache(cache_bytes)
+
+
+def evaluate_params(params):
+    """
+    Backtest one parameter combination on the training period of the shared price history.
+
+    Returns:
+      The all_results entry for this combination.
+    """
+    train_bars = _worker_data["train_bars"]
+    backtester = make_backtester(_worker_data["instruments"], params, **_worker_data["backtest_kwargs"])
+    result = backtester.run(_worker_data["closes"][:, :train_bars], _worker_data["times"][:train_bars],
+                            cache=_worker_data["cache"], data_key=("train", 0, train_bars))
+    return {
+        "short_window": params["short_window"],
+        "long_window": params["long_window"],
+        "stop_loss_percentage": params["stop_loss_percentage"],
+        "rsi_period": params["rsi_period"],
+        "Sharpe Ratio": result["metrics"]["Sharpe Ratio"],
+        "rsi_weight_param": params["rsi_weight_param"],
+    }
+
+
+def run_sweep(instruments, closes, times, param_grid=None, train_fraction=0.7, max_workers=None,
+              progress_path=None, cache_mb=512, **backtest_kwargs):
+    """
+    Evaluate every grid point in a process pool and pick the best combination by training Sharpe Ratio.
+
+    Parameters:
+      instruments: Currency pairs, in the row order of closes.
+      closes: A (instruments x bars) array of aligned closes.
+      times: 1-D array of bar times as Unix seconds.
+      param_grid: Parameter grid (defaults to DEFAULT_PARAM_GRID).
+      train_fraction: Fraction of the bars used for the training period; the rest is the test period.
+      max_workers: Number of worker processes (defaults to the number of CPUs).
+      progress_path: Optional JSON-lines file that receives each result as soon as it is available.
+      cache_mb: Memory cap of each worker's indicator cache, in megabytes.
+      backtest_kwargs: Extra VectorizedBacktester arguments (e.g. initial_balance, lookback_count).
+
+    Returns:
+      A dictionary in the tuning_results.json layout.
+    """
+    closes = np.ascontiguousarray(closes, dtype=np.float64)
+    times = np.ascontiguousarray(times, dtype=np.float64)
+    n_bars = closes.shape[1]
+    train_bars = int(n_bars * train_fraction)
+    combinations = build_grid(param_grid or DEFAULT_PARAM_GRID)
+
+    # Copy the history into shared memory once for all workers
+    closes_shm = shared_memory.SharedMemory(create=True, size=closes.nbytes)
+    times_shm = shared_memory.SharedMemory(create=True, size=times.nbytes)
+    progress_file = open(progress_path, "w") if progress_path else None
+    all_results = []
+    try:
+        np.ndarray(closes.shape, dtype=np.float64, buffer=closes_shm.buf)[:] = closes
+        np.ndarray(times.shape, dtype=np.float64, buffer=times_shm.buf)[:] = times
+        initargs = (closes_shm.name, closes.shape, times_shm.name, n_bars, list(instruments), train_bars,
+                    cache_mb * 1024 * 1024, backtest_kwargs)
+        start = time.time()
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=initargs) as pool:
+            futures = {pool.submit(evaluate_params, params): params for params in combinations}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error evaluating {futures[future]}: {e}")
+                    continue
+                all_results.append(result)
+                print(f"[{done}/{len(combinations)}] {time.time() - start:.1f}s {result}")
+                if progress_file:
+                    progress_file.write(json.dumps(result) + "\n")
+                    progress_file.flush()
+    finally:
+        if progress_file:
+            progress_file.close()
+        closes_shm.close()
+        closes_shm.unlink()
+        times_shm.close()
+        times_shm.unlink()
+
+    if not all_results:
+        raise ValueError("No parameter combination could be evaluated.")
+
+    # Keep the grid order in the output regardless of completion order
+    order = {tuple(params.values()): i for i, params in enumerate(combinations)}
+    all_results.sort(key=lambda r: order[tuple(r[key] for key in combinations[0])])
+    valid = [r for r in all_results if not np.isnan(r["Sharpe Ratio"])]
+    best = max(valid or all_results, key=lambda r: r["Sharpe Ratio"])
+
+    backtester = make_backtester(instruments, best, **backtest_kwargs)
+    train_metrics = backtester.run(closes[:, :train_bars], times[:train_bars])["metrics"]
+    test_metrics = backtester.run(closes[:, train_bars:], times[train_bars:])["metrics"]
+    return {
+        "best_params": dict(best),
+        "best_ratio": best["Sharpe Ratio"],
+        "all_results": all_results,
+        "final_train_metrics": train_metrics,
+        "final_test_metrics": test_metrics,
+    }
+
+
+def load_price_history(path):
+    """
+    Load an .npz file with 'closes' (instruments x bars), 'times' (Unix seconds) and 'instruments'.
+    """
+    data = np.load(path)
+    return [str(inst) for inst in data["instruments"]], data["closes"], data["times"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the strategy parameter sweep")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--data", help=".npz file with closes, times and instruments")
+    source.add_argument("--store", help="Candle store directory (see candle_store.py) to read the history from")
+    source.add_argument("--synthetic", action="store_true",
+                        help="Sweep a synthetic random walk (for testing the sweep itself, not for tuning)")
+    parser.add_argument("--instruments", default="EUR_USD,GBP_USD,USD_JPY,AUD_USD,USD_CAD",
+                        help="Comma-separated instruments to read from --store")
+    parser.add_argument("--granularity", default="S5", help="Candle granularity to read from --store")
+    parser.add_argument("--start", type=int, help="First bar time (Unix seconds) to read from --store")
+    parser.add_argument("--end", type=int, help="End bar time (Unix seconds, exclusive) to read from --store")
+    parser.add_argument("--synthetic-bars", type=int, default=200000,
+                        help="Number of synthetic S5 bars to use with --synthetic")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--train-fraction", type=float, default=0.7)
+    parser.add_argument("--output", default="sweep_results.json",
+                        help="Results file, in the layout of tuning_results.json")
+    parser.add_argument("--force", action="store_true", help="Overwrite --output if it already exists")
+    parser.add_argument("--progress", default="tuning_progress.jsonl")
+    parser.add_argument("--cache-mb", type=int, default=512, help="Indicator cache size per worker")
+    args = parser.parse_args()
+    if os.path.exists(args.output) and not args.force:
+        parser.error(f"{args.output} already exists; choose another --output or pass --force to overwrite it")
+
+    if args.data:
+        instruments, closes, times = load_price_history(args.data)
+    elif args.store:
+        instruments = args.instruments.split(",")
+        closes, times = load_close_matrix(CandleStore(args.store), instruments, args.granularity,
+                                          args.start, args.end)
+    else:  # --synthetic
+        instruments = ['EUR_USD', 'GBP_USD', 'USD_JPY', 'AUD_USD', 'USD_CAD']
+        closes = generate_random_walk(instruments, args.synthetic_bars)
+        times = np.arange(args.synthetic_bars) * 5.0
+
+    results = run_sweep(instruments, closes, times, train_fraction=args.train_fraction,
+                        max_workers=args.workers, progress_path=args.progress, cache_mb=args.cache_mb)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Best parameters: {results['best_params']}")
+    print(f"Results written to {args.output}")
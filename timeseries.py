@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+"""
+timeseries.py - Bounded Time Series Module
+
+This module stores long-running time series in constant memory. RingBuffer keeps the most recent points
+of a series (a time column plus value columns) in preallocated NumPy arrays, overwriting the oldest point
+when full. TieredSeries keeps the raw points in one ring buffer and rolls every point up into coarser tiers
+(by default 1 minute and 1 hour buckets, each a ring buffer of open / high / low / close per column), so
+recent history is available at full resolution and older history at bucket resolution, for any uptime.
+
+Windows are selected by binary search (np.searchsorted) on the time column, and TieredSeries.window
+answers from the finest tier that still covers the requested start. lttb reduces a window to a fixed
+number of points for plotting while keeping its visual shape.
+"""
+
+import numpy as np
+
+# (bucket seconds, capacity) per tier; None is the raw tier. Defaults: 1 day of 5 s points, 7 days of
+# minutes, 1 year of hours.
+DEFAULT_TIERS = ((None, 17280), (60, 10080), (3600, 8760))
+AGGREGATES = ("open", "high", "low", "close")
+
+
+class RingBuffer:
+    def __init__(self, capacity, width=1):
+        """
+        Parameters:
+          capacity: Maximum number of points kept.
+          width: Number of value columns per point.
+        """
+        self.capacity = capacity
+        self.times = np.empty(capacity, dtype=np.float64)
+        self.values = np.empty((capacity, width), dtype=np.float64)
+        self.start = 0  # index of the oldest point
+        self.size = 0
+        self.total = 0  # number of points ever appended
+
+    def __len__(self):
+        return self.size
+
+    def append(self, t, values):
+        """
+        Add a point; times must not decrease.
+        """
+        index = (self.start + self.size) % self.capacity
+        self.times[index] = t
+        self.values[index] = values
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+        self.total += 1
+
+    def extend(self, times, values):
+        """
+        Add many points at once, with the same result as appending them one by one.
+        """
+        n = len(times)
+        if n == 0:
+            return
+        if n >= self.capacity:
+            self.times[:] = times[-self.capacity:]
+            self.values[:] = values[-self.capacity:]
+            self.start = 0
+            self.size = self.capacity
+        else:
+            index = (self.start + self.size + np.arange(n)) % self.capacity
+            self.times[index] = times
+            self.values[index] = values
+            overflow = max(self.size + n - self.capacity, 0)
+            self.start = (self.start + overflow) % self.capacity
+            self.size = min(self.size + n, self.capacity)
+        self.total += n
+
+    @property
+    def wrapped(self):
+        """
+        True once points have been overwritten.
+        """
+        return self.total > self.capacity
+
+    def _segments(self):
+        # The stored points in time order as at most two contiguous slices
+        end = self.start + self.size
+        if end <= self.capacity:
+            return [slice(self.start, end)]
+        return [slice(self.start, self.capacity), slice(0, end - self.capacity)]
+
+    def first_time(self):
+        return self.times[self.start] if self.size else None
+
+    def last_time(self):
+        return self.times[(self.start + self.size - 1) % self.capacity] if self.size else None
+
+    def last(self):
+        """
+        Returns:
+          The values of the newest point, or None if empty.
+        """
+        return self.values[(self.start + self.size - 1) % self.capacity] if self.size else None
+
+    def window(self, start=None, end=None):
+        """
+        Points with start <= time <= end, found by binary search.
+
+        Returns:
+          A tuple (times, values) of new arrays in time order; values has one column per value column.
+        """
+        times, values = [], []
+        for segment in self._segments():
+            segment_times = self.times[segment]
+            lo = 0 if start is None else int(np.searchsorted(segment_times, start, side="left"))
+            hi = len(segment_times) if end is None else int(np.searchsorted(segment_times, end, side="right"))
+            if hi > lo:
+                times.append(segment_times[lo:hi])
+                values.append(self.values[segment][lo:hi])
+        if not times:
+            return np.empty(0), np.empty((0, self.values.shape[1]))
+        return np.concatenate(times), np.concatenate(values)
+
+    def arrays(self):
+        """
+        Returns:
+          All stored points as (times, values), oldest first.
+        """
+        return self.window()
+
+
+class TieredSeries:
+    def __init__(self, columns, tiers=DEFAULT_TIERS):
+        """
+        Parameters:
+          columns: Names of the value columns, e.g. ("return", "equity").
+          tiers: (bucket seconds, capacity) per tier, finest first; the first must be the raw tier (None).
+        """
+        self.columns = list(columns)
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        width = len(self.columns)
+        self.raw = RingBuffer(tiers[0][1], width)
+        # Coarse tiers store open, high, low and close of every column: [o0.., h0.., l0.., c0..]
+        self.tiers = [(seconds, RingBuffer(capacity, 4 * width)) for seconds, capacity in tiers[1:]]
+        self.pending = [None] * len(self.tiers)  # (bucket start, aggregates) of each tier's open bucket
+
+    def __len__(self):
+        return len(self.raw)
+
+    def append(self, t, values):
+        """
+        Add a point (one value per column) to the raw tier and to the open bucket of every coarse tier.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        width = len(self.columns)
+        self.raw.append(t, values)
+        for i, (seconds, ring) in enumerate(self.tiers):
+            bucket = (t // seconds) * seconds
+            pending = self.pending[i]
+            if pending is not None and pending[0] == bucket:
+                aggregates = pending[1]
+                np.maximum(aggregates[width:2 * width], values, out=aggregates[width:2 * width])
+                np.minimum(aggregates[2 * width:3 * width], values, out=aggregates[2 * width:3 * width])
+                aggregates[3 * width:] = values
+            else:
+                if pending is not None:
+                    ring.append(pending[0], pending[1])
+                self.pending[i] = (bucket, np.tile(values, 4))
+
+    def extend(self, times, values):
+        """
+        Add many points at once (e.g. history reloaded from disk), with the same result as appending them
+        one by one but with the buckets of each tier aggregated in bulk.
+
+        Parameters:
+          times: 1-D array of non-decreasing Unix times, not earlier than the newest point.
+          values: 2-D array with one column per value column.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64).reshape(len(times), len(self.columns))
+        if len(times) == 0:
+            return
+        width = len(self.columns)
+        self.raw.extend(times, values)
+        for i, (seconds, ring) in enumerate(self.tiers):
+            buckets = (times // seconds) * seconds
+            starts = np.concatenate(([0], np.flatnonzero(buckets[1:] != buckets[:-1]) + 1))
+            ends = np.append(starts[1:], len(times))
+            aggregates = np.concatenate([
+                values[starts],
+                np.maximum.reduceat(values, starts, axis=0),
+                np.minimum.reduceat(values, starts, axis=0),
+                values[ends - 1],
+            ], axis=1)
+            bucket_times = buckets[starts]
+            pending = self.pending[i]
+            if pending is not None and pending[0] == bucket_times[0]:
+                # The first bucket continues the open one: keep its open, combine high and low
+                first = aggregates[0]
+                first[:width] = pending[1][:width]
+                np.maximum(first[width:2 * width], pending[1][width:2 * width], out=first[width:2 * width])
+                np.minimum(first[2 * width:3 * width], pending[1][2 * width:3 * width],
+                           out=first[2 * width:3 * width])
+            elif pending is not None:
+                ring.append(pending[0], pending[1])
+            ring.extend(bucket_times[:-1], aggregates[:-1])
+            self.pending[i] = (bucket_times[-1], aggregates[-1].copy())
+
+    def last(self, column):
+        """
+        Returns:
+          The newest value of a column, or None if empty.
+        """
+        values = self.raw.last()
+        return None if values is None else float(values[self.index[column]])
+
+    def tier_for(self, start):
+        """
+        Returns:
+          The position of the finest tier holding everything since 'start' (0 is the raw tier), or the
+          coarsest tier if none reaches back that far.
+        """
+        rings = [self.raw] + [ring for _, ring in self.tiers]
+        for position, ring in enumerate(rings):
+            if start is None:
+                if not ring.wrapped:
+                    return position
+            elif not ring.wrapped or (ring.size and ring.first_time() <= start):
+                return position
+        return len(rings) - 1
+
+    def window(self, column, start=None, end=None, aggregate="close"):
+        """
+        Values of one column between start and end (Unix seconds; None is unbounded), from the finest tier
+        that covers the window. Coarse tiers return the chosen aggregate of each bucket at the bucket start
+        time, including the bucket still being filled.
+
+        Returns:
+          A tuple (times, values) of 1-D arrays in time order.
+        """
+        position = self.tier_for(start)
+        column_index = self.index[column]
+        if position == 0:
+            times, values = self.raw.window(start, end)
+            return times, values[:, column_index]
+        seconds, ring = self.tiers[position - 1]
+        offset = AGGREGATES.index(aggregate) * len(self.columns) + column_index
+        # Buckets starting before 'start' still contain points inside the window
+        bucket_start = None if start is None else (start // seconds) * seconds
+        times, values = ring.window(bucket_start, end)
+        values = values[:, offset]
+        pending = self.pending[position - 1]
+        if pending is not None and (end is None or pending[0] <= end) and (
+                bucket_start is None or pending[0] >= bucket_start):
+            times = np.append(times, pending[0])
+            values = np.append(values, pending[1][offset])
+        return times, values
+
+    def nbytes(self):
+        return self.raw.times.nbytes + self.raw.values.nbytes + sum(
+            ring.times.nbytes + ring.values.nbytes for _, ring in self.tiers)
+
+
+def lttb(times, values, threshold):
+    """
+    Downsample a series to 'threshold' points with Largest-Triangle-Three-Buckets: the first and last points
+    are kept, the points in between are split into threshold - 2 buckets, and from each bucket the point
+    forming the largest triangle with the previously selected point and the average of the next bucket is
+    kept. Peaks and troughs survive, unlike with decimation.
+
+    Parameters:
+      times: 1-D array of increasing x values.
+      values: 1-D array of y values.
+      threshold: Number of points to return.
+
+    Returns:
+      A tuple (times, values) with at most 'threshold' points (the input itself if it is not longer).
+    """
+    n = len(times)
+    if threshold >= n or threshold < 3:
+        return times, values
+    x = np.asarray(times, dtype=np.float64)
+    y = np.asarray(values, dtype=np.float64)
+    # Bucket boundaries over the points between the first and the last one
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    # Average point of the bucket after each bucket (the last point for the final bucket)
+    next_edges = np.append(edges[1:], n)
+    cum_x = np.concatenate(([0.0], np.cumsum(x)))
+    cum_y = np.concatenate(([0.0], np.cumsum(y)))
+    counts = next_edges[1:] - edges[1:]
+    avg_x = ((cum_x[next_edges[1:]] - cum_x[edges[1:]]) / counts).tolist()
+    avg_y = ((cum_y[next_edges[1:]] - cum_y[edges[1:]]) / counts).tolist()
+    edges = edges.tolist()
+
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Twice the triangle area for every candidate in the bucket
+        areas = np.abs((x[a] - avg_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[i] - y[a]))
+        a = lo + int(areas.argmax())
+        selected.append(a)
+    selected.append(n - 1)
+    return x[selected], y[selected]
+
+
+# Test section
+if __name__ == "__main__":
+    import time
+
+    series = TieredSeries(("return", "equity"))
+    start = time.time() - 30 * 24 * 3600
+    t0 = time.perf_counter()
+    for i in range(30 * 24 * 720):  # 30 days of 5 s points
+        series.append(start + 5 * i, (i * 1e-4, 100000 + i))
+    elapsed = time.perf_counter() - t0
+    print(f"{series.raw.total} points appended in {elapsed:.1f} s, {series.nbytes() / 1e6:.1f} MB kept")
+    now = start + 5 * (30 * 24 * 720 - 1)
+    for span in (120, 3600, 86400, 7 * 86400, 30 * 86400):
+        t0 = time.perf_counter()
+        times, values = series.window("equity", now - span)
+        print(f"last {span:>8} s: tier {series.tier_for(now - span)}, {len(times):>6} points, "
+              f"{(time.perf_counter() - t0) * 1e6:.0f} µs")